@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from api.models import Route, Train
+        from api.planner import on_route_changed, on_train_changed
+        from api.search import on_route_saved
+
+        post_save.connect(on_route_saved, sender=Route, dispatch_uid='index_route_stops')
+        post_save.connect(on_route_changed, sender=Route, dispatch_uid='plan_route_saved')
+        post_delete.connect(on_route_changed, sender=Route, dispatch_uid='plan_route_deleted')
+        post_save.connect(on_train_changed, sender=Train, dispatch_uid='plan_train_saved')
+        post_delete.connect(on_train_changed, sender=Train, dispatch_uid='plan_train_deleted')
@@ -0,0 +1,109 @@
+import json
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.utils.dateparse import parse_date
+from api.booking import book
+from api.idempotency import async_idempotent
+from api.models import User, Train, TrainRun, Booking, SegmentMap
+from api.segments import InvalidJourney
+from api.serializer import BookingSerializer
+from api.services import BookingService, NoTicketsAvailable
+
+# Async counterparts of the availability, booking and cancellation endpoints.
+# Reads go through Django's async ORM so an ASGI worker keeps thousands of
+# availability polls in flight without holding a thread each. Django has no
+# async transactions yet, so the locked BookingService paths run through
+# sync_to_async and only occupy a thread while they hold the train lock.
+
+
+def csrf_exempt(view):
+    # django.views.decorators.csrf.csrf_exempt only keeps views async from Django 5.0
+    view.csrf_exempt = True
+    return view
+
+
+def error(detail, status):
+    return JsonResponse({"detail": detail}, status=status)
+
+
+def journey_date(value):
+    try:
+        return parse_date(value)
+    except (TypeError, ValueError):
+        return None
+
+
+async def train_availability(request, pk):
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    try:
+        train = await Train.objects.select_related("route").aget(pk=pk)
+    except Train.DoesNotExist:
+        return error("Not found.", 404)
+
+    bitmaps = (
+        await SegmentMap.objects.filter(train=train)
+        .values_list("bitmaps", flat=True)
+        .afirst()
+    )
+    try:
+        data = BookingService.availability(
+            train, bitmaps or {}, request.GET.get("from"), request.GET.get("to")
+        )
+    except InvalidJourney as e:
+        return error(str(e), 400)
+    return JsonResponse(data)
+
+
+@csrf_exempt
+@async_idempotent
+async def create_booking(request):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        return error("Request body must be a JSON object.", 400)
+    try:
+        user = await User.objects.aget(pk=payload.get("user"))
+        train = await Train.objects.aget(pk=payload.get("train"))
+    except (ValueError, ValidationError, User.DoesNotExist, Train.DoesNotExist):
+        return error("A valid user and train are required.", 400)
+
+    try:
+        if payload.get("journey_date"):
+            date = journey_date(payload["journey_date"])
+            if date is None:
+                return error("journey_date must be a valid YYYY-MM-DD date.", 400)
+            booking = await sync_to_async(BookingService.create_run_booking)(
+                user, train, date
+            )
+        else:
+            booking = await book(
+                user,
+                train,
+                payload.get("boarding_station"),
+                payload.get("alighting_station"),
+            )
+    except (NoTicketsAvailable, InvalidJourney) as e:
+        return error(str(e), 400)
+    except TrainRun.DoesNotExist:
+        return error("Train does not run on this date.", 400)
+    return JsonResponse(BookingSerializer(booking).data, status=201)
+
+
+@csrf_exempt
+@async_idempotent
+async def cancel_booking(request, pk):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    try:
+        booking = await Booking.objects.aget(pk=pk)
+    except Booking.DoesNotExist:
+        return error("Not found.", 404)
+
+    await sync_to_async(BookingService.cancel_booking)(booking)
+    return HttpResponse(status=204)
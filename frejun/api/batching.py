@@ -0,0 +1,116 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from django.conf import settings
+from django.db import close_old_connections, connections
+from .services import BookingService
+
+logger = logging.getLogger(__name__)
+
+# Seconds an idle per-train worker waits for work before exiting
+WORKER_IDLE_TIMEOUT = 1.0
+
+
+class BookingRequest:
+    def __init__(self, user, train):
+        self.user = user
+        self.train = train
+        self.future = Future()
+
+
+class BookingBatcher:
+    """Queues booking requests per train and commits them in micro-batches.
+
+    A worker thread per busy train drains its queue: a batch closes once it
+    holds max_batch requests or max_wait seconds after its first request, and
+    is booked under one train lock and one commit. Requests are allocated in
+    arrival order and each caller gets its own Booking or exception back.
+    Larger batches and longer waits trade per-request latency for throughput.
+    """
+
+    def __init__(self, max_batch=None, max_wait=None):
+        self.max_batch = max_batch or settings.BOOKING_BATCH_MAX_SIZE
+        self.max_wait = (
+            settings.BOOKING_BATCH_MAX_WAIT if max_wait is None else max_wait
+        )
+        self._queues = {}
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    def submit(self, user, train):
+        """Queue a booking request and return a Future for its Booking"""
+        request = BookingRequest(user, train)
+        with self._lock:
+            requests = self._queues.get(train.id)
+            if requests is None:
+                requests = self._queues[train.id] = queue.Queue()
+            requests.put(request)
+            if train.id not in self._workers:
+                worker = threading.Thread(
+                    target=self._run,
+                    args=(train.id,),
+                    name=f"booking-batch-{train.id}",
+                    daemon=True,
+                )
+                self._workers[train.id] = worker
+                worker.start()
+        return request.future
+
+    def book(self, user, train, timeout=None):
+        """Queue a booking request and wait for its Booking"""
+        return self.submit(user, train).result(timeout)
+
+    def _next_batch(self, requests):
+        try:
+            batch = [requests.get(timeout=WORKER_IDLE_TIMEOUT)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, train_id):
+        requests = self._queues[train_id]
+        while True:
+            batch = self._next_batch(requests)
+            if not batch:
+                with self._lock:
+                    # Exit only if nothing arrived while we were timing out
+                    if requests.empty():
+                        del self._workers[train_id]
+                        del self._queues[train_id]
+                        connections.close_all()
+                        return
+                continue
+            self.process(batch)
+            close_old_connections()
+
+    def process(self, batch):
+        """Book a batch of requests for one train and resolve their futures"""
+        try:
+            results = BookingService.create_booking_batch(
+                [request.user for request in batch], batch[0].train
+            )
+        except Exception as e:
+            logger.exception("Booking batch for train %s failed", batch[0].train.id)
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        for request, result in zip(batch, results):
+            if isinstance(result, Exception):
+                request.future.set_exception(result)
+            else:
+                request.future.set_result(result)
+
+
+batcher = BookingBatcher()
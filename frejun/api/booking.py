@@ -0,0 +1,41 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from .batching import batcher
+from .services import BookingService
+
+BOOKING_MODES = ("locking", "batched", "optimistic")
+
+
+def booking_mode():
+    mode = settings.BOOKING_MODE
+    if mode not in BOOKING_MODES:
+        raise ImproperlyConfigured(
+            f"BOOKING_MODE must be one of {', '.join(BOOKING_MODES)}, not {mode!r}"
+        )
+    return mode
+
+
+async def book(user, train, boarding_station=None, alighting_station=None):
+    """Book user on train the way BOOKING_MODE says.
+
+    "batched" hands whole-route bookings to the train's group-commit worker
+    and awaits the result without holding a thread; "optimistic" claims them
+    with guarded UPDATEs (create_booking_optimistic). Partial journeys share
+    berths by segment, which needs the train's row lock, so they, and
+    "locking", book under that lock. Every mode's writes are guarded or
+    locked, so processes running different modes can share a train.
+    """
+    mode = booking_mode()
+    if boarding_station or alighting_station:
+        mode = "locking"
+    if mode == "batched":
+        return await asyncio.wrap_future(batcher.submit(user, train))
+    if mode == "optimistic":
+        return await sync_to_async(BookingService.create_booking_optimistic)(
+            user, train
+        )
+    return await sync_to_async(BookingService.create_booking)(
+        user, train, boarding_station, alighting_station
+    )
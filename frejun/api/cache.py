@@ -0,0 +1,41 @@
+from django.core.cache import caches
+
+# Train availability snapshots are keyed by the train row's updated_at, which
+# every write to the row moves forward. Readers take it from the database in
+# the query that finds the trains, so a snapshot is only ever served for the
+# row version it was built from, in every process and with any backend; a
+# per-process cache only costs extra misses, never stale reads.
+CACHE_ALIAS = "availability"
+
+
+def availability_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _snapshot_key(train_id, version):
+    return f"train:{train_id}:{version.isoformat()}"
+
+
+def get_snapshots(versions, load):
+    """Availability snapshots for the trains in versions, in order, read through the cache.
+
+    versions maps train ids to their current updated_at. load(missing_ids)
+    returns {train_id: snapshot} for the trains not cached; trains it leaves
+    out are omitted from the result.
+    """
+    cache = availability_cache()
+    keys = {
+        train_id: _snapshot_key(train_id, version)
+        for train_id, version in versions.items()
+    }
+    snapshots = cache.get_many(keys.values())
+
+    missing = [train_id for train_id, key in keys.items() if key not in snapshots]
+    if missing:
+        # A train written since its version was read is stored newer than
+        # its key says, which only ever errs on the side of fresh
+        loaded = load(missing)
+        cache.set_many({keys[train_id]: data for train_id, data in loaded.items()})
+        snapshots.update({keys[train_id]: data for train_id, data in loaded.items()})
+
+    return [snapshots[key] for key in keys.values() if key in snapshots]
@@ -11,4 +11,17 @@ class BerthType(Enum):
     MIDDLE = "MIDDLE"
     UPPER = "UPPER"
     SIDE_LOWER = "SIDE_LOWER"
+    SIDE_UPPER = "SIDE_UPPER"
     NO_BERTH = "NO_BERTH"
+
+class BookingEventType(Enum):
+    BOOKED = "BOOKED"
+    CANCELLED = "CANCELLED"
+    # A place held by a PromotionTask goes back on the counters
+    PLACE_RELEASED = "PLACE_RELEASED"
+    PROMOTED = "PROMOTED"
+    BERTH_ASSIGNED = "BERTH_ASSIGNED"
+    # A SeatHold takes a place off the counters, and gives it back when it
+    # expires or becomes a booking
+    HELD = "HELD"
+    HOLD_RELEASED = "HOLD_RELEASED"
@@ -0,0 +1,114 @@
+from .enum import BookingEventType
+from .models import BookingEvent
+
+# Every write path in BookingService logs what it did here, in the same
+# transaction and under the same train (or run) lock as the change itself.
+# Events are numbered from the inventory's event_sequence, which the caller
+# saves along with its counters, so a train's log never has gaps.
+
+
+def event(event_type, booking, **fields):
+    """Unsaved event about booking, for the train or run the booking is on"""
+    return BookingEvent(
+        train_id=booking.train_id,
+        run_id=booking.run_id,
+        event_type=event_type.value,
+        booking_id=booking.id,
+        user_id=booking.user_id,
+        booking_status=booking.booking_status,
+        berth_type=booking.berth_type,
+        **fields,
+    )
+
+
+def berth_assigned(booking):
+    return event(
+        BookingEventType.BERTH_ASSIGNED,
+        booking,
+        coach=booking.coach,
+        berth_number=booking.berth_number,
+    )
+
+
+def booked(booking, shared_berth=False):
+    """Events for a new booking: BOOKED, then BERTH_ASSIGNED if it got a seat"""
+    events = [
+        event(
+            BookingEventType.BOOKED,
+            booking,
+            shared_berth=shared_berth,
+            amount=booking.total_amount,
+        )
+    ]
+    if booking.berth_number:
+        events.append(berth_assigned(booking))
+    return events
+
+
+def cancelled(booking):
+    return event(
+        BookingEventType.CANCELLED,
+        booking,
+        coach=booking.coach,
+        berth_number=booking.berth_number,
+        amount=booking.total_amount,
+    )
+
+
+def promoted(booking, previous_status, previous_berth_type):
+    """Events for a booking moved up a tier, with its new seat if it got one"""
+    events = [
+        event(
+            BookingEventType.PROMOTED,
+            booking,
+            previous_status=previous_status,
+            previous_berth_type=previous_berth_type,
+        )
+    ]
+    if booking.berth_number:
+        events.append(berth_assigned(booking))
+    return events
+
+
+def place_released(task):
+    return BookingEvent(
+        train_id=task.train_id,
+        run_id=task.run_id,
+        event_type=BookingEventType.PLACE_RELEASED.value,
+        booking_status=task.booking_status,
+        berth_type=task.berth_type,
+    )
+
+
+def hold_event(event_type, hold):
+    return BookingEvent(
+        train_id=hold.train_id,
+        event_type=event_type.value,
+        user_id=hold.user_id,
+        booking_status=hold.booking_status,
+        berth_type=hold.berth_type,
+        coach=hold.coach,
+        berth_number=hold.berth_number,
+    )
+
+
+def held(hold):
+    return hold_event(BookingEventType.HELD, hold)
+
+
+def hold_released(hold):
+    return hold_event(BookingEventType.HOLD_RELEASED, hold)
+
+
+def append(events, last_sequence):
+    """Number events after last_sequence and insert them, returning the new last"""
+    for offset, booking_event in enumerate(events, start=1):
+        booking_event.sequence = last_sequence + offset
+    BookingEvent.objects.bulk_create(events)
+    return last_sequence + len(events)
+
+
+def record(inventory, events):
+    """Log events against a locked Train or TrainRun; the caller saves inventory"""
+    if events:
+        inventory.event_sequence = append(events, inventory.event_sequence)
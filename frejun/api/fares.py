@@ -0,0 +1,115 @@
+from bisect import bisect_left
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+from .enum import BookingStatus, BerthType
+
+# Fare for journeys up to each distance in km; past the last slab every
+# extra km costs PER_KM_BEYOND
+DISTANCE_SLABS = (
+    (100, Decimal("150")),
+    (250, Decimal("350")),
+    (500, Decimal("650")),
+    (1000, Decimal("1000")),
+    (1500, Decimal("1400")),
+    (2000, Decimal("1750")),
+)
+PER_KM_BEYOND = Decimal("0.80")
+
+BERTH_FACTORS = {
+    BerthType.LOWER: Decimal("1.10"),
+    BerthType.MIDDLE: Decimal("1.00"),
+    BerthType.UPPER: Decimal("1.00"),
+    BerthType.SIDE_LOWER: Decimal("0.90"),
+    BerthType.SIDE_UPPER: Decimal("0.90"),
+    # Children under 5 ride free by age; the berth type alone waives nothing
+    BerthType.NO_BERTH: Decimal("1.00"),
+    # Quotes made before a berth is picked
+    None: Decimal("1.00"),
+}
+
+STATUS_FACTORS = {
+    BookingStatus.CONFIRMED: Decimal("1.00"),
+    BookingStatus.RAC: Decimal("0.90"),
+    BookingStatus.WAITING_LIST: Decimal("0.90"),
+}
+
+# (age below which the factor applies, factor), youngest first; the last
+# entry covers everyone older
+AGE_CONCESSIONS = (
+    (5, Decimal("0")),
+    (12, Decimal("0.50")),
+    (60, Decimal("1.00")),
+    (None, Decimal("0.60")),
+)
+MAX_AGE = 130
+
+ONE_RUPEE = Decimal("1")
+
+
+def _age_factor(age):
+    for below, factor in AGE_CONCESSIONS:
+        if below is None or age < below:
+            return factor
+
+
+# Precomputed so quoting a passenger is a couple of lookups and one multiply
+AGE_FACTORS = tuple(_age_factor(age) for age in range(MAX_AGE + 1))
+FACTORS = {
+    (booking_status, berth_type): status_factor * berth_factor
+    for booking_status, status_factor in STATUS_FACTORS.items()
+    for berth_type, berth_factor in BERTH_FACTORS.items()
+}
+_SLAB_LIMITS = tuple(limit for limit, _ in DISTANCE_SLABS)
+
+
+@lru_cache(maxsize=4096)
+def distance_fare(distance):
+    """Base fare for a journey of distance km"""
+    index = bisect_left(_SLAB_LIMITS, distance)
+    if index < len(DISTANCE_SLABS):
+        return DISTANCE_SLABS[index][1]
+    limit, fare = DISTANCE_SLABS[-1]
+    return fare + (Decimal(distance) - limit) * PER_KM_BEYOND
+
+
+def journey_distance(route, mask=None):
+    """km travelled on route over the segments in mask, or the whole route.
+
+    Routes only record their total distance, so a partial journey is
+    charged its share of the route's segments.
+    """
+    segments = len(route.stations()) - 1
+    if mask is None or segments < 1:
+        return route.distance
+    return round(route.distance * bin(mask).count("1") / segments)
+
+
+def fare(
+    distance,
+    age,
+    booking_status=BookingStatus.CONFIRMED,
+    berth_type=None,
+):
+    """Fare in whole rupees for one passenger"""
+    amount = (
+        distance_fare(distance)
+        * AGE_FACTORS[min(age, MAX_AGE)]
+        * FACTORS[booking_status, berth_type]
+    )
+    return amount.quantize(ONE_RUPEE, rounding=ROUND_HALF_UP)
+
+
+def quote(distances, ages, booking_status=BookingStatus.CONFIRMED, berth_type=None):
+    """Fares for every passenger age on every journey distance in one pass.
+
+    Returns one list of fares per distance, in the order ages were given.
+    """
+    factor = FACTORS[booking_status, berth_type]
+    passengers = [AGE_FACTORS[min(age, MAX_AGE)] * factor for age in ages]
+    return [
+        [
+            (base * passenger).quantize(ONE_RUPEE, rounding=ROUND_HALF_UP)
+            for passenger in passengers
+        ]
+        for base in map(distance_fare, distances)
+    ]
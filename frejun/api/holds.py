@@ -0,0 +1,64 @@
+import logging
+import threading
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .services import BookingService
+
+logger = logging.getLogger(__name__)
+
+
+class HoldExpiryScheduler:
+    """Releases seat holds as they expire, driven by the indexed expires_at column.
+
+    Every poll_interval seconds the thread reads the trains with holds due
+    from the expires_at index and expires each train's holds in one
+    transaction. A pass costs an index range scan over the holds due, however
+    many live holds there are, and sees holds placed by every process alike.
+    """
+
+    def __init__(self, poll_interval=None):
+        self.poll_interval = poll_interval or settings.SEAT_HOLD_POLL_INTERVAL
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def run_due(self, now=None):
+        """Expire the holds of every train with holds due by now, returning how many"""
+        now = now or timezone.now()
+        expired = 0
+        for train_id in list(BookingService.due_holds(now)):
+            try:
+                expired += BookingService.expire_holds(train_id, now)
+            except Exception:
+                # The holds stay due and are retried on the next pass
+                logger.exception("Expiring holds of train %s failed", train_id)
+        return expired
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.run_due()
+            except Exception:
+                # Such as the database going away; the holds are still due
+                logger.exception("Expiring holds failed")
+            finally:
+                close_old_connections()
+            self._stopped.wait(self.poll_interval)
+
+    def start(self):
+        """Start expiring holds in a background thread"""
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="hold-expiry", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+
+scheduler = HoldExpiryScheduler()
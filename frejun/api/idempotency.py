@@ -0,0 +1,150 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+# Retried POSTs carrying the same Idempotency-Key get the first response back
+# instead of booking or cancelling again. The key's row is inserted before the
+# request runs and its unique constraint decides which of several concurrent
+# duplicates goes ahead; the others get a 409 until the response is saved.
+# Until then the row only lives for IDEMPOTENCY_KEY_LEASE seconds, so a key
+# whose request died with its worker is free again once that runs out.
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def fingerprint(request):
+    """Hash of what a request asks for, so a key can't be reused for another one"""
+    digest = hashlib.sha256()
+    for part in (request.method, request.path, request.body):
+        digest.update(part if isinstance(part, bytes) else part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def claim(key, request):
+    """Reserve key for request.
+
+    Returns (record, None) when the caller should run the request and then
+    save or release record, or (None, (status_code, data)) with the response
+    to send instead.
+    """
+    digest = fingerprint(request)
+    now = timezone.now()
+    record = IdempotencyKey.objects.filter(key=key).first()
+    if record is not None and record.expires_at <= now:
+        # An expired key is free again
+        record.delete()
+        record = None
+
+    if record is None:
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    key=key,
+                    fingerprint=digest,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_LEASE),
+                )
+            return record, None
+        except IntegrityError:
+            # A concurrent duplicate inserted it first
+            record = IdempotencyKey.objects.filter(key=key).first()
+            if record is None:
+                return claim(key, request)
+
+    if record.fingerprint != digest:
+        return None, (
+            422,
+            {"detail": f"{HEADER} was already used for a different request."},
+        )
+    if record.status_code is None:
+        return None, (
+            409,
+            {"detail": f"A request with this {HEADER} is still in progress."},
+        )
+    return None, (record.status_code, record.response)
+
+
+def save(record, status_code, data):
+    record.status_code = status_code
+    record.response = data
+    record.expires_at = timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    record.save(update_fields=["status_code", "response", "expires_at", "updated_at"])
+
+
+def release(record):
+    """Forget a key whose request failed so a retry can run it again"""
+    record.delete()
+
+
+def finish(record, status_code, data):
+    # Server errors are not final, the client should be able to retry them
+    if status_code >= 500:
+        release(record)
+    else:
+        save(record, status_code, data)
+
+
+def replayed(response):
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def idempotent(method):
+    """Make an APIView POST handler honour the Idempotency-Key header"""
+
+    @wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return method(view, request, *args, **kwargs)
+
+        record, outcome = claim(key, request)
+        if outcome:
+            status_code, data = outcome
+            return replayed(Response(data, status=status_code))
+
+        try:
+            response = method(view, request, *args, **kwargs)
+        except BaseException:
+            release(record)
+            raise
+        finish(record, response.status_code, response.data)
+        return response
+
+    return wrapper
+
+
+def async_idempotent(view):
+    """Make a native async JSON view honour the Idempotency-Key header"""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or request.method != "POST":
+            return await view(request, *args, **kwargs)
+
+        record, outcome = await sync_to_async(claim)(key, request)
+        if outcome:
+            status_code, data = outcome
+            if data is None:
+                return replayed(HttpResponse(status=status_code))
+            return replayed(JsonResponse(data, status=status_code, safe=False))
+
+        try:
+            response = await view(request, *args, **kwargs)
+        except BaseException:
+            await sync_to_async(release)(record)
+            raise
+        data = json.loads(response.content) if response.content else None
+        await sync_to_async(finish)(record, response.status_code, data)
+        return response
+
+    return wrapper
@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from api.models import (
+    TrainRun,
+    Booking,
+    PromotionTask,
+    Inventory,
+    ArchivedTrainRun,
+    ArchivedBooking,
+)
+
+INVENTORY_FIELDS = [field.name for field in Inventory._meta.fields]
+
+# Booking columns copied as is, foreign keys by their raw ids
+BOOKING_FIELDS = [
+    field.name for field in ArchivedBooking._meta.fields if field.name != "archived_at"
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Move train runs whose journey date has passed, and their bookings, "
+        "into the archive tables. Each batch of runs is copied and deleted in "
+        "one transaction, so the command can be stopped and rerun safely."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before",
+            help="Archive runs dated before this YYYY-MM-DD date, default today",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        before = timezone.localdate()
+        if options["before"]:
+            before = parse_date(options["before"])
+            if before is None:
+                raise CommandError("--before must be a YYYY-MM-DD date")
+
+        runs = bookings = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    TrainRun.objects.select_for_update()
+                    .filter(journey_date__lt=before)
+                    .order_by("journey_date", "id")[: max(1, options["batch_size"])]
+                )
+                if not batch:
+                    break
+                bookings += self.archive(batch)
+            runs += len(batch)
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{runs} runs archived")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Archived {runs} runs and {bookings} bookings")
+        )
+
+    def archive(self, runs):
+        ArchivedTrainRun.objects.bulk_create(
+            [
+                ArchivedTrainRun(
+                    id=run.id,
+                    train_id=run.train_id,
+                    journey_date=run.journey_date,
+                    created_at=run.created_at,
+                    **{field: getattr(run, field) for field in INVENTORY_FIELDS},
+                )
+                for run in runs
+            ],
+            ignore_conflicts=True,
+        )
+        bookings = Booking.objects.filter(run__in=runs)
+        archived = [
+            ArchivedBooking(**row)
+            for row in bookings.values(*BOOKING_FIELDS).iterator()
+        ]
+        ArchivedBooking.objects.bulk_create(
+            archived, batch_size=1000, ignore_conflicts=True
+        )
+
+        # Pending promotions are moot once the train has left
+        PromotionTask.objects.filter(run__in=runs).delete()
+        bookings.delete()
+        TrainRun.objects.filter(id__in=[run.id for run in runs]).delete()
+        return len(archived)
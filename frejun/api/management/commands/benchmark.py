@@ -0,0 +1,293 @@
+import json
+import platform
+import statistics
+import subprocess
+from copy import copy
+from datetime import timedelta
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.utils import timezone
+from api.enum import BookingStatus
+from api.factory import UserFactory, StationFactory, RouteFactory, TrainFactory
+from api.models import Booking
+from api.seatmap import SeatMap
+from api.services import BookingService, NoTicketsAvailable
+
+# Bookings made before measuring, per occupancy level
+OCCUPANCY = {
+    "empty": 0,
+    "half": 32,
+    "full": 63,
+    "waitlisted": 63 + 18 + 10,
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[round(fraction * (len(ordered) - 1))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark BookingService and the /api/v1/ endpoints on a throwaway test "
+        "database and write ops/sec, p50/p99 latency and queries per operation "
+        "as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument("--output", default="benchmark.json")
+        parser.add_argument(
+            "--filter", default="", help="Only run benchmarks whose name contains this"
+        )
+
+    def handle(self, *args, **options):
+        self.iterations = options["iterations"]
+        self.name_filter = options["filter"]
+        self.results = []
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.client = Client()
+            self.run_service_benchmarks()
+            self.run_endpoint_benchmarks()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            "revision": git_revision(),
+            "created_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "iterations": self.iterations,
+            "results": self.results,
+        }
+        with open(options["output"], "w") as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def build_train(self, occupancy):
+        train = TrainFactory.create()
+        SeatMap.build(train)
+        if OCCUPANCY[occupancy]:
+            BookingService.create_booking_batch(
+                UserFactory.create_batch(OCCUPANCY[occupancy]), train
+            )
+        train.refresh_from_db()
+        return train
+
+    def measure(self, name, operation, setup=None):
+        """Time operation, rolling back its writes after every run.
+
+        setup, if given, runs untimed before each run and its result is passed
+        to operation.
+        """
+        if self.name_filter not in name:
+            return
+
+        timings, queries = [], []
+        for _ in range(self.iterations):
+            with transaction.atomic():
+                args = (setup(),) if setup else ()
+                with CaptureQueriesContext(connection) as captured:
+                    start = perf_counter()
+                    operation(*args)
+                    timings.append(perf_counter() - start)
+                queries.append(len(captured))
+                transaction.set_rollback(True)
+
+        result = {
+            "name": name,
+            "ops_per_sec": round(len(timings) / sum(timings), 1),
+            "p50_ms": round(statistics.median(timings) * 1000, 3),
+            "p99_ms": round(percentile(timings, 0.99) * 1000, 3),
+            "queries_per_op": round(statistics.mean(queries), 2),
+        }
+        self.results.append(result)
+        self.stdout.write(
+            f"{name:<48} {result['ops_per_sec']:>10} ops/s "
+            f"p50 {result['p50_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  "
+            f"{result['queries_per_op']:>6} queries"
+        )
+
+    def run_service_benchmarks(self):
+        user = UserFactory.create()
+        senior = UserFactory.create(age=70)
+
+        for occupancy in OCCUPANCY:
+            train = self.build_train(occupancy)
+
+            self.measure(
+                f"allocate_berth[{occupancy}]",
+                lambda: BookingService.allocate_berth(train, senior),
+            )
+
+            def create():
+                try:
+                    BookingService.create_booking(user, train)
+                except NoTicketsAvailable:
+                    pass
+
+            self.measure(f"create_booking[{occupancy}]", create)
+
+            def create_optimistic():
+                try:
+                    BookingService.create_booking_optimistic(user, train)
+                except NoTicketsAvailable:
+                    pass
+
+            self.measure(f"create_booking_optimistic[{occupancy}]", create_optimistic)
+
+            confirmed = (
+                Booking.objects.filter(
+                    train=train, booking_status=BookingStatus.CONFIRMED.value
+                )
+                .select_related("train")
+                .first()
+            )
+            if confirmed:
+                self.measure(
+                    f"cancel_booking[{occupancy}]",
+                    BookingService.cancel_booking,
+                    setup=lambda confirmed=confirmed: copy(confirmed),
+                )
+
+    def run_endpoint_benchmarks(self):
+        client = self.client
+        users = UserFactory.create_batch(50)
+        StationFactory.create_batch(50)
+        trains = [self.build_train(occupancy) for occupancy in OCCUPANCY]
+        train = trains[1]
+        booking = Booking.objects.filter(train=train).first()
+        route = RouteFactory.create()
+        today = timezone.localdate()
+        BookingService.open_runs(
+            train, [today + timedelta(days=day) for day in range(30)]
+        )
+
+        get = {
+            "GET /user/": "/api/v1/user/",
+            "GET /station/": "/api/v1/station/",
+            "GET /route/": "/api/v1/route/",
+            "GET /train/": "/api/v1/train/",
+            "GET /train/search/": (
+                f"/api/v1/train/search/?from={train.route.source_station_id}"
+                f"&to={train.route.destination_station_id}"
+            ),
+            "GET /train/<id>/": f"/api/v1/train/{train.id}/",
+            "GET /train/<id>/availability/": f"/api/v1/train/{train.id}/availability/",
+            "GET /train/<id>/availability/?date=": (
+                f"/api/v1/train/{train.id}/availability/?date={today}"
+            ),
+            "GET /train/<id>/runs/": f"/api/v1/train/{train.id}/runs/",
+            "GET /train/<id>/seatmap/": f"/api/v1/train/{train.id}/seatmap/",
+            "GET /train/<id>/seatmap/<coach>/": f"/api/v1/train/{train.id}/seatmap/S1/",
+            "GET /booking/": "/api/v1/booking/",
+            "GET /user/<id>/bookings/": f"/api/v1/user/{booking.user_id}/bookings/",
+            "GET /async/train/<id>/availability/": (
+                f"/api/v1/async/train/{train.id}/availability/"
+            ),
+            "GET /journey/": (
+                f"/api/v1/journey/?from={train.route.source_station_id}"
+                f"&to={train.route.destination_station_id}"
+            ),
+        }
+        for name, url in get.items():
+            self.measure(name, lambda url=url: client.get(url))
+
+        post = {
+            "POST /user/": (
+                "/api/v1/user/",
+                {"name": "Benchmark", "age": 30, "gender": "Female"},
+            ),
+            "POST /station/": (
+                "/api/v1/station/",
+                {"station_name": "Benchmark", "station_code": "BENCH"},
+            ),
+            "POST /route/": (
+                "/api/v1/route/",
+                {
+                    "distance": 500,
+                    "source_station": route.source_station_id,
+                    "destination_station": route.destination_station_id,
+                },
+            ),
+            "POST /train/": (
+                "/api/v1/train/",
+                {"train_name": "Benchmark", "train_number": "B1", "route": route.id},
+            ),
+            "POST /train/<id>/runs/": (
+                f"/api/v1/train/{train.id}/runs/",
+                {"dates": [today + timedelta(days=day) for day in range(30, 60)]},
+            ),
+            "POST /booking/": (
+                "/api/v1/booking/",
+                {"user": users[0].id, "train": train.id, "total_amount": "1000.00"},
+            ),
+            "POST /hold/": (
+                "/api/v1/hold/",
+                {"user": users[1].id, "train": train.id},
+            ),
+            "POST /fares/quote/": (
+                "/api/v1/fares/quote/",
+                {"trains": [train.id for train in trains], "ages": [30] * 50},
+            ),
+            "POST /booking/group/": (
+                "/api/v1/booking/group/",
+                {"train": train.id, "users": [user.id for user in users[:6]]},
+            ),
+            "POST /booking/<id>/cancel/": (
+                f"/api/v1/booking/{booking.id}/cancel/",
+                {},
+            ),
+            "POST /async/booking/": (
+                "/api/v1/async/booking/",
+                {"user": users[0].id, "train": train.id},
+            ),
+            "POST /async/booking/<id>/cancel/": (
+                f"/api/v1/async/booking/{booking.id}/cancel/",
+                {},
+            ),
+        }
+        for name, (url, data) in post.items():
+            body = json.dumps(data, default=str)
+            self.measure(
+                name,
+                lambda url=url, body=body: client.post(
+                    url, body, content_type="application/json"
+                ),
+            )
+
+        def hold():
+            return BookingService.hold_seat(users[1], train)
+
+        self.measure(
+            "DELETE /hold/<id>/",
+            lambda hold: client.delete(f"/api/v1/hold/{hold.id}/"),
+            setup=hold,
+        )
+        self.measure(
+            "POST /hold/<id>/confirm/",
+            lambda hold: client.post(
+                f"/api/v1/hold/{hold.id}/confirm/", content_type="application/json"
+            ),
+            setup=hold,
+        )
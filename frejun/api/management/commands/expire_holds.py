@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from api.holds import scheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Release seat holds that have expired, putting their places back on "
+        "sale. With --loop, keep running and release holds as they expire."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["loop"]:
+            scheduler.start()
+            try:
+                while True:
+                    time.sleep(60)
+            except KeyboardInterrupt:
+                scheduler.stop()
+            return
+
+        expired = scheduler.run_due()
+        self.stdout.write(self.style.SUCCESS(f"Released {expired} expired holds"))
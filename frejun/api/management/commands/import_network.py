@@ -0,0 +1,294 @@
+import csv
+import json
+import os
+from itertools import islice
+from time import perf_counter
+from uuid import UUID
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from api.models import Station, Route, Train, Coach
+from api.planner import invalidate_network
+from api.search import index_routes
+from api.seatmap import build_layouts
+from api.services import BookingService
+
+# Errors printed before the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+def read_rows(path, file_format):
+    """Yield (line_number, row) from a CSV or JSONL file one row at a time"""
+    with open(path, newline="", encoding="utf-8") as source:
+        if file_format == "csv":
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(source, start=1):
+                if line.strip():
+                    try:
+                        yield line_number, json.loads(line)
+                    except ValueError as e:
+                        yield line_number, e
+
+
+def chunks(rows, size):
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def required(row, field):
+    value = row.get(field)
+    if value in (None, ""):
+        raise ValueError(f"{field} is required")
+    return value.strip() if isinstance(value, str) else value
+
+
+def number(row, field, default=None):
+    value = row.get(field)
+    if value in (None, ""):
+        if default is None:
+            raise ValueError(f"{field} is required")
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a whole number")
+    if value < 0:
+        raise ValueError(f"{field} must not be negative")
+    return value
+
+
+def station_codes(value):
+    """Intermediate stops as a list of codes, from JSON or a ;-separated CSV cell"""
+    if value in (None, ""):
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith("["):
+            value = json.loads(value)
+        else:
+            return [code.strip() for code in value.split(";") if code.strip()]
+    if not isinstance(value, list):
+        raise ValueError("intermediate_stations must be a list of station codes")
+    return [str(code) for code in value]
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream stations, routes or trains from a CSV or JSONL file into the "
+        "database in validated batches. Stations are upserted by code; routes "
+        "and trains are upserted by id when the file has one and inserted "
+        "otherwise. Rows that fail validation are reported and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=["stations", "routes", "trains"])
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="Defaults to the file extension",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        file_format = options["format"] or os.path.splitext(path)[1].lstrip(".")
+        if file_format not in ("csv", "jsonl"):
+            raise CommandError("Pass --format csv or --format jsonl")
+
+        kind = options["kind"]
+        self.errors = 0
+        self.created = self.updated = 0
+        if kind == "routes":
+            # Station codes are tiny, so every known code is kept in memory
+            self.stations = set(
+                Station.objects.values_list("station_code", flat=True).iterator()
+            )
+
+        validate = getattr(self, f"validate_{kind[:-1]}")
+        write = getattr(self, f"write_{kind}")
+        start = perf_counter()
+        total = 0
+        for chunk in chunks(
+            read_rows(path, file_format), max(1, options["batch_size"])
+        ):
+            total += len(chunk)
+            records = self.validate_chunk(kind, chunk, validate)
+            if records:
+                with transaction.atomic():
+                    write(records)
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{total} rows read")
+
+        elapsed = perf_counter() - start
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {self.created} new and {self.updated} updated {kind}, "
+                f"skipped {self.errors} invalid rows, in {elapsed:.1f}s "
+                f"({rate:.0f} rows/s)"
+            )
+        )
+
+    def validate_chunk(self, kind, chunk, validate):
+        records = []
+        for line_number, row in chunk:
+            try:
+                if not isinstance(row, dict):
+                    raise ValueError(f"not a JSON object ({row})")
+                records.append(validate(row))
+            except ValueError as e:
+                self.errors += 1
+                if self.errors <= MAX_REPORTED_ERRORS:
+                    self.stderr.write(f"{kind} line {line_number}: {e}")
+
+        # Routes referenced by trains are checked with one query per chunk
+        if kind == "trains" and records:
+            route_ids = {train.route_id for train in records}
+            known = set(
+                Route.objects.filter(id__in=route_ids).values_list("id", flat=True)
+            )
+            valid = [train for train in records if train.route_id in known]
+            for train in records:
+                if train.route_id not in known:
+                    self.errors += 1
+                    if self.errors <= MAX_REPORTED_ERRORS:
+                        self.stderr.write(
+                            f"trains: route {train.route_id} does not exist"
+                        )
+            records = valid
+        return records
+
+    def station(self, row, field):
+        code = str(required(row, field))
+        if code not in self.stations:
+            raise ValueError(f"unknown station {code}")
+        return code
+
+    def validate_station(self, row):
+        return Station(
+            station_code=str(required(row, "station_code")),
+            station_name=str(required(row, "station_name")),
+        )
+
+    def validate_route(self, row):
+        stops = station_codes(row.get("intermediate_stations"))
+        for code in stops:
+            if code not in self.stations:
+                raise ValueError(f"unknown station {code}")
+        route = Route(
+            source_station_id=self.station(row, "source_station"),
+            destination_station_id=self.station(row, "destination_station"),
+            distance=number(row, "distance"),
+            intermediate_stations=stops,
+        )
+        if row.get("id"):
+            route.id = self.parse_id(row["id"])
+        return route
+
+    def validate_train(self, row):
+        train = Train(
+            train_name=str(required(row, "train_name")),
+            train_number=str(required(row, "train_number")),
+            route_id=self.parse_id(required(row, "route")),
+            total_confirmed_berths=number(row, "total_confirmed_berths", 63),
+            total_rac_berths=number(row, "total_rac_berths", 9),
+        )
+        if row.get("id"):
+            train.id = self.parse_id(row["id"])
+        return train
+
+    def parse_id(self, value):
+        try:
+            return UUID(str(value))
+        except ValueError:
+            raise ValueError(f"{value} is not a valid id")
+
+    def split_existing(self, model, records):
+        existing = set(
+            model.objects.filter(id__in=[record.id for record in records]).values_list(
+                "id", flat=True
+            )
+        )
+        return (
+            [record for record in records if record.id not in existing],
+            [record for record in records if record.id in existing],
+        )
+
+    def write_stations(self, stations):
+        # The last row wins when a chunk repeats a code
+        stations = list(
+            {station.station_code: station for station in stations}.values()
+        )
+        existing = Station.objects.filter(
+            station_code__in=[station.station_code for station in stations]
+        ).count()
+        Station.objects.bulk_create(
+            stations,
+            update_conflicts=True,
+            unique_fields=["station_code"],
+            update_fields=["station_name"],
+        )
+        self.created += len(stations) - existing
+        self.updated += existing
+
+    def write_routes(self, routes):
+        # The last row wins when a chunk repeats an id
+        routes = list({route.id: route for route in routes}.values())
+        new, existing = self.split_existing(Route, routes)
+        Route.objects.bulk_create(new)
+        Route.objects.bulk_update(
+            existing,
+            [
+                "source_station",
+                "destination_station",
+                "distance",
+                "intermediate_stations",
+            ],
+        )
+        # bulk_create and bulk_update skip the signal keeping RouteStop current
+        index_routes(routes)
+        invalidate_network()
+        self.created += len(new)
+        self.updated += len(existing)
+
+    def write_trains(self, trains):
+        # The last row wins when a chunk repeats an id
+        trains = list({train.id: train for train in trains}.values())
+        new, existing = self.split_existing(Train, trains)
+        coaches = []
+        for train in new:
+            for field, value in BookingService.expected_counters(train, {}).items():
+                setattr(train, field, value)
+            coaches.extend(
+                Coach(
+                    train=train,
+                    position=position,
+                    coach_number=f"S{position}",
+                    layout=layout,
+                    occupied=bytes((len(layout) + 7) // 8),
+                )
+                for position, layout in enumerate(build_layouts(train), start=1)
+            )
+        Train.objects.bulk_create(new)
+        Coach.objects.bulk_create(coaches)
+
+        # Capacity of existing trains is left alone, their bookings depend on it
+        now = timezone.now()
+        for train in existing:
+            train.updated_at = now
+        Train.objects.bulk_update(
+            existing, ["train_name", "train_number", "route", "updated_at"]
+        )
+        # Trains decide which routes the journey planner can use
+        invalidate_network()
+        self.created += len(new)
+        self.updated += len(existing)
@@ -0,0 +1,40 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from api.promotions import PromotionWorker
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Promote RAC and waiting list passengers into places freed by "
+        "cancellations, draining the promotion outbox. With --loop, keep "
+        "polling it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument("--interval", type=float, default=None)
+
+    def handle(self, *args, **options):
+        worker = PromotionWorker(options["batch_size"], options["interval"])
+        if not options["loop"]:
+            processed = worker.drain()
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} tasks"))
+            return
+
+        try:
+            while True:
+                try:
+                    worker.drain()
+                except Exception:
+                    # Such as the database going away; the outbox keeps the tasks
+                    logger.exception("Draining the promotion outbox failed")
+                finally:
+                    close_old_connections()
+                time.sleep(worker.poll_interval)
+        except KeyboardInterrupt:
+            pass
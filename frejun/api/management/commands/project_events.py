@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from api.models import Train, TrainRun
+from api.projections import project, rebuild_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply new booking events to the read models built from the event "
+        "log. With --check-counters, also replay every train's log and report "
+        "counters that differ from it; add --fix to write the replayed "
+        "counters back. Replays are only exact for trains whose bookings were "
+        "all logged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--check-counters", action="store_true")
+        parser.add_argument("--fix", action="store_true")
+
+    def handle(self, *args, **options):
+        applied = project(batch_size=max(1, options["batch_size"]))
+        self.stdout.write(self.style.SUCCESS(f"Applied {applied} events"))
+        if not options["check_counters"]:
+            return
+
+        drifted = 0
+        for model in (Train, TrainRun):
+            for inventory in model.objects.filter(event_sequence__gt=0).iterator():
+                drift = rebuild_counters(inventory, fix=options["fix"])
+                if drift:
+                    drifted += 1
+                    changes = ", ".join(
+                        f"{field} {stored} -> {replayed}"
+                        for field, (stored, replayed) in drift.items()
+                    )
+                    self.stdout.write(f"{model.__name__} {inventory.id}: {changes}")
+        action = "Fixed" if options["fix"] else "Found"
+        self.stdout.write(
+            self.style.SUCCESS(f"{action} {drifted} inventories out of step")
+        )
@@ -0,0 +1,119 @@
+from itertools import islice
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from api.models import (
+    Train,
+    TrainRun,
+    Booking,
+    PromotionTask,
+    SeatHold,
+    CounterReconciliation,
+)
+from api.services import BookingService, COUNTER_FIELDS
+
+INVENTORY_COLUMNS = (
+    "id",
+    "total_confirmed_berths",
+    "total_rac_berths",
+) + COUNTER_FIELDS
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the availability counters of trains and train runs from their "
+        "bookings and report any that drifted. Only inventories written to or "
+        "booked on since the previous run are checked unless --all is given; "
+        "--fix rewrites drifted counters under the train lock."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true")
+        parser.add_argument("--all", action="store_true")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Inventories counted per aggregate query",
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        start = perf_counter()
+        last = CounterReconciliation.objects.order_by("-started_at").first()
+        since = None if options["all"] or last is None else last.started_at
+
+        self.checked = self.drifted = self.fixed = 0
+        for model, key in ((Train, "train_id"), (TrainRun, "run_id")):
+            inventories = self.changed(model, key, since).iterator(
+                chunk_size=options["chunk_size"]
+            )
+            while True:
+                chunk = list(islice(inventories, max(1, options["chunk_size"])))
+                if not chunk:
+                    break
+                self.reconcile(model, key, chunk, options["fix"])
+
+        CounterReconciliation.objects.create(
+            started_at=started,
+            finished_at=timezone.now(),
+            checked=self.checked,
+            drifted=self.drifted,
+            fixed=self.fixed,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Checked {self.checked} inventories, {self.drifted} drifted, "
+                f"{self.fixed} fixed, in {perf_counter() - start:.1f}s"
+            )
+        )
+
+    def changed(self, model, key, since):
+        inventories = model.objects.only(*INVENTORY_COLUMNS).order_by("id")
+        if since is None:
+            return inventories
+        # Counter writes bump updated_at; bookings made around BookingService
+        # only show up as new Booking rows
+        booked = Booking.objects.filter(created_at__gte=since).values(key)
+        return inventories.filter(Q(updated_at__gte=since) | Q(id__in=booked))
+
+    def reconcile(self, model, key, inventories, fix):
+        ids = [inventory.id for inventory in inventories]
+        if model is Train:
+            counts = BookingService.place_counts(
+                key,
+                Booking.objects.filter(train_id__in=ids, run__isnull=True),
+                PromotionTask.objects.filter(train_id__in=ids, run__isnull=True),
+                SeatHold.objects.filter(train_id__in=ids),
+            )
+        else:
+            counts = BookingService.place_counts(
+                key,
+                Booking.objects.filter(run_id__in=ids),
+                PromotionTask.objects.filter(run_id__in=ids),
+            )
+
+        for inventory in inventories:
+            self.checked += 1
+            expected = BookingService.expected_counters(
+                inventory, counts.get(inventory.id, {})
+            )
+            drift = {
+                field: (getattr(inventory, field), value)
+                for field, value in expected.items()
+                if getattr(inventory, field) != value
+            }
+            if not drift:
+                continue
+            self.drifted += 1
+            if fix:
+                # Recounted under the lock, in case a booking landed meanwhile
+                drift = BookingService.reset_counters(inventory)
+                self.fixed += bool(drift)
+            if drift:
+                changes = ", ".join(
+                    f"{field} {stored} -> {actual}"
+                    for field, (stored, actual) in drift.items()
+                )
+                self.stdout.write(f"{model.__name__} {inventory.id}: {changes}")
@@ -0,0 +1,248 @@
+import atexit
+import json
+import os
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from time import monotonic, perf_counter
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+def _labels(labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels)
+
+
+class Histogram:
+    """Cumulative histogram per label set, rendered in Prometheus text format"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # One count per bucket plus +Inf, then the running sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {key: list(values) for key, values in self._series.items()}
+
+    @staticmethod
+    def merge(total, values):
+        return [a + b for a, b in zip(total, values)] if total else list(values)
+
+    @contextmanager
+    def time(self, **labels):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def samples(self, series):
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                labels = _labels(key + (("le", bound),))
+                yield f"{self.name}_bucket{{{labels}}} {cumulative}"
+            labels = f"{{{_labels(key)}}}" if key else ""
+            yield f"{self.name}_sum{labels} {values[-1]}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._series)
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def samples(self, series):
+        for key, value in sorted(series.items()):
+            labels = f"{{{_labels(key)}}}" if key else ""
+            yield f"{self.name}{labels} {value}"
+
+
+class Registry:
+    """Metrics of this process, merged with those of its siblings when METRICS_DIR is set.
+
+    Under several worker processes each one dumps its series to
+    METRICS_DIR/<pid>.json at most every METRICS_FLUSH_INTERVAL seconds, and
+    /metrics adds up every file, so a scrape sees the whole server whichever
+    worker answers it. Files of exited workers are kept so totals never go
+    backwards; clear the directory when the server starts.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self._flushed = None
+        self._flush_lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def flush(self, force=False):
+        """Dump this process's series to METRICS_DIR if it is set and they are due"""
+        directory = settings.METRICS_DIR
+        now = monotonic()
+        if not directory or (
+            not force
+            and self._flushed is not None
+            and now - self._flushed < settings.METRICS_FLUSH_INTERVAL
+        ):
+            return
+        with self._flush_lock:
+            self._flushed = now
+            dump = {
+                name: [[list(key), values] for key, values in series.items()]
+                for name, series in self.snapshot().items()
+            }
+            path = Path(directory) / f"{os.getpid()}.json"
+            partial = path.with_suffix(".tmp")
+            partial.write_text(json.dumps(dump))
+            # Readers never see a half-written file
+            os.replace(partial, path)
+
+    def collect(self):
+        """Series of every metric, summed over all processes when METRICS_DIR is set"""
+        if not settings.METRICS_DIR:
+            return self.snapshot()
+        self.flush(force=True)
+        metrics = {metric.name: metric for metric in self.metrics}
+        merged = {name: {} for name in metrics}
+        for path in Path(settings.METRICS_DIR).glob("*.json"):
+            try:
+                dump = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for name, series in dump.items():
+                if name not in metrics:
+                    continue
+                for key, values in series:
+                    key = tuple(tuple(pair) for pair in key)
+                    merged[name][key] = metrics[name].merge(
+                        merged[name].get(key), values
+                    )
+        return merged
+
+    def render(self):
+        collected = self.collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples(collected[metric.name]))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+atexit.register(registry.flush, force=True)
+
+REQUEST_LATENCY = registry.register(
+    Histogram("http_request_duration_seconds", "Request latency by route.")
+)
+REQUESTS = registry.register(
+    Counter("http_requests_total", "Requests by route and status code.")
+)
+REQUEST_QUERIES = registry.register(
+    Histogram("http_request_queries", "SQL queries per request.", QUERY_BUCKETS)
+)
+REQUEST_QUERY_TIME = registry.register(
+    Histogram("http_request_query_seconds", "Time spent in SQL per request.")
+)
+BOOKING_LATENCY = registry.register(
+    Histogram(
+        "booking_operation_duration_seconds",
+        "BookingService operation latency including commit.",
+    )
+)
+BOOKING_QUERIES = registry.register(
+    Histogram("booking_operation_queries", "SQL queries per operation.", QUERY_BUCKETS)
+)
+TRAIN_LOCK_WAIT = registry.register(
+    Histogram(
+        "train_lock_wait_seconds", "Time waiting for the select_for_update train lock."
+    )
+)
+
+
+class QueryStats:
+    """Database execute wrapper counting queries and the time spent in them"""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += perf_counter() - start
+
+
+def timed(operation):
+    """Record latency and query count of a BookingService operation"""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            queries = QueryStats()
+            start = perf_counter()
+            try:
+                with connection.execute_wrapper(queries):
+                    return func(*args, **kwargs)
+            finally:
+                BOOKING_LATENCY.observe(perf_counter() - start, operation=operation)
+                BOOKING_QUERIES.observe(queries.count, operation=operation)
+
+        return wrapper
+
+    return decorator
+
+
+def metrics_view(request):
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,118 @@
+from math import ceil
+from time import perf_counter, time
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.utils.decorators import sync_and_async_middleware
+from api.metrics import (
+    REQUEST_LATENCY,
+    REQUESTS,
+    REQUEST_QUERIES,
+    REQUEST_QUERY_TIME,
+    QueryStats,
+    registry,
+)
+from api.routers import choose_replica, reading_from
+
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+# Seconds-since-epoch until which a client that just wrote reads the primary
+PRIMARY_UNTIL_COOKIE = "primary_until"
+
+
+def _route(request):
+    match = getattr(request, "resolver_match", None)
+    return f"/{match.route}" if match else "unmatched"
+
+
+def _record(request, response, elapsed, queries=None):
+    route = _route(request)
+    REQUEST_LATENCY.observe(elapsed, method=request.method, route=route)
+    REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+    if queries is not None:
+        REQUEST_QUERIES.observe(queries.count, method=request.method, route=route)
+        REQUEST_QUERY_TIME.observe(queries.time, method=request.method, route=route)
+    # A time check unless a flush to METRICS_DIR is due
+    registry.flush()
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Record per-route latency, status codes and SQL usage for /metrics.
+
+    Async requests only record latency and status: their queries run on
+    worker threads outside this request's connection wrapper.
+    """
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            start = perf_counter()
+            response = await get_response(request)
+            _record(request, response, perf_counter() - start)
+            return response
+
+    else:
+
+        def middleware(request):
+            queries = QueryStats()
+            start = perf_counter()
+            with connection.execute_wrapper(queries):
+                response = get_response(request)
+            _record(request, response, perf_counter() - start, queries)
+            return response
+
+    return middleware
+
+
+def _replica_for(request):
+    """Replica to serve request from, or None for the primary"""
+    if request.method not in READ_METHODS:
+        return None
+    try:
+        if float(request.COOKIES.get(PRIMARY_UNTIL_COOKIE, 0)) > time():
+            return None
+    except ValueError:
+        pass
+    return choose_replica()
+
+
+def _stick_to_primary(request, response):
+    # The client's next reads could otherwise reach a replica that hasn't
+    # applied its write yet
+    window = settings.READ_YOUR_WRITES_WINDOW
+    if (
+        settings.DATABASE_REPLICAS
+        and window > 0
+        and request.method not in READ_METHODS
+        and response.status_code < 400
+    ):
+        response.set_cookie(
+            PRIMARY_UNTIL_COOKIE,
+            f"{time() + window:.3f}",
+            max_age=ceil(window),
+            httponly=True,
+            samesite="Lax",
+        )
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    """Serve reads from a replica picked by weight, sticking to the primary
+    for READ_YOUR_WRITES_WINDOW seconds after a client writes.
+    """
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            with reading_from(_replica_for(request)):
+                response = await get_response(request)
+            _stick_to_primary(request, response)
+            return response
+
+    else:
+
+        def middleware(request):
+            with reading_from(_replica_for(request)):
+                response = get_response(request)
+            _stick_to_primary(request, response)
+            return response
+
+    return middleware
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='alighting_station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='alighting_bookings', to='api.station'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='boarding_station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='boarding_bookings', to='api.station'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='segment_berth',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='SegmentMap',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bitmaps', models.JSONField(default=dict)),
+                ('train', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='segment_map', to='api.train')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_segment_availability'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['train', 'booking_status', 'booking_date'], name='booking_promotion_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_booking_promotion_queue_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['created_at', 'id'], name='api_booking_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['created_at', 'id'], name='api_route_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='segmentmap',
+            index=models.Index(fields=['created_at', 'id'], name='api_segmentmap_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='train',
+            index=models.Index(fields=['created_at', 'id'], name='api_train_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['created_at', 'id'], name='api_user_keyset_idx'),
+        ),
+    ]
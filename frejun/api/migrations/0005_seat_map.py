@@ -0,0 +1,85 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="booking",
+            name="berth_number",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="booking",
+            name="coach",
+            field=models.CharField(blank=True, max_length=16, null=True),
+        ),
+        migrations.AlterField(
+            model_name="booking",
+            name="berth_type",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("LOWER", "LOWER"),
+                    ("MIDDLE", "MIDDLE"),
+                    ("UPPER", "UPPER"),
+                    ("SIDE_LOWER", "SIDE_LOWER"),
+                    ("SIDE_UPPER", "SIDE_UPPER"),
+                    ("NO_BERTH", "NO_BERTH"),
+                ],
+                max_length=255,
+                null=True,
+            ),
+        ),
+        migrations.CreateModel(
+            name="Coach",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("position", models.PositiveIntegerField()),
+                ("coach_number", models.CharField(max_length=16)),
+                ("layout", models.CharField(max_length=255)),
+                ("occupied", models.BinaryField(default=b"")),
+                (
+                    "train",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="coaches",
+                        to="api.train",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["position"],
+                "abstract": False,
+                "indexes": [
+                    models.Index(
+                        fields=["created_at", "id"], name="api_coach_keyset_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="coach",
+            constraint=models.UniqueConstraint(
+                fields=("train", "coach_number"), name="unique_coach_per_train"
+            ),
+        ),
+    ]
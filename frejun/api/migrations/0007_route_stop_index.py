@@ -0,0 +1,69 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_routes(apps, schema_editor):
+    Route = apps.get_model("api", "Route")
+    RouteStop = apps.get_model("api", "RouteStop")
+    stops = []
+    for route in Route.objects.iterator():
+        intermediate = route.intermediate_stations
+        if not isinstance(intermediate, list):
+            intermediate = []
+        codes = [route.source_station_id, *intermediate, route.destination_station_id]
+        stops.extend(
+            RouteStop(route_id=route.id, station_code=code, position=position)
+            for position, code in enumerate(codes)
+        )
+    RouteStop.objects.bulk_create(stops, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_idempotency_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RouteStop",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("station_code", models.CharField(max_length=255)),
+                ("position", models.PositiveIntegerField()),
+                (
+                    "route",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stops",
+                        to="api.route",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["station_code", "route", "position"],
+                        name="route_stop_station_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="routestop",
+            constraint=models.UniqueConstraint(
+                fields=("route", "position"), name="unique_route_stop_position"
+            ),
+        ),
+        migrations.RunPython(index_routes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_route_stop_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PromotionTask",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "booking_status",
+                    models.CharField(
+                        choices=[
+                            ("RAC", "RAC"),
+                            ("WAITING_LIST", "WAITING_LIST"),
+                            ("CONFIRMED", "CONFIRMED"),
+                        ],
+                        max_length=255,
+                    ),
+                ),
+                (
+                    "berth_type",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("LOWER", "LOWER"),
+                            ("MIDDLE", "MIDDLE"),
+                            ("UPPER", "UPPER"),
+                            ("SIDE_LOWER", "SIDE_LOWER"),
+                            ("SIDE_UPPER", "SIDE_UPPER"),
+                            ("NO_BERTH", "NO_BERTH"),
+                        ],
+                        max_length=255,
+                        null=True,
+                    ),
+                ),
+                (
+                    "train",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="promotion_tasks",
+                        to="api.train",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+                "indexes": [
+                    models.Index(
+                        fields=["created_at", "id"], name="api_promotiontask_keyset_idx"
+                    ),
+                    models.Index(
+                        fields=["train", "created_at"], name="promotion_task_queue_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_promotion_outbox"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                fields=["user", "-booking_date", "-id"], name="booking_user_history_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,162 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_booking_user_history_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedBooking",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(editable=False, primary_key=True, serialize=False),
+                ),
+                ("run_id", models.UUIDField(db_index=True)),
+                ("train_id", models.UUIDField()),
+                ("user_id", models.UUIDField(db_index=True)),
+                (
+                    "booking_status",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("berth_type", models.CharField(blank=True, max_length=255, null=True)),
+                ("booking_date", models.DateTimeField()),
+                ("total_amount", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "boarding_station_id",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                (
+                    "alighting_station_id",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("coach", models.CharField(blank=True, max_length=16, null=True)),
+                ("berth_number", models.PositiveIntegerField(blank=True, null=True)),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedTrainRun",
+            fields=[
+                ("total_confirmed_berths", models.PositiveIntegerField(default=63)),
+                ("total_rac_berths", models.PositiveIntegerField(default=9)),
+                ("available_confirmed_berths", models.PositiveIntegerField(default=63)),
+                ("available_rac_spots", models.PositiveIntegerField(default=18)),
+                ("waiting_list_count", models.PositiveIntegerField(default=0)),
+                ("lower_berths_available", models.PositiveIntegerField(default=21)),
+                ("middle_berths_available", models.PositiveIntegerField(default=21)),
+                ("upper_berths_available", models.PositiveIntegerField(default=21)),
+                ("side_lower_berths_available", models.PositiveIntegerField(default=9)),
+                ("side_upper_berths_available", models.PositiveIntegerField(default=9)),
+                (
+                    "id",
+                    models.UUIDField(editable=False, primary_key=True, serialize=False),
+                ),
+                ("train_id", models.UUIDField(db_index=True)),
+                ("journey_date", models.DateField(db_index=True)),
+                ("created_at", models.DateTimeField()),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="TrainRun",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("total_confirmed_berths", models.PositiveIntegerField(default=63)),
+                ("total_rac_berths", models.PositiveIntegerField(default=9)),
+                ("available_confirmed_berths", models.PositiveIntegerField(default=63)),
+                ("available_rac_spots", models.PositiveIntegerField(default=18)),
+                ("waiting_list_count", models.PositiveIntegerField(default=0)),
+                ("lower_berths_available", models.PositiveIntegerField(default=21)),
+                ("middle_berths_available", models.PositiveIntegerField(default=21)),
+                ("upper_berths_available", models.PositiveIntegerField(default=21)),
+                ("side_lower_berths_available", models.PositiveIntegerField(default=9)),
+                ("side_upper_berths_available", models.PositiveIntegerField(default=9)),
+                ("journey_date", models.DateField()),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.AddField(
+            model_name="trainrun",
+            name="train",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="runs",
+                to="api.train",
+            ),
+        ),
+        migrations.AddField(
+            model_name="booking",
+            name="run",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="bookings",
+                to="api.trainrun",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                fields=["run", "booking_status", "booking_date"],
+                name="booking_run_queue_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="promotiontask",
+            name="run",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="promotion_tasks",
+                to="api.trainrun",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trainrun",
+            index=models.Index(
+                fields=["created_at", "id"], name="api_trainrun_keyset_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trainrun",
+            index=models.Index(fields=["journey_date"], name="train_run_date_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="trainrun",
+            constraint=models.UniqueConstraint(
+                fields=("train", "journey_date"), name="unique_train_run_per_date"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="trainrun",
+            constraint=models.CheckConstraint(
+                check=models.Q(("waiting_list_count__lte", 10)),
+                name="run_max_waiting_list_10",
+            ),
+        ),
+    ]
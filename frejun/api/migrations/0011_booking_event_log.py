@@ -0,0 +1,186 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_train_runs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedtrainrun",
+            name="event_sequence",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="train",
+            name="event_sequence",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="trainrun",
+            name="event_sequence",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="ProjectionCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("projection", models.CharField(max_length=64)),
+                ("run_id", models.UUIDField(blank=True, null=True)),
+                ("sequence", models.PositiveBigIntegerField(default=0)),
+                (
+                    "train",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="projection_checkpoints",
+                        to="api.train",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="BookingStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("run_id", models.UUIDField(blank=True, null=True)),
+                ("bookings", models.PositiveIntegerField(default=0)),
+                ("cancellations", models.PositiveIntegerField(default=0)),
+                ("promotions", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "train",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="booking_stats",
+                        to="api.train",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="BookingEvent",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("run_id", models.UUIDField(blank=True, null=True)),
+                ("sequence", models.PositiveBigIntegerField()),
+                (
+                    "event_type",
+                    models.CharField(
+                        choices=[
+                            ("BOOKED", "BOOKED"),
+                            ("CANCELLED", "CANCELLED"),
+                            ("PLACE_RELEASED", "PLACE_RELEASED"),
+                            ("PROMOTED", "PROMOTED"),
+                            ("BERTH_ASSIGNED", "BERTH_ASSIGNED"),
+                        ],
+                        max_length=32,
+                    ),
+                ),
+                ("booking_id", models.UUIDField(blank=True, null=True)),
+                ("user_id", models.UUIDField(blank=True, null=True)),
+                (
+                    "booking_status",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("berth_type", models.CharField(blank=True, max_length=255, null=True)),
+                (
+                    "previous_status",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                (
+                    "previous_berth_type",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("coach", models.CharField(blank=True, max_length=16, null=True)),
+                ("berth_number", models.PositiveIntegerField(blank=True, null=True)),
+                ("shared_berth", models.BooleanField(default=False)),
+                (
+                    "amount",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=10, null=True
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "train",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="events",
+                        to="api.train",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="projectioncheckpoint",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("run_id__isnull", True)),
+                fields=("projection", "train"),
+                name="unique_train_checkpoint",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="projectioncheckpoint",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("run_id__isnull", False)),
+                fields=("projection", "run_id"),
+                name="unique_run_checkpoint",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="bookingstats",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("run_id__isnull", True)),
+                fields=("train",),
+                name="unique_train_stats",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="bookingstats",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("run_id__isnull", False)),
+                fields=("run_id",),
+                name="unique_run_stats",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="bookingevent",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("run_id__isnull", True)),
+                fields=("train", "sequence"),
+                name="unique_train_event_sequence",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="bookingevent",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("run_id__isnull", False)),
+                fields=("run_id", "sequence"),
+                name="unique_run_event_sequence",
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_booking_event_log"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CounterReconciliation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("started_at", models.DateTimeField(db_index=True)),
+                ("finished_at", models.DateTimeField()),
+                ("checked", models.PositiveIntegerField()),
+                ("drifted", models.PositiveIntegerField()),
+                ("fixed", models.PositiveIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0012_counter_reconciliation"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="bookingevent",
+            name="event_type",
+            field=models.CharField(
+                choices=[
+                    ("BOOKED", "BOOKED"),
+                    ("CANCELLED", "CANCELLED"),
+                    ("PLACE_RELEASED", "PLACE_RELEASED"),
+                    ("PROMOTED", "PROMOTED"),
+                    ("BERTH_ASSIGNED", "BERTH_ASSIGNED"),
+                    ("HELD", "HELD"),
+                    ("HOLD_RELEASED", "HOLD_RELEASED"),
+                ],
+                max_length=32,
+            ),
+        ),
+        migrations.CreateModel(
+            name="SeatHold",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "booking_status",
+                    models.CharField(
+                        choices=[
+                            ("RAC", "RAC"),
+                            ("WAITING_LIST", "WAITING_LIST"),
+                            ("CONFIRMED", "CONFIRMED"),
+                        ],
+                        max_length=255,
+                    ),
+                ),
+                (
+                    "berth_type",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("LOWER", "LOWER"),
+                            ("MIDDLE", "MIDDLE"),
+                            ("UPPER", "UPPER"),
+                            ("SIDE_LOWER", "SIDE_LOWER"),
+                            ("SIDE_UPPER", "SIDE_UPPER"),
+                            ("NO_BERTH", "NO_BERTH"),
+                        ],
+                        max_length=255,
+                        null=True,
+                    ),
+                ),
+                ("coach", models.CharField(blank=True, max_length=16, null=True)),
+                ("berth_number", models.PositiveIntegerField(blank=True, null=True)),
+                ("expires_at", models.DateTimeField()),
+                (
+                    "train",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="seat_holds",
+                        to="api.train",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="seat_holds",
+                        to="api.user",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+                "indexes": [
+                    models.Index(
+                        fields=["created_at", "id"], name="api_seathold_keyset_idx"
+                    ),
+                    models.Index(
+                        fields=["expires_at", "train"], name="seat_hold_expiry_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
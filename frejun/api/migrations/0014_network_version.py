@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:03
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_seat_holds"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NetworkVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.UUIDField(default=uuid.uuid4)),
+            ],
+        ),
+    ]
@@ -1,6 +1,7 @@
 from uuid import uuid4
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
-from api.enum import BookingStatus, BerthType
+from api.enum import BookingStatus, BerthType, BookingEventType
 
 
 class BaseModel(models.Model):
@@ -10,6 +11,12 @@ class BaseModel(models.Model):
 
     class Meta:
         abstract = True
+        # Keyset pagination walks (created_at, id)
+        indexes = [
+            models.Index(
+                fields=["created_at", "id"], name="%(app_label)s_%(class)s_keyset_idx"
+            )
+        ]
 
 
 class User(BaseModel):
@@ -43,11 +50,21 @@ class Route(BaseModel):
     def __str__(self):
         return f"{self.source_station.station_name} to {self.destination_station.station_name}"
 
+    def stations(self):
+        """Station codes served in order, from source to destination"""
+        stops = self.intermediate_stations
+        # Only a list of station codes describes stops; anything else means none
+        if not isinstance(stops, list):
+            stops = []
+        # JSON may hold numeric codes; station codes are compared as text
+        return [
+            str(code)
+            for code in (self.source_station_id, *stops, self.destination_station_id)
+        ]
 
-class Train(BaseModel):
-    train_name = models.CharField(max_length=255)
-    train_number = models.CharField(max_length=255)
-    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name="route")
+
+class Inventory(models.Model):
+    """Capacity and availability counters of a train, or of one dated run of it"""
 
     # Berth availability tracking
     total_confirmed_berths = models.PositiveIntegerField(default=63)
@@ -63,7 +80,19 @@ class Train(BaseModel):
     side_lower_berths_available = models.PositiveIntegerField(default=9)  # RAC berths
     side_upper_berths_available = models.PositiveIntegerField(default=9)  # RAC berths
 
+    # Sequence number of the last BookingEvent logged against these counters
+    event_sequence = models.PositiveBigIntegerField(default=0)
+
     class Meta:
+        abstract = True
+
+
+class Train(BaseModel, Inventory):
+    train_name = models.CharField(max_length=255)
+    train_number = models.CharField(max_length=255)
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name="route")
+
+    class Meta(BaseModel.Meta):
         constraints = [
             models.CheckConstraint(
                 check=models.Q(waiting_list_count__lte=10), name="max_waiting_list_10"
@@ -71,6 +100,32 @@ class Train(BaseModel):
         ]
 
 
+class TrainRun(BaseModel, Inventory):
+    """A train on one journey date, with its own counters.
+
+    Bookings for a date point at its run. Runs whose date has passed are
+    moved to ArchivedTrainRun by the archive_runs command, so the hot tables
+    only ever hold the dates still on sale.
+    """
+
+    train = models.ForeignKey(Train, on_delete=models.CASCADE, related_name="runs")
+    journey_date = models.DateField()
+
+    class Meta(BaseModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=["train", "journey_date"], name="unique_train_run_per_date"
+            ),
+            models.CheckConstraint(
+                check=models.Q(waiting_list_count__lte=10),
+                name="run_max_waiting_list_10",
+            ),
+        ]
+        indexes = BaseModel.Meta.indexes + [
+            models.Index(fields=["journey_date"], name="train_run_date_idx")
+        ]
+
+
 class Booking(BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="user")
     train = models.ForeignKey(Train, on_delete=models.CASCADE, related_name="train")
@@ -88,3 +143,349 @@ class Booking(BaseModel):
     )
     booking_date = models.DateTimeField(auto_now_add=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    boarding_station = models.ForeignKey(
+        Station,
+        on_delete=models.PROTECT,
+        related_name="boarding_bookings",
+        null=True,
+        blank=True,
+    )
+    alighting_station = models.ForeignKey(
+        Station,
+        on_delete=models.PROTECT,
+        related_name="alighting_bookings",
+        null=True,
+        blank=True,
+    )
+    # Dated run the booking is for; undated bookings use the train's counters
+    run = models.ForeignKey(
+        TrainRun,
+        on_delete=models.CASCADE,
+        related_name="bookings",
+        null=True,
+        blank=True,
+    )
+    # Slot in the train's SegmentMap for partial-journey berths
+    segment_berth = models.PositiveIntegerField(null=True, blank=True)
+    # Seat assigned from the train's coaches, if it has a seat map
+    coach = models.CharField(max_length=16, null=True, blank=True)
+    berth_number = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta(BaseModel.Meta):
+        indexes = BaseModel.Meta.indexes + [
+            # RAC/waiting list promotion queue, oldest first
+            models.Index(
+                fields=["train", "booking_status", "booking_date"],
+                name="booking_promotion_queue_idx",
+            ),
+            # Promotion queue of a dated run
+            models.Index(
+                fields=["run", "booking_status", "booking_date"],
+                name="booking_run_queue_idx",
+            ),
+            # A user's booking history, newest first
+            models.Index(
+                fields=["user", "-booking_date", "-id"],
+                name="booking_user_history_idx",
+            ),
+        ]
+
+
+class RouteStop(models.Model):
+    """One stop of a route, indexing which routes serve a station and in what order.
+
+    Kept in step with Route by api/search.py, so trains between two stations
+    are found without reading every route's intermediate_stations.
+    """
+
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name="stops")
+    # Intermediate stations are free-form JSON, so codes are not foreign keys
+    station_code = models.CharField(max_length=255)
+    position = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["route", "position"], name="unique_route_stop_position"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["station_code", "route", "position"],
+                name="route_stop_station_idx",
+            )
+        ]
+
+
+class NetworkVersion(models.Model):
+    """Token replaced in the same transaction as any change to the route network.
+
+    Journey planners in every worker process compare it with the version
+    their route graph was built from (see api/planner.py). It is random
+    rather than a counter so a rolled back change can't reuse a version.
+    """
+
+    version = models.UUIDField(default=uuid4)
+
+
+class PromotionTask(BaseModel):
+    """Outbox entry for a place freed by a cancellation.
+
+    The freed berth or RAC spot stays off the train's counters until the
+    task is processed, so RAC and waiting list passengers get it before new
+    bookings do. Tasks are processed in created_at order per train and
+    deleted in the same transaction that applies them.
+    """
+
+    train = models.ForeignKey(
+        Train, on_delete=models.CASCADE, related_name="promotion_tasks"
+    )
+    run = models.ForeignKey(
+        TrainRun,
+        on_delete=models.CASCADE,
+        related_name="promotion_tasks",
+        null=True,
+        blank=True,
+    )
+    booking_status = models.CharField(
+        max_length=255,
+        choices=[(status.value, status.name) for status in BookingStatus],
+    )
+    berth_type = models.CharField(
+        max_length=255,
+        choices=[(berth.value, berth.name) for berth in BerthType],
+        null=True,
+        blank=True,
+    )
+
+    class Meta(BaseModel.Meta):
+        indexes = BaseModel.Meta.indexes + [
+            models.Index(
+                fields=["train", "created_at"], name="promotion_task_queue_idx"
+            )
+        ]
+
+
+class SeatHold(BaseModel):
+    """A place taken off a train's counters while its passenger pays.
+
+    The berth or RAC spot is held exactly as a booking would take it, until
+    the hold is converted into that booking or expires_at passes and
+    BookingService.expire_holds puts it back.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="seat_holds")
+    train = models.ForeignKey(
+        Train, on_delete=models.CASCADE, related_name="seat_holds"
+    )
+    booking_status = models.CharField(
+        max_length=255,
+        choices=[(status.value, status.name) for status in BookingStatus],
+    )
+    berth_type = models.CharField(
+        max_length=255,
+        choices=[(berth.value, berth.name) for berth in BerthType],
+        null=True,
+        blank=True,
+    )
+    coach = models.CharField(max_length=16, null=True, blank=True)
+    berth_number = models.PositiveIntegerField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+
+    class Meta(BaseModel.Meta):
+        indexes = BaseModel.Meta.indexes + [
+            # Expiry finds due holds without scanning live ones
+            models.Index(fields=["expires_at", "train"], name="seat_hold_expiry_idx")
+        ]
+
+
+class SegmentMap(BaseModel):
+    """Per-segment occupancy of berths shared between partial journeys.
+
+    bitmaps maps a berth type to a list of integers, one per berth taken from
+    the train's counters for partial journeys, with bit i set while the
+    segment between stop i and stop i + 1 is occupied. A berth goes back to
+    the train's counters once its bitmap drops to zero.
+    """
+
+    train = models.OneToOneField(
+        Train, on_delete=models.CASCADE, related_name="segment_map"
+    )
+    bitmaps = models.JSONField(default=dict)
+
+
+class Coach(BaseModel):
+    """One coach of a train's seat map.
+
+    layout has one character per berth, berth number n being layout[n - 1]
+    (see api/seatmap.py for the codes). occupied is a little-endian bitset
+    with bit n - 1 set while berth n is taken.
+    """
+
+    train = models.ForeignKey(Train, on_delete=models.CASCADE, related_name="coaches")
+    position = models.PositiveIntegerField()
+    coach_number = models.CharField(max_length=16)
+    layout = models.CharField(max_length=255)
+    occupied = models.BinaryField(default=b"")
+
+    class Meta(BaseModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=["train", "coach_number"], name="unique_coach_per_train"
+            )
+        ]
+        ordering = ["position"]
+
+
+class IdempotencyKey(BaseModel):
+    """Saved response of a request sent with an Idempotency-Key header.
+
+    The row is inserted before the request runs, so its unique key doubles as
+    the lock that keeps concurrent duplicates out; status_code stays null
+    until the response is saved. Rows are only honoured until expires_at,
+    a short lease while the request runs and the key's TTL once it is saved.
+    """
+
+    key = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    expires_at = models.DateTimeField(db_index=True)
+
+
+class ArchivedTrainRun(Inventory):
+    """A finished TrainRun with its final counters, moved out of the hot tables by archive_runs"""
+
+    id = models.UUIDField(primary_key=True, editable=False)
+    train_id = models.UUIDField(db_index=True)
+    journey_date = models.DateField(db_index=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+
+class ArchivedBooking(models.Model):
+    """A booking of a finished run, kept without foreign keys for reporting"""
+
+    id = models.UUIDField(primary_key=True, editable=False)
+    run_id = models.UUIDField(db_index=True)
+    train_id = models.UUIDField()
+    user_id = models.UUIDField(db_index=True)
+    booking_status = models.CharField(max_length=255, null=True, blank=True)
+    berth_type = models.CharField(max_length=255, null=True, blank=True)
+    booking_date = models.DateTimeField()
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    boarding_station_id = models.CharField(max_length=255, null=True, blank=True)
+    alighting_station_id = models.CharField(max_length=255, null=True, blank=True)
+    coach = models.CharField(max_length=16, null=True, blank=True)
+    berth_number = models.PositiveIntegerField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+
+class BookingEvent(models.Model):
+    """Append-only log of changes to the bookings of a train or of one of its runs.
+
+    Events of a train's undated bookings, and of each run, are numbered by a
+    gap-free sequence taken under that inventory's lock, so replaying them
+    in sequence order reproduces its counters. Rows are never updated or
+    deleted, and bookings, users and runs are referenced by raw id so the
+    history outlives them.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    train = models.ForeignKey(Train, on_delete=models.CASCADE, related_name="events")
+    run_id = models.UUIDField(null=True, blank=True)
+    sequence = models.PositiveBigIntegerField()
+    event_type = models.CharField(
+        max_length=32,
+        choices=[(event.value, event.name) for event in BookingEventType],
+    )
+    # Null for PLACE_RELEASED, whose booking is already gone
+    booking_id = models.UUIDField(null=True, blank=True)
+    user_id = models.UUIDField(null=True, blank=True)
+    booking_status = models.CharField(max_length=255, null=True, blank=True)
+    berth_type = models.CharField(max_length=255, null=True, blank=True)
+    # Status and berth a PROMOTED booking moved up from
+    previous_status = models.CharField(max_length=255, null=True, blank=True)
+    previous_berth_type = models.CharField(max_length=255, null=True, blank=True)
+    coach = models.CharField(max_length=16, null=True, blank=True)
+    berth_number = models.PositiveIntegerField(null=True, blank=True)
+    # A partial journey that joined a berth already off the counters
+    shared_berth = models.BooleanField(default=False)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["train", "sequence"],
+                condition=models.Q(run_id__isnull=True),
+                name="unique_train_event_sequence",
+            ),
+            models.UniqueConstraint(
+                fields=["run_id", "sequence"],
+                condition=models.Q(run_id__isnull=False),
+                name="unique_run_event_sequence",
+            ),
+        ]
+
+
+class ProjectionCheckpoint(models.Model):
+    """Last event sequence of a train or run a projection has applied"""
+
+    projection = models.CharField(max_length=64)
+    train = models.ForeignKey(
+        Train, on_delete=models.CASCADE, related_name="projection_checkpoints"
+    )
+    run_id = models.UUIDField(null=True, blank=True)
+    sequence = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["projection", "train"],
+                condition=models.Q(run_id__isnull=True),
+                name="unique_train_checkpoint",
+            ),
+            models.UniqueConstraint(
+                fields=["projection", "run_id"],
+                condition=models.Q(run_id__isnull=False),
+                name="unique_run_checkpoint",
+            ),
+        ]
+
+
+class BookingStats(models.Model):
+    """Reporting totals of a train or run, kept up to date from BookingEvent by api/projections.py"""
+
+    train = models.ForeignKey(
+        Train, on_delete=models.CASCADE, related_name="booking_stats"
+    )
+    run_id = models.UUIDField(null=True, blank=True)
+    bookings = models.PositiveIntegerField(default=0)
+    cancellations = models.PositiveIntegerField(default=0)
+    promotions = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["train"],
+                condition=models.Q(run_id__isnull=True),
+                name="unique_train_stats",
+            ),
+            models.UniqueConstraint(
+                fields=["run_id"],
+                condition=models.Q(run_id__isnull=False),
+                name="unique_run_stats",
+            ),
+        ]
+
+
+class CounterReconciliation(models.Model):
+    """One run of the reconcile_counters command; the next run starts from started_at"""
+
+    started_at = models.DateTimeField(db_index=True)
+    finished_at = models.DateTimeField()
+    checked = models.PositiveIntegerField()
+    drifted = models.PositiveIntegerField()
+    fixed = models.PositiveIntegerField()
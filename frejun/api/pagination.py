@@ -0,0 +1,121 @@
+import base64
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from .renderers import dumps
+from .serializer import values_serializer
+
+DEFAULT_ORDERING = ("created_at", "id")
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 2000
+
+
+def _value(row, field):
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+
+def encode_cursor(row, ordering):
+    """Opaque cursor pointing just past row"""
+    values = [str(_value(row, field.lstrip("-"))) for field in ordering]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, ordering, model):
+    """Values of ordering a cursor points past, parsed by model's fields"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise NotFound("Invalid cursor")
+    if (
+        not isinstance(values, list)
+        or len(values) != len(ordering)
+        or not all(isinstance(value, str) for value in values)
+    ):
+        raise NotFound("Invalid cursor")
+    try:
+        return [
+            model._meta.get_field(field.lstrip("-")).to_python(value)
+            for field, value in zip(ordering, values)
+        ]
+    except (ValidationError, ValueError, TypeError):
+        raise NotFound("Invalid cursor")
+
+
+def after(ordering, values):
+    """Filter selecting rows strictly after values in ordering, one index range scan"""
+    condition = Q()
+    for position, field in enumerate(ordering):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        step = Q(**{f"{name}__{lookup}": values[position]})
+        for previous, value in zip(ordering[:position], values):
+            step &= Q(**{previous.lstrip("-"): value})
+        condition |= step
+    return condition
+
+
+def page_size(request):
+    try:
+        limit = int(request.query_params.get("limit", settings.PAGE_SIZE))
+    except ValueError:
+        limit = settings.PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def paginate(request, queryset, ordering=DEFAULT_ORDERING):
+    """Return one keyset page of queryset and the cursor of the next page, if any"""
+    queryset = queryset.order_by(*ordering)
+    cursor = request.query_params.get("cursor")
+    if cursor:
+        queryset = queryset.filter(
+            after(ordering, decode_cursor(cursor, ordering, queryset.model))
+        )
+
+    limit = page_size(request)
+    rows = list(queryset[: limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1], ordering)
+
+
+def next_link(request, cursor):
+    if cursor is None:
+        return None
+    return replace_query_param(request.build_absolute_uri(), "cursor", cursor)
+
+
+def stream(queryset, serializer_class, ordering=DEFAULT_ORDERING):
+    """Stream every row of queryset as a JSON array with constant memory"""
+    reader = values_serializer(serializer_class)
+
+    def rows():
+        yield b"["
+        separator = b""
+        for row in reader.values(queryset.order_by(*ordering)).iterator(
+            chunk_size=STREAM_CHUNK_SIZE
+        ):
+            yield separator + dumps(reader.to_representation(row))
+            separator = b","
+        yield b"]"
+
+    return StreamingHttpResponse(rows(), content_type="application/json")
+
+
+def list_response(request, queryset, serializer_class, ordering=DEFAULT_ORDERING):
+    """Keyset-paginated list response, or a streamed one with ?stream=true.
+
+    Rows are read with .values() and mapped by a ValuesSerializer, giving the
+    same output as serializer_class without building model instances.
+    """
+    if request.query_params.get("stream") in ("1", "true"):
+        return stream(queryset, serializer_class, ordering)
+
+    reader = values_serializer(serializer_class)
+    rows, cursor = paginate(request, reader.values(queryset), ordering)
+    return Response({"next": next_link(request, cursor), "results": reader.many(rows)})
@@ -0,0 +1,128 @@
+import heapq
+import threading
+from functools import lru_cache
+from uuid import uuid4
+from django.db import DEFAULT_DB_ALIAS
+from .models import Route, Train, NetworkVersion
+
+# Journeys memoized per process, per version of the route network
+JOURNEY_CACHE_SIZE = 4096
+
+
+def network_version():
+    # Read from the primary like the graph itself, so a lagging replica can't
+    # label a newer graph with an older version
+    return (
+        NetworkVersion.objects.using(DEFAULT_DB_ALIAS)
+        .values_list("version", flat=True)
+        .first()
+    )
+
+
+def invalidate_network():
+    """Make every process reload the route graph once the current transaction commits"""
+    if not NetworkVersion.objects.update(version=uuid4()):
+        NetworkVersion.objects.create()
+
+
+def on_route_changed(sender, instance, **kwargs):
+    invalidate_network()
+
+
+def on_train_changed(sender, instance, update_fields=None, **kwargs):
+    # Only trains joining or leaving a route change the network; bookings
+    # save counters with update_fields and are skipped
+    if update_fields is None or "route" in update_fields:
+        invalidate_network()
+
+
+class JourneyPlanner:
+    """Finds connections between stations over the graph formed by routes.
+
+    A leg rides one route from any of its stops to any later stop. Journeys
+    are compared on the number of legs first and total distance second, a
+    lexicographic cost Dijkstra's algorithm handles as is. Routes only know
+    their total distance, so a leg over part of a route is charged its share
+    of the route's segments.
+    """
+
+    def __init__(self, routes):
+        # route id -> (stop codes, distance per segment)
+        self.routes = {}
+        # station code -> [(route id, position of the station on it)]
+        self.calls = {}
+        for route_id, stations, distance in routes:
+            if len(stations) < 2:
+                continue
+            self.routes[route_id] = stations, distance / (len(stations) - 1)
+            for position, code in enumerate(stations):
+                self.calls.setdefault(code, []).append((route_id, position))
+        self.plan = lru_cache(maxsize=JOURNEY_CACHE_SIZE)(self._plan)
+
+    @classmethod
+    def load(cls):
+        routes = []
+        # A route nothing runs on can't be travelled. The graph outlives the
+        # request, so it's read from the primary rather than a replica.
+        served = Route.objects.using(DEFAULT_DB_ALIAS).filter(
+            id__in=Train.objects.values("route_id")
+        )
+        for route in served.only(
+            "id",
+            "distance",
+            "source_station_id",
+            "destination_station_id",
+            "intermediate_stations",
+        ).iterator():
+            routes.append((route.id, route.stations(), route.distance))
+        return cls(routes)
+
+    def _plan(self, origin, destination):
+        """Best journey from origin to destination as a tuple of legs, or None.
+
+        Each leg is (route id, boarding code, alighting code, distance).
+        """
+        best = {origin: (0, 0.0)}
+        previous = {}
+        heap = [(0, 0.0, origin)]
+        while heap:
+            legs, distance, station = heapq.heappop(heap)
+            if station == destination:
+                break
+            if (legs, distance) > best[station]:
+                continue
+            for route_id, position in self.calls.get(station, ()):
+                stations, per_segment = self.routes[route_id]
+                for end in range(position + 1, len(stations)):
+                    cost = (legs + 1, distance + per_segment * (end - position))
+                    code = stations[end]
+                    if code not in best or cost < best[code]:
+                        best[code] = cost
+                        previous[code] = (station, route_id, cost[1] - distance)
+                        heapq.heappush(heap, (*cost, code))
+        else:
+            return None
+
+        journey = []
+        station = destination
+        while station != origin:
+            boarding, route_id, distance = previous[station]
+            journey.append((route_id, boarding, station, distance))
+            station = boarding
+        return tuple(reversed(journey))
+
+
+_planner = None
+_planner_version = None
+_planner_lock = threading.Lock()
+
+
+def planner():
+    """The planner for the current route network, reloaded after route changes"""
+    global _planner, _planner_version
+    version = network_version()
+    with _planner_lock:
+        if _planner is None or _planner_version != version:
+            _planner = JourneyPlanner.load()
+            _planner_version = version
+        return _planner
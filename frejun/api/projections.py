@@ -0,0 +1,198 @@
+from abc import ABC, abstractmethod
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .enum import BookingEventType, BookingStatus, BerthType
+from .models import (
+    Train,
+    TrainRun,
+    BookingEvent,
+    BookingStats,
+    ProjectionCheckpoint,
+)
+from .services import BookingService, BERTH_COUNTERS, COUNTER_UPDATE_FIELDS
+
+
+def stream(train_id, run_id=None):
+    """Lookup selecting the events of a train's undated bookings, or of one run"""
+    if run_id:
+        return {"run_id": run_id}
+    return {"train_id": train_id, "run_id": None}
+
+
+def take(counters, booking_status, berth_type, sign=1):
+    """Take a place of booking_status off counters, or give it back with sign=-1"""
+    if booking_status == BookingStatus.CONFIRMED.value:
+        berth = BerthType(berth_type) if berth_type else None
+        # Children under 5 hold no berth
+        if berth in BERTH_COUNTERS:
+            counters["available_confirmed_berths"] -= sign
+            counters[BERTH_COUNTERS[berth]] -= sign
+    elif booking_status == BookingStatus.RAC.value:
+        counters["available_rac_spots"] -= sign
+    elif booking_status == BookingStatus.WAITING_LIST.value:
+        counters["waiting_list_count"] += sign
+
+
+def apply_counters(counters, event):
+    """Apply one event to a dict of availability counters"""
+    event_type = BookingEventType(event.event_type)
+    if event_type == BookingEventType.BOOKED:
+        if not event.shared_berth:
+            take(counters, event.booking_status, event.berth_type)
+    elif event_type == BookingEventType.CANCELLED:
+        # Freed berths and RAC spots stay off the counters until PLACE_RELEASED
+        if event.booking_status == BookingStatus.WAITING_LIST.value:
+            take(counters, event.booking_status, None, sign=-1)
+    elif event_type == BookingEventType.HELD:
+        take(counters, event.booking_status, event.berth_type)
+    elif event_type in (
+        BookingEventType.PLACE_RELEASED,
+        BookingEventType.HOLD_RELEASED,
+    ):
+        take(counters, event.booking_status, event.berth_type, sign=-1)
+    elif event_type == BookingEventType.PROMOTED:
+        take(counters, event.previous_status, event.previous_berth_type, sign=-1)
+        take(counters, event.booking_status, event.berth_type)
+
+
+def replay_counters(inventory):
+    """Counters of a Train or TrainRun rebuilt from its full event log.
+
+    Only exact for inventories whose every booking went through
+    BookingService after the log was introduced.
+    """
+    counters = BookingService.expected_counters(inventory, {})
+    if isinstance(inventory, TrainRun):
+        lookup = stream(inventory.train_id, inventory.id)
+    else:
+        lookup = stream(inventory.id)
+    for event in BookingEvent.objects.filter(**lookup).order_by("sequence").iterator():
+        apply_counters(counters, event)
+    return counters
+
+
+class Projection(ABC):
+    """A read model kept up to date from BookingEvent, one train or run at a time.
+
+    Progress is saved per train and run in ProjectionCheckpoint, in the same
+    transaction as the read model, so catching up can stop and resume at any
+    point without applying an event twice.
+    """
+
+    name = None
+
+    @abstractmethod
+    def apply(self, train_id, run_id, events):
+        """Fold one train's or run's new events into the read model"""
+
+
+class BookingStatsProjection(Projection):
+    name = "booking_stats"
+
+    def apply(self, train_id, run_id, events):
+        changes = {"bookings": 0, "cancellations": 0, "promotions": 0, "revenue": 0}
+        for event in events:
+            if event.event_type == BookingEventType.BOOKED.value:
+                changes["bookings"] += 1
+                changes["revenue"] += event.amount or 0
+            elif event.event_type == BookingEventType.CANCELLED.value:
+                changes["cancellations"] += 1
+                changes["revenue"] -= event.amount or 0
+            elif event.event_type == BookingEventType.PROMOTED.value:
+                changes["promotions"] += 1
+
+        stats, _ = BookingStats.objects.get_or_create(train_id=train_id, run_id=run_id)
+        BookingStats.objects.filter(id=stats.id).update(
+            **{field: F(field) + change for field, change in changes.items()}
+        )
+
+
+PROJECTIONS = [BookingStatsProjection()]
+
+
+def stale_streams(projection):
+    """(train id, run id) of every train and run with events projection hasn't applied"""
+    checkpoints = ProjectionCheckpoint.objects.filter(projection=projection.name)
+    trains = (
+        Train.objects.annotate(
+            applied=Coalesce(
+                Subquery(
+                    checkpoints.filter(train=OuterRef("id"), run_id=None).values(
+                        "sequence"
+                    )[:1]
+                ),
+                0,
+            )
+        )
+        .filter(event_sequence__gt=F("applied"))
+        .values_list("id", flat=True)
+    )
+    runs = (
+        TrainRun.objects.annotate(
+            applied=Coalesce(
+                Subquery(
+                    checkpoints.filter(run_id=OuterRef("id")).values("sequence")[:1]
+                ),
+                0,
+            )
+        )
+        .filter(event_sequence__gt=F("applied"))
+        .values_list("train_id", "id")
+    )
+    return [(train_id, None) for train_id in trains] + list(runs)
+
+
+def catch_up(projection, train_id, run_id=None, batch_size=1000):
+    """Apply the next batch_size unapplied events of a train or run, returning how many"""
+    with transaction.atomic():
+        checkpoint, _ = ProjectionCheckpoint.objects.select_for_update().get_or_create(
+            projection=projection.name, train_id=train_id, run_id=run_id
+        )
+        events = list(
+            BookingEvent.objects.filter(
+                sequence__gt=checkpoint.sequence, **stream(train_id, run_id)
+            ).order_by("sequence")[:batch_size]
+        )
+        if events:
+            projection.apply(train_id, run_id, events)
+            checkpoint.sequence = events[-1].sequence
+            checkpoint.save(update_fields=["sequence"])
+        return len(events)
+
+
+def project(projections=PROJECTIONS, batch_size=1000):
+    """Bring every projection up to date with the log, returning events applied"""
+    applied = 0
+    for projection in projections:
+        for train_id, run_id in stale_streams(projection):
+            while True:
+                count = catch_up(projection, train_id, run_id, batch_size)
+                applied += count
+                if count < batch_size:
+                    break
+    return applied
+
+
+@transaction.atomic
+def rebuild_counters(inventory, fix=True):
+    """Compare a Train's or TrainRun's counters with those replayed from its log.
+
+    Returns the {field: (stored, replayed)} that differ; with fix, the
+    replayed counters are written back under the inventory's lock.
+    """
+    if isinstance(inventory, TrainRun):
+        inventory = BookingService.lock_run("rebuild_counters", id=inventory.id)
+    else:
+        inventory = BookingService.lock_train(inventory.id, "rebuild_counters")
+    replayed = replay_counters(inventory)
+    drift = {
+        field: (getattr(inventory, field), value)
+        for field, value in replayed.items()
+        if getattr(inventory, field) != value
+    }
+    if drift and fix:
+        for field, value in replayed.items():
+            setattr(inventory, field, value)
+        inventory.save(update_fields=COUNTER_UPDATE_FIELDS)
+    return drift
@@ -0,0 +1,72 @@
+import logging
+import threading
+from django.conf import settings
+from django.db import close_old_connections
+from .services import BookingService
+
+logger = logging.getLogger(__name__)
+
+
+class PromotionWorker:
+    """Drains the PromotionTask outbox written by cancellations.
+
+    Each pass walks the trains with pending tasks and applies up to
+    batch_size of them per train in one transaction, oldest first. Run it in
+    process with start(), or from the process_promotions command.
+    """
+
+    def __init__(self, batch_size=None, poll_interval=None):
+        self.batch_size = batch_size or settings.PROMOTION_BATCH_SIZE
+        self.poll_interval = poll_interval or settings.PROMOTION_POLL_INTERVAL
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        """Process one batch for every train with pending tasks, returning the count"""
+        processed = 0
+        for train_id, run_id in list(BookingService.pending_promotions()):
+            try:
+                processed += BookingService.process_promotions(
+                    train_id, self.batch_size, run_id
+                )
+            except Exception:
+                # Tasks stay in the outbox and are retried on the next pass
+                logger.exception(
+                    "Promotions for train %s run %s failed", train_id, run_id
+                )
+        return processed
+
+    def drain(self):
+        """Process passes until the outbox is empty, returning the count"""
+        processed = 0
+        while True:
+            count = self.run_once()
+            if not count:
+                return processed
+            processed += count
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.drain()
+            finally:
+                close_old_connections()
+            self._stopped.wait(self.poll_interval)
+
+    def start(self):
+        """Start polling the outbox in a background thread"""
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="promotion-worker", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+
+worker = PromotionWorker()
@@ -0,0 +1,48 @@
+import json
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# Output matches DRF's JSONRenderer with its default COMPACT_JSON and
+# UNICODE_JSON settings; datetimes and decimals not already rendered by a
+# serializer go through DRF's encoder either way.
+_encoder = JSONEncoder()
+
+
+def dumps(data):
+    """Serialize data to compact UTF-8 JSON bytes, with orjson when installed"""
+    if orjson is not None:
+        output = orjson.dumps(
+            data,
+            default=_encoder.default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        # DRF escapes these two so the output is also valid JavaScript
+        if b"\xe2\x80\xa8" in output or b"\xe2\x80\xa9" in output:
+            output = output.replace(b"\xe2\x80\xa8", b"\\u2028")
+            output = output.replace(b"\xe2\x80\xa9", b"\\u2029")
+        return output
+    output = json.dumps(
+        data,
+        cls=JSONEncoder,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    )
+    return output.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029").encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer using orjson for compact responses"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        # Indented output, as asked for by the browsable API, stays with DRF
+        if self.get_indent(accepted_media_type or "", renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
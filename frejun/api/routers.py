@@ -0,0 +1,47 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Replica the current request reads from, set by replica_middleware; None
+# reads from the primary. A ContextVar follows async requests into the
+# threads sync_to_async runs their queries on.
+_read_alias = ContextVar("read_alias", default=None)
+
+
+def choose_replica():
+    """A replica alias picked by DATABASE_REPLICAS weight, or None without replicas"""
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas:
+        return None
+    return random.choices(list(replicas), weights=list(replicas.values()))[0]
+
+
+@contextmanager
+def reading_from(alias):
+    """Send reads in this block to alias, or to the primary when alias is None"""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """Reads go to the replica chosen for the request, everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        # Transactions, BookingService's locked reads among them, stay on the
+        # connection they write through
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
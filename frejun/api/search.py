@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from .models import Route, RouteStop, Train
+
+
+def route_stops(route):
+    return [
+        RouteStop(route=route, station_code=str(code), position=position)
+        for position, code in enumerate(route.stations())
+    ]
+
+
+@transaction.atomic
+def index_routes(routes):
+    """Rebuild the RouteStop rows of routes after they were created or changed"""
+    RouteStop.objects.filter(route__in=[route.id for route in routes]).delete()
+    RouteStop.objects.bulk_create(
+        [stop for route in routes for stop in route_stops(route)]
+    )
+
+
+def routes_between(boarding_station, alighting_station):
+    """Ids of routes calling at boarding_station and later at alighting_station"""
+    boarding = RouteStop.objects.filter(
+        route=OuterRef("route"), station_code=boarding_station
+    ).values("position")[:1]
+    return RouteStop.objects.filter(
+        station_code=alighting_station, position__gt=Subquery(boarding)
+    ).values("route")
+
+
+def trains_between(boarding_station, alighting_station):
+    """Trains running from boarding_station to alighting_station, as one indexed query"""
+    return Train.objects.filter(
+        route__in=routes_between(boarding_station, alighting_station)
+    ).select_related("route", "segment_map")
+
+
+def on_route_saved(sender, instance, **kwargs):
+    index_routes([instance])
@@ -0,0 +1,185 @@
+from functools import lru_cache
+from django.utils import timezone
+from .enum import BookingStatus, BerthType
+from .models import Booking, Coach
+
+# Layout codes, one character per berth
+BERTH_CODES = {
+    BerthType.LOWER: "L",
+    BerthType.MIDDLE: "M",
+    BerthType.UPPER: "U",
+    BerthType.SIDE_LOWER: "S",
+    BerthType.SIDE_UPPER: "s",
+}
+CODE_BERTHS = {code: berth_type for berth_type, code in BERTH_CODES.items()}
+
+# Berth order within a bay of a sleeper coach
+BAY = "LMULMUSs"
+COACH_SIZE = 72
+
+
+def build_layouts(train):
+    """Coach layouts holding a train's berths, filled bay by bay"""
+    base, extra = divmod(train.total_confirmed_berths, 3)
+    remaining = {
+        "L": base + (extra > 0),
+        "M": base + (extra > 1),
+        "U": base,
+        "S": train.total_rac_berths,
+        "s": train.total_rac_berths,
+    }
+    berths = []
+    while any(remaining.values()):
+        for code in BAY:
+            if remaining[code]:
+                remaining[code] -= 1
+                berths.append(code)
+    layout = "".join(berths)
+    return [
+        layout[start : start + COACH_SIZE]
+        for start in range(0, len(layout), COACH_SIZE)
+    ]
+
+
+@lru_cache(maxsize=256)
+def type_mask(layout, code):
+    """Bitset of the berths in layout with the given code"""
+    mask = 0
+    for index, berth in enumerate(layout):
+        if berth == code:
+            mask |= 1 << index
+    return mask
+
+
+def occupancy(coach):
+    return int.from_bytes(coach.occupied, "little")
+
+
+def set_occupancy(coach, bits):
+    coach.occupied = bits.to_bytes((len(coach.layout) + 7) // 8, "little")
+
+
+def berths(coach):
+    """Every berth of a coach with its type and whether it is taken"""
+    bits = occupancy(coach)
+    return [
+        {
+            "berth_number": index + 1,
+            "berth_type": CODE_BERTHS[code].value,
+            "occupied": bool(bits >> index & 1),
+        }
+        for index, code in enumerate(coach.layout)
+    ]
+
+
+class SeatMap:
+    """Assigns concrete berths from a train's coaches.
+
+    Coaches are fetched once and written back by save(), so a whole batch of
+    bookings costs one read and one write per touched coach. Trains without
+    coaches simply get no berth numbers.
+    """
+
+    def __init__(self, train, coaches=None):
+        self.train = train
+        self._coaches = coaches
+        self._dirty = {}
+
+    @property
+    def coaches(self):
+        if self._coaches is None:
+            self._coaches = list(Coach.objects.filter(train_id=self.train.id))
+        return self._coaches
+
+    def claim(self, berth_type):
+        """Take the first free berth of a type, returning (coach, berth_number)"""
+        code = BERTH_CODES[berth_type]
+        for coach in self.coaches:
+            bits = occupancy(coach)
+            free = type_mask(coach.layout, code) & ~bits
+            if free:
+                lowest = free & -free
+                set_occupancy(coach, bits | lowest)
+                self._dirty[coach.id] = coach
+                return coach.coach_number, lowest.bit_length()
+        return None, None
+
+    def claim_atomic(self, berth_type):
+        """Take the first free berth of a type without holding the train lock.
+
+        Each claim is written straight away as a compare-and-swap on the
+        coach's occupancy; a lost race re-reads the coaches and tries again.
+        """
+        code = BERTH_CODES[berth_type]
+        while True:
+            for coach in self.coaches:
+                bits = occupancy(coach)
+                free = type_mask(coach.layout, code) & ~bits
+                if free:
+                    break
+            else:
+                return None, None
+
+            lowest = free & -free
+            previous = bytes(coach.occupied)
+            set_occupancy(coach, bits | lowest)
+            if Coach.objects.filter(id=coach.id, occupied=previous).update(
+                occupied=coach.occupied, updated_at=timezone.now()
+            ):
+                return coach.coach_number, lowest.bit_length()
+            self._coaches = None
+
+    def release(self, coach_number, berth_number):
+        for coach in self.coaches:
+            if coach.coach_number == coach_number:
+                set_occupancy(coach, occupancy(coach) & ~(1 << (berth_number - 1)))
+                self._dirty[coach.id] = coach
+                return
+
+    def assign(self, booking):
+        """Give a confirmed booking on a real berth its coach and berth number"""
+        if booking.booking_status != BookingStatus.CONFIRMED.value:
+            return
+        berth_type = BerthType(booking.berth_type)
+        if berth_type in (BerthType.LOWER, BerthType.MIDDLE, BerthType.UPPER):
+            booking.coach, booking.berth_number = self.claim(berth_type)
+
+    def save(self):
+        for coach in self._dirty.values():
+            coach.save(update_fields=["occupied", "updated_at"])
+        self._dirty = {}
+
+    @staticmethod
+    def build(train):
+        """Create a train's coaches and seat its confirmed bookings"""
+        Coach.objects.bulk_create(
+            Coach(
+                train=train,
+                position=position,
+                coach_number=f"S{position}",
+                layout=layout,
+                occupied=bytes((len(layout) + 7) // 8),
+            )
+            for position, layout in enumerate(build_layouts(train), start=1)
+        )
+
+        seats = SeatMap(train)
+        bookings = list(
+            Booking.objects.filter(
+                train=train,
+                booking_status=BookingStatus.CONFIRMED.value,
+                berth_number__isnull=True,
+            ).order_by("booking_date", "id")
+        )
+        # Partial journeys sharing a segment slot share its berth
+        shared = {}
+        for booking in bookings:
+            slot = (booking.berth_type, booking.segment_berth)
+            if booking.segment_berth is not None and slot in shared:
+                booking.coach, booking.berth_number = shared[slot]
+                continue
+            seats.assign(booking)
+            shared[slot] = booking.coach, booking.berth_number
+        Booking.objects.bulk_update(bookings, ["coach", "berth_number"])
+        seats.save()
+        return seats.coaches
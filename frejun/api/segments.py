@@ -0,0 +1,33 @@
+class InvalidJourney(ValueError):
+    pass
+
+
+def full_mask(route):
+    """Bitmask covering every segment of a route"""
+    return (1 << (len(route.stations()) - 1)) - 1
+
+
+def journey_mask(route, boarding_station=None, alighting_station=None):
+    """Bitmask of the route segments travelled between two station codes.
+
+    Bit i stands for the segment between stop i and stop i + 1. A missing
+    boarding or alighting station means the start or end of the route.
+    """
+    stations = route.stations()
+    try:
+        start = stations.index(boarding_station) if boarding_station else 0
+        end = (
+            stations.index(alighting_station)
+            if alighting_station
+            else len(stations) - 1
+        )
+    except ValueError:
+        raise InvalidJourney("Station is not on this train's route")
+    if start >= end:
+        raise InvalidJourney("Alighting station must come after boarding station")
+    return (1 << end) - (1 << start)
+
+
+def shared_berths(bitmaps, mask):
+    """Indexes of partly occupied berths that are free over every segment in mask"""
+    return [index for index, bits in enumerate(bitmaps) if bits and not bits & mask]
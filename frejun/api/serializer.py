@@ -1,5 +1,11 @@
+from functools import lru_cache
+from django.conf import settings
 from rest_framework import serializers
-from api.models import User, Station, Route, Train, Booking
+from rest_framework.relations import RelatedField
+from django.db import transaction
+from api.enum import BookingStatus, BerthType
+from api.models import User, Station, Route, Train, TrainRun, Booking, SeatHold
+from api.seatmap import SeatMap
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -30,9 +36,171 @@ class TrainSerializer(serializers.ModelSerializer):
     class Meta:
         model = Train
         fields = "__all__"
+        read_only_fields = ["event_sequence"]
+
+    @transaction.atomic
+    def create(self, validated_data):
+        train = Train.objects.create(**validated_data)
+        SeatMap.build(train)
+        return train
+
+
+class TrainRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TrainRun
+        fields = "__all__"
+        read_only_fields = ["event_sequence"]
+
+
+class OpenRunsSerializer(serializers.Serializer):
+    dates = serializers.ListField(
+        child=serializers.DateField(), allow_empty=False, max_length=366
+    )
 
 
 class BookingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
         fields = "__all__"
+
+
+class UserBookingSerializer(serializers.ModelSerializer):
+    train_name = serializers.CharField(source="train.train_name", read_only=True)
+    train_number = serializers.CharField(source="train.train_number", read_only=True)
+    route_source = serializers.CharField(
+        source="train.route.source_station.station_name", read_only=True
+    )
+    route_destination = serializers.CharField(
+        source="train.route.destination_station.station_name", read_only=True
+    )
+
+    class Meta:
+        model = Booking
+        fields = "__all__"
+
+
+class SeatHoldSerializer(serializers.ModelSerializer):
+    ttl = serializers.IntegerField(
+        write_only=True,
+        required=False,
+        min_value=1,
+        max_value=settings.SEAT_HOLD_MAX_TTL,
+    )
+
+    class Meta:
+        model = SeatHold
+        fields = "__all__"
+        read_only_fields = [
+            "booking_status",
+            "berth_type",
+            "coach",
+            "berth_number",
+            "expires_at",
+        ]
+
+
+class GroupBookingSerializer(serializers.Serializer):
+    train = serializers.PrimaryKeyRelatedField(queryset=Train.objects.all())
+    users = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=settings.GROUP_BOOKING_MAX_SIZE,
+    )
+
+    def validate_users(self, value):
+        duplicates = sorted({str(pk) for pk in value if value.count(pk) > 1})
+        if duplicates:
+            raise serializers.ValidationError(
+                f"Duplicate user ids: {', '.join(duplicates)}"
+            )
+        users = User.objects.in_bulk(value)
+        missing = [str(pk) for pk in value if pk not in users]
+        if missing:
+            raise serializers.ValidationError(f"Invalid user ids: {', '.join(missing)}")
+        return [users[pk] for pk in value]
+
+
+class FareQuoteSerializer(serializers.Serializer):
+    trains = serializers.ListField(
+        child=serializers.UUIDField(), allow_empty=False, max_length=1000
+    )
+    ages = serializers.ListField(
+        child=serializers.IntegerField(min_value=0), allow_empty=False, max_length=1000
+    )
+    booking_status = serializers.ChoiceField(
+        choices=[status.value for status in BookingStatus],
+        default=BookingStatus.CONFIRMED.value,
+    )
+    berth_type = serializers.ChoiceField(
+        choices=[berth.value for berth in BerthType], required=False, allow_null=True
+    )
+
+    def validate_trains(self, value):
+        distances = dict(
+            Train.objects.filter(id__in=value).values_list("id", "route__distance")
+        )
+        missing = [str(pk) for pk in value if pk not in distances]
+        if missing:
+            raise serializers.ValidationError(
+                f"Invalid train ids: {', '.join(missing)}"
+            )
+        return [(pk, distances[pk]) for pk in value]
+
+    def validate(self, data):
+        # Only children under 5 travel without a berth
+        if data.get("berth_type") == BerthType.NO_BERTH.value and any(
+            age >= 5 for age in data["ages"]
+        ):
+            raise serializers.ValidationError(
+                {"berth_type": "NO_BERTH can only be quoted for children under 5."}
+            )
+        return data
+
+
+# Fields whose representation is the raw column value
+PASSTHROUGH_FIELDS = (
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.IntegerField,
+    serializers.BooleanField,
+    serializers.JSONField,
+)
+
+
+class ValuesSerializer:
+    """Read-only twin of a ModelSerializer working on .values() rows.
+
+    Field objects are built once per serializer class instead of once per
+    instance, and only fields whose representation differs from the column
+    value (ids, datetimes, decimals) are converted, so lists skip model
+    instances entirely while matching the ModelSerializer's output.
+    """
+
+    def __init__(self, serializer_class):
+        self.columns = []
+        for name, field in serializer_class().fields.items():
+            # Related fields render the primary key .values() already returns
+            if isinstance(field, (RelatedField,) + PASSTHROUGH_FIELDS):
+                convert = None
+            else:
+                convert = field.to_representation
+            self.columns.append((name, field.source.replace(".", "__"), convert))
+        self.lookups = [lookup for _, lookup, _ in self.columns]
+
+    def values(self, queryset):
+        return queryset.values(*self.lookups)
+
+    def to_representation(self, row):
+        data = {}
+        for name, lookup, convert in self.columns:
+            value = row[lookup]
+            data[name] = value if convert is None or value is None else convert(value)
+        return data
+
+    def many(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
+@lru_cache(maxsize=None)
+def values_serializer(serializer_class):
+    return ValuesSerializer(serializer_class)
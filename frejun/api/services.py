@@ -1,6 +1,53 @@
+from collections import defaultdict
+from datetime import timedelta
+from types import SimpleNamespace
+from django.conf import settings
 from django.db import transaction
-from .models import Train, Booking, User
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from .models import (
+    Train,
+    TrainRun,
+    Booking,
+    User,
+    SegmentMap,
+    PromotionTask,
+    SeatHold,
+)
 from .enum import BookingStatus, BerthType
+from . import events
+from .fares import fare, journey_distance
+from .metrics import TRAIN_LOCK_WAIT, timed
+from .seatmap import SeatMap
+from .segments import full_mask, journey_mask, shared_berths
+
+# Train columns holding availability counters
+COUNTER_FIELDS = (
+    "available_confirmed_berths",
+    "available_rac_spots",
+    "waiting_list_count",
+    "lower_berths_available",
+    "middle_berths_available",
+    "upper_berths_available",
+    "side_lower_berths_available",
+    "side_upper_berths_available",
+)
+
+# Columns written back when a locked train's counters or event log change
+COUNTER_UPDATE_FIELDS = COUNTER_FIELDS + ("event_sequence", "updated_at")
+
+# Counter decremented when a confirmed berth of each type is handed out
+BERTH_COUNTERS = {
+    BerthType.LOWER: "lower_berths_available",
+    BerthType.MIDDLE: "middle_berths_available",
+    BerthType.UPPER: "upper_berths_available",
+}
+
+MAX_WAITING_LIST = 10
+
+
+class NoTicketsAvailable(Exception):
+    pass
 
 
 class BookingService:
@@ -29,116 +76,853 @@ class BookingService:
         return None
 
     @staticmethod
+    def assign_booking(train, user):
+        """Pick booking status and berth for a user, updating the counters on train in place"""
+        # Children under 5 travel without a berth
+        if user.age < 5:
+            return BookingStatus.CONFIRMED, BerthType.NO_BERTH
+
+        # Try confirmed booking first
+        if train.available_confirmed_berths > 0:
+            berth_type = BookingService.allocate_berth(train, user)
+            if berth_type:
+                train.available_confirmed_berths -= 1
+                counter = BERTH_COUNTERS[berth_type]
+                setattr(train, counter, getattr(train, counter) - 1)
+                return BookingStatus.CONFIRMED, berth_type
+
+        # Try RAC if confirmed not available
+        if train.available_rac_spots > 0:
+            train.available_rac_spots -= 1
+            return BookingStatus.RAC, BerthType.SIDE_LOWER
+
+        # Try waiting list if RAC not available
+        if train.waiting_list_count < MAX_WAITING_LIST:
+            train.waiting_list_count += 1
+            return BookingStatus.WAITING_LIST, None
+
+        raise NoTicketsAvailable("No tickets available")
+
+    @staticmethod
+    def lock_train(train_id, operation):
+        """Fetch a train under select_for_update, recording how long the lock took"""
+        with TRAIN_LOCK_WAIT.time(operation=operation):
+            return (
+                Train.objects.select_related("route")
+                .select_for_update(of=("self",))
+                .get(id=train_id)
+            )
+
+    @staticmethod
+    def lock_run(operation, **lookup):
+        """Fetch a TrainRun under select_for_update, recording how long the lock took"""
+        with TRAIN_LOCK_WAIT.time(operation=operation):
+            return (
+                TrainRun.objects.select_related("train__route")
+                .select_for_update(of=("self",))
+                .get(**lookup)
+            )
+
+    @staticmethod
+    def bookings_of(inventory):
+        """Bookings drawing on a Train's own counters, or on a TrainRun's"""
+        if isinstance(inventory, TrainRun):
+            return Booking.objects.filter(run=inventory)
+        return Booking.objects.filter(train=inventory, run__isnull=True)
+
+    @staticmethod
+    def tasks_of(inventory):
+        """PromotionTasks holding places off a Train's own counters, or a TrainRun's"""
+        if isinstance(inventory, TrainRun):
+            return PromotionTask.objects.filter(run=inventory)
+        return PromotionTask.objects.filter(train=inventory, run__isnull=True)
+
+    @staticmethod
+    def seats_of(inventory):
+        # Coaches belong to the train, so dated runs are sold without seat numbers
+        if isinstance(inventory, TrainRun):
+            return SeatMap(inventory.train, coaches=[])
+        return SeatMap(inventory)
+
+    @staticmethod
+    def booking_amount(user, distance, booking_status, berth_type):
+        """Fare charged for a booking over distance km (see api/fares.py)"""
+        return fare(distance, user.age, booking_status, berth_type)
+
+    @staticmethod
+    def place_counts(key, bookings, *held):
+        """Places taken per inventory, as {key value: {(status, berth_type): count}}.
+
+        Partial journeys sharing a berth take it once. held are querysets of
+        PromotionTasks and SeatHolds, whose places stay taken until they are
+        processed, converted or expire. Each queryset is counted in one
+        aggregate grouped on key, "train_id" or "run_id", however many
+        inventories it covers.
+        """
+        counts = defaultdict(dict)
+        rows = bookings.values(key, "booking_status", "berth_type").annotate(
+            whole=Count("id", filter=Q(segment_berth__isnull=True)),
+            shared=Count("segment_berth", distinct=True),
+        )
+        for row in rows:
+            counts[row[key]][row["booking_status"], row["berth_type"]] = (
+                row["whole"] + row["shared"]
+            )
+        for queryset in held:
+            rows = queryset.values(key, "booking_status", "berth_type").annotate(
+                count=Count("id")
+            )
+            for row in rows:
+                places = counts[row[key]]
+                place = row["booking_status"], row["berth_type"]
+                places[place] = places.get(place, 0) + row["count"]
+        return counts
+
+    @staticmethod
+    def recount(train):
+        """Recompute a train's (or TrainRun's) availability counters from its Booking rows"""
+        if isinstance(train, TrainRun):
+            counts = BookingService.place_counts(
+                "run_id",
+                BookingService.bookings_of(train),
+                BookingService.tasks_of(train),
+            )
+        else:
+            counts = BookingService.place_counts(
+                "train_id",
+                BookingService.bookings_of(train),
+                BookingService.tasks_of(train),
+                SeatHold.objects.filter(train=train),
+            )
+        return BookingService.expected_counters(train, counts.get(train.id, {}))
+
+    @staticmethod
+    @transaction.atomic
+    def reset_counters(inventory):
+        """Rewrite a Train's or TrainRun's counters from its bookings under its lock.
+
+        Returns the {field: (stored, recounted)} that differed.
+        """
+        if isinstance(inventory, TrainRun):
+            inventory = BookingService.lock_run("reset_counters", id=inventory.id)
+        else:
+            inventory = BookingService.lock_train(inventory.id, "reset_counters")
+        counters = BookingService.recount(inventory)
+        drift = {
+            field: (getattr(inventory, field), value)
+            for field, value in counters.items()
+            if getattr(inventory, field) != value
+        }
+        if drift:
+            for field, value in counters.items():
+                setattr(inventory, field, value)
+            inventory.save(update_fields=COUNTER_UPDATE_FIELDS)
+        return drift
+
+    @staticmethod
+    def expected_counters(train, booked):
+        """Counters a train should hold given booking counts keyed by (status, berth_type)"""
+        # Confirmed berths are split evenly across lower, middle and upper
+        base, extra = divmod(train.total_confirmed_berths, 3)
+        capacity = {
+            BerthType.LOWER: base + (extra > 0),
+            BerthType.MIDDLE: base + (extra > 1),
+            BerthType.UPPER: base,
+        }
+        confirmed = BookingStatus.CONFIRMED.value
+        counters = {
+            counter: capacity[berth_type] - booked.get((confirmed, berth_type.value), 0)
+            for berth_type, counter in BERTH_COUNTERS.items()
+        }
+        counters["available_confirmed_berths"] = train.total_confirmed_berths - sum(
+            count
+            for (status, berth_type), count in booked.items()
+            if status == confirmed and berth_type != BerthType.NO_BERTH.value
+        )
+        counters["available_rac_spots"] = train.total_rac_berths * 2 - sum(
+            count
+            for (status, _), count in booked.items()
+            if status == BookingStatus.RAC.value
+        )
+        counters["waiting_list_count"] = sum(
+            count
+            for (status, _), count in booked.items()
+            if status == BookingStatus.WAITING_LIST.value
+        )
+        counters["side_lower_berths_available"] = train.total_rac_berths
+        counters["side_upper_berths_available"] = train.total_rac_berths
+        return counters
+
+    @staticmethod
+    def segment_availability(train, bitmaps, mask):
+        """Confirmed berths per type free over the segments in mask.
+
+        Counts untouched berths still on the train's counters plus berths
+        already lent to partial journeys that leave those segments free.
+        """
+        fresh = train.available_confirmed_berths > 0
+        return {
+            berth_type: (getattr(train, counter) if fresh else 0)
+            + len(shared_berths(bitmaps.get(berth_type.value, []), mask))
+            for berth_type, counter in BERTH_COUNTERS.items()
+        }
+
+    @staticmethod
+    def availability(train, bitmaps, boarding_station=None, alighting_station=None):
+        """Availability of a train between two station codes, defaulting to the whole route"""
+        boarding_station = boarding_station or train.route.source_station_id
+        alighting_station = alighting_station or train.route.destination_station_id
+        available = BookingService.segment_availability(
+            train,
+            bitmaps,
+            journey_mask(train.route, boarding_station, alighting_station),
+        )
+        data = {"train": train.id, "from": boarding_station, "to": alighting_station}
+        data.update(
+            {
+                counter: available[berth_type]
+                for berth_type, counter in BERTH_COUNTERS.items()
+            }
+        )
+        data["available_confirmed_berths"] = sum(available.values())
+        data["available_rac_spots"] = train.available_rac_spots
+        data["waiting_list_count"] = train.waiting_list_count
+        return data
+
+    @staticmethod
+    def claim_segment_berth(train, user, mask):
+        """Claim a confirmed berth over the segments in mask for a partial journey.
+
+        Returns (berth_type, slot, shared) or None when no berth is free over
+        mask. A berth is only taken off the train's counters when no already
+        shared berth of the chosen type fits the journey.
+        """
+        segment_map, _ = SegmentMap.objects.get_or_create(train=train)
+        available = BookingService.segment_availability(
+            train, segment_map.bitmaps, mask
+        )
+        berth_type = BookingService.allocate_berth(
+            SimpleNamespace(
+                **{
+                    counter: available[berth_type]
+                    for berth_type, counter in BERTH_COUNTERS.items()
+                }
+            ),
+            user,
+        )
+        if berth_type is None:
+            return None
+
+        slots = segment_map.bitmaps.setdefault(berth_type.value, [])
+        shared = shared_berths(slots, mask)
+        if shared:
+            slot = shared[0]
+        else:
+            train.available_confirmed_berths -= 1
+            counter = BERTH_COUNTERS[berth_type]
+            setattr(train, counter, getattr(train, counter) - 1)
+            slot = next((i for i, bits in enumerate(slots) if not bits), len(slots))
+            if slot == len(slots):
+                slots.append(0)
+
+        slots[slot] |= mask
+        segment_map.save(update_fields=["bitmaps", "updated_at"])
+        return berth_type, slot, bool(shared)
+
+    @staticmethod
+    def release_segment_berth(train, booking):
+        """Free a partial journey's segments, returning True once its berth is empty"""
+        segment_map = SegmentMap.objects.get(train=train)
+        slots = segment_map.bitmaps[booking.berth_type]
+        slots[booking.segment_berth] &= ~journey_mask(
+            train.route, booking.boarding_station_id, booking.alighting_station_id
+        )
+        segment_map.save(update_fields=["bitmaps", "updated_at"])
+        return not slots[booking.segment_berth]
+
+    @staticmethod
+    @timed("create_booking")
     @transaction.atomic
-    def create_booking(user, train):
-        """Create a booking with proper status and berth allocation"""
+    def create_booking(user, train, boarding_station=None, alighting_station=None):
+        """Create a booking with proper status and berth allocation.
+
+        boarding_station and alighting_station are station codes on the train's
+        route; leaving them out books the whole route.
+        """
 
         # Lock the train record for atomic updates
-        train = Train.objects.select_for_update().get(id=train.id)
+        train = BookingService.lock_train(train.id, "create_booking")
+        booking = Booking(
+            user=user,
+            train=train,
+            boarding_station_id=boarding_station,
+            alighting_station_id=alighting_station,
+        )
+
+        mask = claimed = None
+        if boarding_station or alighting_station:
+            mask = journey_mask(train.route, boarding_station, alighting_station)
+            if mask != full_mask(train.route) and user.age >= 5:
+                claimed = BookingService.claim_segment_berth(train, user, mask)
+
+        if claimed:
+            booking_status = BookingStatus.CONFIRMED
+            berth_type, booking.segment_berth, shared = claimed
+        else:
+            booking_status, berth_type = BookingService.assign_booking(train, user)
+        booking.booking_status = booking_status.value
+        booking.berth_type = berth_type.value if berth_type else None
+        booking.total_amount = BookingService.booking_amount(
+            user, journey_distance(train.route, mask), booking_status, berth_type
+        )
+
+        # Partial journeys sharing a berth share its seat
+        seats = SeatMap(train)
+        sibling = None
+        if claimed:
+            sibling = (
+                Booking.objects.filter(
+                    train=train,
+                    berth_type=booking.berth_type,
+                    segment_berth=booking.segment_berth,
+                )
+                .values_list("coach", "berth_number")
+                .first()
+            )
+        if sibling:
+            booking.coach, booking.berth_number = sibling
+        else:
+            seats.assign(booking)
+        booking.save()
+        seats.save()
+        events.record(train, events.booked(booking, bool(claimed) and shared))
+        train.save(update_fields=COUNTER_UPDATE_FIELDS)
+        return booking
+
+    @staticmethod
+    def claim_counters(train_id, guard, **changes):
+        """Apply changes to a train's counters only while guard holds, in one UPDATE"""
+        return (
+            Train.objects.filter(id=train_id, **guard).update(
+                updated_at=timezone.now(), **changes
+            )
+            == 1
+        )
 
-        # Handle children under 5
+    @staticmethod
+    def claim_booking(train_id, user):
+        """Pick status and berth with guarded UPDATEs instead of a locked read.
+
+        Each claim only succeeds if its counter is still above zero (or the
+        waiting list below its limit) when the row is written, so concurrent
+        callers can never overbook; a lost claim falls through to the next
+        berth type or tier. Follows the same rules as assign_booking.
+        """
         if user.age < 5:
-            booking = Booking.objects.create(
+            return BookingStatus.CONFIRMED, BerthType.NO_BERTH
+
+        # allocate_berth hands every adult lower, then middle, then upper
+        for berth_type, counter in BERTH_COUNTERS.items():
+            if BookingService.claim_counters(
+                train_id,
+                {"available_confirmed_berths__gt": 0, f"{counter}__gt": 0},
+                available_confirmed_berths=F("available_confirmed_berths") - 1,
+                **{counter: F(counter) - 1},
+            ):
+                return BookingStatus.CONFIRMED, berth_type
+
+        if BookingService.claim_counters(
+            train_id,
+            {"available_rac_spots__gt": 0},
+            available_rac_spots=F("available_rac_spots") - 1,
+        ):
+            return BookingStatus.RAC, BerthType.SIDE_LOWER
+
+        if BookingService.claim_counters(
+            train_id,
+            {"waiting_list_count__lt": MAX_WAITING_LIST},
+            waiting_list_count=F("waiting_list_count") + 1,
+        ):
+            return BookingStatus.WAITING_LIST, None
+
+        raise NoTicketsAvailable("No tickets available")
+
+    @staticmethod
+    @timed("create_booking_optimistic")
+    @transaction.atomic
+    def create_booking_optimistic(user, train):
+        """Create a whole-route booking without locking the train row up front.
+
+        Capacity is claimed by claim_booking and the seat by a compare-and-swap
+        on its coach, so bookings on one train run side by side and the train
+        row is only held for the rest of this short transaction.
+        """
+        booking_status, berth_type = BookingService.claim_booking(train.id, user)
+        booking = Booking(
+            user=user,
+            train=train,
+            booking_status=booking_status.value,
+            berth_type=berth_type.value if berth_type else None,
+            total_amount=BookingService.booking_amount(
+                user, train.route.distance, booking_status, berth_type
+            ),
+        )
+        if berth_type in BERTH_COUNTERS:
+            booking.coach, booking.berth_number = SeatMap(train).claim_atomic(
+                berth_type
+            )
+        booking.save()
+
+        # Children under 5 claim no counter, so nothing has written the train
+        # row yet; lock it before reading the sequence to append after
+        log = events.booked(booking)
+        last_sequence = (
+            Train.objects.select_for_update()
+            .values_list("event_sequence", flat=True)
+            .get(id=train.id)
+        )
+        Train.objects.filter(id=train.id).update(
+            event_sequence=events.append(log, last_sequence),
+            updated_at=timezone.now(),
+        )
+        return booking
+
+    @staticmethod
+    def open_runs(train, journey_dates):
+        """Put a train on sale for journey_dates, skipping dates already open"""
+        counters = BookingService.expected_counters(train, {})
+        TrainRun.objects.bulk_create(
+            [
+                TrainRun(
+                    train=train,
+                    journey_date=journey_date,
+                    total_confirmed_berths=train.total_confirmed_berths,
+                    total_rac_berths=train.total_rac_berths,
+                    **counters,
+                )
+                for journey_date in journey_dates
+            ],
+            ignore_conflicts=True,
+        )
+
+    @staticmethod
+    @timed("create_run_booking")
+    @transaction.atomic
+    def create_run_booking(user, train, journey_date):
+        """Book the whole route of a train on one journey date.
+
+        Only that date's TrainRun is locked and counted against, so dates
+        never contend with each other or with the train's undated bookings.
+        Raises TrainRun.DoesNotExist if the train isn't on sale that day.
+        """
+        run = BookingService.lock_run(
+            "create_run_booking", train_id=train.id, journey_date=journey_date
+        )
+        booking_status, berth_type = BookingService.assign_booking(run, user)
+        booking = Booking.objects.create(
+            user=user,
+            train_id=train.id,
+            run=run,
+            booking_status=booking_status.value,
+            berth_type=berth_type.value if berth_type else None,
+            total_amount=BookingService.booking_amount(
+                user, run.train.route.distance, booking_status, berth_type
+            ),
+        )
+        events.record(run, events.booked(booking))
+        run.save(update_fields=COUNTER_UPDATE_FIELDS)
+        return booking
+
+    @staticmethod
+    def group_priority(user):
+        """Order in which group members are allocated so lower berth priorities hold"""
+        if user.age >= 60:
+            return 0
+        if user.gender == "Female":
+            return 1
+        return 2
+
+    @staticmethod
+    @timed("create_group_booking")
+    @transaction.atomic
+    def create_group_booking(users, train):
+        """Book several passengers on one train under a single lock and bulk insert.
+
+        The whole group is booked or none of it is. Bookings come back in the
+        order users were given.
+        """
+        train = BookingService.lock_train(train.id, "create_group_booking")
+
+        bookings = {}
+        for index in sorted(
+            range(len(users)), key=lambda i: BookingService.group_priority(users[i])
+        ):
+            user = users[index]
+            booking_status, berth_type = BookingService.assign_booking(train, user)
+            bookings[index] = Booking(
                 user=user,
                 train=train,
-                booking_status=BookingStatus.CONFIRMED.value,
-                berth_type=BerthType.NO_BERTH.value,
-                total_amount=0,
+                booking_status=booking_status.value,
+                berth_type=berth_type.value if berth_type else None,
+                total_amount=BookingService.booking_amount(
+                    user, train.route.distance, booking_status, berth_type
+                ),
             )
-            return booking
 
-        # Try confirmed booking first
-        if train.available_confirmed_berths > 0:
-            berth_type = BookingService.allocate_berth(train, user)
-            if berth_type:
-                booking = Booking.objects.create(
+        bookings = [bookings[index] for index in range(len(users))]
+        seats = SeatMap(train)
+        for booking in bookings:
+            seats.assign(booking)
+        Booking.objects.bulk_create(bookings)
+        seats.save()
+        events.record(
+            train, [entry for booking in bookings for entry in events.booked(booking)]
+        )
+        Train.objects.filter(id=train.id).update(
+            **{
+                field: getattr(train, field)
+                for field in (*COUNTER_FIELDS, "event_sequence")
+            },
+            updated_at=timezone.now(),
+        )
+        return bookings
+
+    @staticmethod
+    @timed("create_booking_batch")
+    @transaction.atomic
+    def create_booking_batch(users, train):
+        """Book independent requests for one train under a single lock and commit.
+
+        Users are allocated strictly in the order given. Returns one entry per
+        user: the Booking, or the NoTicketsAvailable raised for that user.
+        """
+        train = BookingService.lock_train(train.id, "create_booking_batch")
+
+        results = []
+        for user in users:
+            try:
+                booking_status, berth_type = BookingService.assign_booking(train, user)
+            except NoTicketsAvailable as e:
+                results.append(e)
+                continue
+            results.append(
+                Booking(
                     user=user,
                     train=train,
-                    booking_status=BookingStatus.CONFIRMED.value,
-                    berth_type=berth_type.value,
-                    total_amount=1000,  # Set appropriate amount
+                    booking_status=booking_status.value,
+                    berth_type=berth_type.value if berth_type else None,
+                    total_amount=BookingService.booking_amount(
+                        user, train.route.distance, booking_status, berth_type
+                    ),
                 )
+            )
+
+        bookings = [result for result in results if isinstance(result, Booking)]
+        if bookings:
+            seats = SeatMap(train)
+            for booking in bookings:
+                seats.assign(booking)
+            Booking.objects.bulk_create(bookings)
+            seats.save()
+            events.record(
+                train,
+                [entry for booking in bookings for entry in events.booked(booking)],
+            )
+            Train.objects.filter(id=train.id).update(
+                **{
+                    field: getattr(train, field)
+                    for field in (*COUNTER_FIELDS, "event_sequence")
+                },
+                updated_at=timezone.now(),
+            )
+        return results
+
+    @staticmethod
+    def promotion_queue(train, booking_status):
+        """Bookings of a train (or TrainRun) waiting in a tier, oldest first"""
+        return (
+            BookingService.bookings_of(train)
+            .filter(booking_status=booking_status.value)
+            .order_by("booking_date", "id")
+        )
 
-                # Update berth availability
+    @staticmethod
+    def fill_vacancies(train, seats=None):
+        """Promote RAC passengers onto free berths and waiting list passengers into free RAC spots.
+
+        Passengers move strictly in booking order. The number of statements is
+        fixed no matter how many bookings a train has or how many move: one
+        fetch plus one bulk UPDATE for RAC to confirmed, and one fetch plus one
+        UPDATE for waiting list to RAC. train, or the TrainRun passed in its
+        place, must be locked by the caller, who also saves its counters and
+        seats and records the PROMOTED events returned.
+        """
+        now = timezone.now()
+        seats = seats or BookingService.seats_of(train)
+        log = []
+
+        if train.available_confirmed_berths > 0:
+            promoted = []
+            queue = BookingService.promotion_queue(
+                train, BookingStatus.RAC
+            ).select_related("user")
+            for rac_booking in queue[: train.available_confirmed_berths]:
+                berth_type = BookingService.allocate_berth(train, rac_booking.user)
+                if berth_type is None:
+                    break
                 train.available_confirmed_berths -= 1
-                if berth_type == BerthType.LOWER:
-                    train.lower_berths_available -= 1
-                elif berth_type == BerthType.MIDDLE:
-                    train.middle_berths_available -= 1
-                elif berth_type == BerthType.UPPER:
-                    train.upper_berths_available -= 1
+                counter = BERTH_COUNTERS[berth_type]
+                setattr(train, counter, getattr(train, counter) - 1)
+                train.available_rac_spots += 1
 
-                train.save()
-                return booking
+                rac_booking.booking_status = BookingStatus.CONFIRMED.value
+                rac_booking.berth_type = berth_type.value
+                rac_booking.updated_at = now
+                seats.assign(rac_booking)
+                promoted.append(rac_booking)
+                log.extend(
+                    events.promoted(
+                        rac_booking,
+                        BookingStatus.RAC.value,
+                        BerthType.SIDE_LOWER.value,
+                    )
+                )
 
-        # Try RAC if confirmed not available
-        if train.available_rac_spots > 0:
-            booking = Booking.objects.create(
-                user=user,
-                train=train,
+            Booking.objects.bulk_update(
+                promoted,
+                ["booking_status", "berth_type", "coach", "berth_number", "updated_at"],
+            )
+
+        vacancies = min(train.available_rac_spots, train.waiting_list_count)
+        if vacancies > 0:
+            waiting = list(
+                BookingService.promotion_queue(train, BookingStatus.WAITING_LIST).only(
+                    "id", "user_id", "train_id", "run_id", "coach", "berth_number"
+                )[:vacancies]
+            )
+            Booking.objects.filter(id__in=[booking.id for booking in waiting]).update(
                 booking_status=BookingStatus.RAC.value,
                 berth_type=BerthType.SIDE_LOWER.value,
-                total_amount=1000,
+                updated_at=now,
             )
-            train.available_rac_spots -= 1
-            train.save()
-            return booking
+            train.available_rac_spots -= len(waiting)
+            train.waiting_list_count -= len(waiting)
+            for booking in waiting:
+                booking.booking_status = BookingStatus.RAC.value
+                booking.berth_type = BerthType.SIDE_LOWER.value
+                log.extend(
+                    events.promoted(booking, BookingStatus.WAITING_LIST.value, None)
+                )
+        return log
 
-        # Try waiting list if RAC not available
-        if train.waiting_list_count < 10:
-            booking = Booking.objects.create(
-                user=user,
-                train=train,
-                booking_status=BookingStatus.WAITING_LIST.value,
-                berth_type=None,
-                total_amount=1000,
+    @staticmethod
+    @timed("cancel_booking")
+    @transaction.atomic
+    def cancel_booking(booking):
+        """Cancel a booking, leaving promotion of RAC/WL passengers to process_promotions.
+
+        A freed berth or RAC spot is recorded as a PromotionTask rather than
+        put back on the counters, so the cancellation holds the train lock
+        only for a few single-row writes and never for the promotion cascade.
+        """
+        if booking.run_id:
+            inventory = BookingService.lock_run("cancel_booking", id=booking.run_id)
+        else:
+            inventory = BookingService.lock_train(booking.train_id, "cancel_booking")
+        seats = BookingService.seats_of(inventory)
+
+        freed = None
+        if booking.booking_status == BookingStatus.CONFIRMED.value:
+            berth_type = BerthType(booking.berth_type)
+            # A shared berth stays taken while other partial journeys still use it
+            if berth_type in BERTH_COUNTERS and (
+                booking.segment_berth is None
+                or BookingService.release_segment_berth(inventory, booking)
+            ):
+                freed = berth_type
+                if booking.berth_number:
+                    seats.release(booking.coach, booking.berth_number)
+        elif booking.booking_status == BookingStatus.RAC.value:
+            freed = BerthType.SIDE_LOWER
+
+        cancellation = events.cancelled(booking)
+        booking.delete()
+        seats.save()
+        events.record(inventory, [cancellation])
+        if freed:
+            PromotionTask.objects.create(
+                train_id=booking.train_id,
+                run_id=booking.run_id,
+                booking_status=booking.booking_status,
+                berth_type=freed.value,
             )
-            train.waiting_list_count += 1
-            train.save()
-            return booking
+        elif booking.booking_status == BookingStatus.WAITING_LIST.value:
+            # Leaving the waiting list frees nothing to promote into
+            inventory.waiting_list_count -= 1
+        inventory.save(update_fields=COUNTER_UPDATE_FIELDS)
+
+    @staticmethod
+    def release_place(train, task):
+        """Put the berth or RAC spot a PromotionTask or SeatHold holds back on the train's counters"""
+        if task.booking_status == BookingStatus.CONFIRMED.value:
+            berth_type = BerthType(task.berth_type)
+            # Children under 5 hold no berth
+            if berth_type in BERTH_COUNTERS:
+                train.available_confirmed_berths += 1
+                counter = BERTH_COUNTERS[berth_type]
+                setattr(train, counter, getattr(train, counter) + 1)
+        elif task.booking_status == BookingStatus.RAC.value:
+            train.available_rac_spots += 1
+
+    @staticmethod
+    def pending_promotions():
+        """(train id, run id) of every inventory with promotion tasks waiting"""
+        return PromotionTask.objects.values_list("train_id", "run_id").distinct()
+
+    @staticmethod
+    @timed("process_promotions")
+    @transaction.atomic
+    def process_promotions(train_id, limit=None, run_id=None):
+        """Apply the oldest pending PromotionTasks of a train or one of its runs.
+
+        Freed places go back on the counters and fill_vacancies hands them to
+        RAC and waiting list passengers in booking order. Tasks are deleted in
+        the same transaction under the train (or run) lock, so each is applied
+        exactly once however many workers run. Returns how many were applied.
+        """
+        if run_id:
+            inventory = BookingService.lock_run("process_promotions", id=run_id)
+        else:
+            inventory = BookingService.lock_train(train_id, "process_promotions")
+        tasks = list(
+            PromotionTask.objects.filter(train_id=train_id, run_id=run_id).order_by(
+                "created_at", "id"
+            )[:limit]
+        )
+        if not tasks:
+            return 0
 
-        raise Exception("No tickets available")
+        for task in tasks:
+            BookingService.release_place(inventory, task)
+        seats = BookingService.seats_of(inventory)
+        log = [events.place_released(task) for task in tasks]
+        log.extend(BookingService.fill_vacancies(inventory, seats))
+        events.record(inventory, log)
+        seats.save()
+        inventory.save(update_fields=COUNTER_UPDATE_FIELDS)
+        PromotionTask.objects.filter(id__in=[task.id for task in tasks]).delete()
+        return len(tasks)
 
     @staticmethod
+    @timed("hold_seat")
     @transaction.atomic
-    def cancel_booking(booking):
-        """Handle booking cancellation and promotion of RAC/WL passengers"""
-        train = Train.objects.select_for_update().get(id=booking.train.id)
+    def hold_seat(user, train, ttl=None):
+        """Take the place user would be booked into off the counters for ttl seconds.
 
-        if booking.booking_status == BookingStatus.CONFIRMED.value:
-            # Update berth availability
-            train.available_confirmed_berths += 1
-            if booking.berth_type == BerthType.LOWER.value:
-                train.lower_berths_available += 1
-            elif booking.berth_type == BerthType.MIDDLE.value:
-                train.middle_berths_available += 1
-            elif booking.berth_type == BerthType.UPPER.value:
-                train.upper_berths_available += 1
-
-            # Promote RAC passenger if any
-            rac_booking = Booking.objects.filter(
-                train=train, booking_status=BookingStatus.RAC.value
-            ).first()
-
-            if rac_booking:
-                rac_booking.booking_status = BookingStatus.CONFIRMED.value
-                rac_booking.berth_type = BookingService.allocate_berth(
-                    train, rac_booking.user
-                ).value
-                rac_booking.save()
+        Nobody else can book the place while it is held. convert_hold turns
+        the hold into that booking; otherwise expire_holds puts the place back
+        once the hold expires. Raises NoTicketsAvailable when only the waiting
+        list is left, since there is nothing to hold.
+        """
+        train = BookingService.lock_train(train.id, "hold_seat")
+        booking_status, berth_type = BookingService.assign_booking(train, user)
+        if booking_status == BookingStatus.WAITING_LIST:
+            raise NoTicketsAvailable("No seats available to hold")
 
-                train.available_rac_spots += 1
+        hold = SeatHold(
+            user=user,
+            train=train,
+            booking_status=booking_status.value,
+            berth_type=berth_type.value if berth_type else None,
+            expires_at=timezone.now()
+            + timedelta(seconds=ttl or settings.SEAT_HOLD_TTL),
+        )
+        seats = SeatMap(train)
+        seats.assign(hold)
+        hold.save()
+        seats.save()
+        events.record(train, [events.held(hold)])
+        train.save(update_fields=COUNTER_UPDATE_FIELDS)
+        return hold
 
-                # Promote waiting list passenger to RAC if any
-                wl_booking = Booking.objects.filter(
-                    train=train, booking_status=BookingStatus.WAITING_LIST.value
-                ).first()
+    @staticmethod
+    @timed("convert_hold")
+    @transaction.atomic
+    def convert_hold(hold):
+        """Book the place a live hold keeps, on the same berth and seat.
 
-                if wl_booking:
-                    wl_booking.booking_status = BookingStatus.RAC.value
-                    wl_booking.berth_type = BerthType.SIDE_LOWER.value
-                    wl_booking.save()
-                    train.waiting_list_count -= 1
+        Raises SeatHold.DoesNotExist once the hold has expired or is gone.
+        """
+        train = BookingService.lock_train(hold.train_id, "convert_hold")
+        hold = SeatHold.objects.select_related("user").get(
+            id=hold.id, expires_at__gt=timezone.now()
+        )
+        booking = Booking.objects.create(
+            user=hold.user,
+            train=train,
+            booking_status=hold.booking_status,
+            berth_type=hold.berth_type,
+            coach=hold.coach,
+            berth_number=hold.berth_number,
+            total_amount=BookingService.booking_amount(
+                hold.user,
+                train.route.distance,
+                BookingStatus(hold.booking_status),
+                BerthType(hold.berth_type) if hold.berth_type else None,
+            ),
+        )
+        log = [events.hold_released(hold), *events.booked(booking)]
+        hold.delete()
+        events.record(train, log)
+        train.save(update_fields=COUNTER_UPDATE_FIELDS)
+        return booking
 
-        train.save()
-        booking.delete()
+    @staticmethod
+    def release_holds(train, holds):
+        """Put held places back on a locked train and promote RAC and waiting list passengers into them"""
+        seats = SeatMap(train)
+        log = []
+        for hold in holds:
+            BookingService.release_place(train, hold)
+            if hold.berth_number:
+                seats.release(hold.coach, hold.berth_number)
+            log.append(events.hold_released(hold))
+        SeatHold.objects.filter(id__in=[hold.id for hold in holds]).delete()
+        log.extend(BookingService.fill_vacancies(train, seats))
+        events.record(train, log)
+        seats.save()
+        train.save(update_fields=COUNTER_UPDATE_FIELDS)
+
+    @staticmethod
+    @timed("release_hold")
+    @transaction.atomic
+    def release_hold(hold):
+        """Give up a hold before it expires. Raises SeatHold.DoesNotExist if it is gone."""
+        train = BookingService.lock_train(hold.train_id, "release_hold")
+        BookingService.release_holds(train, [SeatHold.objects.get(id=hold.id)])
+
+    @staticmethod
+    def due_holds(now=None):
+        """Ids of trains with expired holds, read from the expiry index"""
+        return (
+            SeatHold.objects.filter(expires_at__lte=now or timezone.now())
+            .values_list("train_id", flat=True)
+            .distinct()
+        )
+
+    @staticmethod
+    @timed("expire_holds")
+    @transaction.atomic
+    def expire_holds(train_id, now=None):
+        """Release every expired hold of a train in one transaction, returning how many"""
+        expired = SeatHold.objects.filter(
+            train_id=train_id, expires_at__lte=now or timezone.now()
+        )
+        # Holds already converted or released cost one index lookup, no lock
+        if not expired.exists():
+            return 0
+        train = BookingService.lock_train(train_id, "expire_holds")
+        holds = list(expired)
+        if holds:
+            BookingService.release_holds(train, holds)
+        return len(holds)
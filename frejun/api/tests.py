@@ -1,10 +1,65 @@
-from api.models import Booking
-from api.services import BookingService
+import base64
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+import os
+import tempfile
+import threading
+from io import StringIO
+from time import monotonic, sleep, time
+from unittest import mock
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+from api.models import (
+    User,
+    Booking,
+    Station,
+    Route,
+    Train,
+    TrainRun,
+    Coach,
+    IdempotencyKey,
+    ArchivedTrainRun,
+    ArchivedBooking,
+    BookingEvent,
+    BookingStats,
+    SeatHold,
+    RouteStop,
+)
+from api.fares import fare
+from api.renderers import FastJSONRenderer
+from api.serializer import (
+    UserSerializer,
+    StationSerializer,
+    RouteSerializer,
+    TrainSerializer,
+    BookingSerializer,
+    UserBookingSerializer,
+    values_serializer,
+)
+from rest_framework.renderers import JSONRenderer
+from api.services import BookingService, NoTicketsAvailable
+from api import booking
+from api.batching import BookingBatcher, BookingRequest
+from api.planner import JourneyPlanner, invalidate_network, network_version
+from api.holds import HoldExpiryScheduler
+from api.projections import project, replay_counters
+from api.middleware import PRIMARY_UNTIL_COOKIE, replica_middleware
+from api import idempotency
+from api.metrics import REQUESTS
+from api.routers import ReplicaRouter, choose_replica, reading_from
+from api.views import load_train_snapshots
 from rest_framework.test import APIClient
-from rest_framework.test import APITestCase
-from api.enum import BookingStatus, BerthType
+from rest_framework.test import APITestCase, APITransactionTestCase
+from api.enum import BookingStatus, BerthType, BookingEventType
 from api.factory import (
     UserFactory,
+    StationFactory,
+    RouteFactory,
     TrainFactory,
 )
 
@@ -254,3 +309,1391 @@ class CoreFrejunConstraintsTest(BaseAPITestCase):
         self.assertEqual(self.train.available_confirmed_berths, 0)
         self.assertEqual(self.train.available_rac_spots, 0)
         self.assertEqual(self.train.waiting_list_count, 10)
+
+
+class GroupBookingViewTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.train = TrainFactory.create()
+
+    def test_group_booking(self):
+        """Test that a group is booked in one request with priorities kept"""
+        # Leave a single lower berth
+        for _ in range(20):
+            BookingService.create_booking(UserFactory.create(), self.train)
+
+        users = [
+            UserFactory.create(age=30, gender="Male"),
+            UserFactory.create(age=4),
+            UserFactory.create(age=70, gender="Male"),
+        ]
+        response = self.client.post(
+            "/api/v1/booking/group/",
+            {"train": str(self.train.id), "users": [str(user.id) for user in users]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [booking["berth_type"] for booking in response.data],
+            [BerthType.MIDDLE.value, BerthType.NO_BERTH.value, BerthType.LOWER.value],
+        )
+
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.available_confirmed_berths, 41)
+        self.assertEqual(self.train.lower_berths_available, 0)
+        self.assertEqual(self.train.middle_berths_available, 20)
+
+    def test_group_booking_is_all_or_nothing(self):
+        """Test that a group that does not fit is rejected as a whole"""
+        self.train.available_confirmed_berths = 0
+        self.train.available_rac_spots = 0
+        self.train.waiting_list_count = 9
+        self.train.save()
+
+        users = UserFactory.create_batch(2)
+        response = self.client.post(
+            "/api/v1/booking/group/",
+            {"train": str(self.train.id), "users": [str(user.id) for user in users]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Booking.objects.filter(train=self.train).exists())
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.waiting_list_count, 9)
+
+    def test_group_booking_rejects_duplicates_and_large_groups(self):
+        """Test that a passenger can't be listed twice and groups are capped in size"""
+        user = UserFactory.create()
+        response = self.client.post(
+            "/api/v1/booking/group/",
+            {"train": str(self.train.id), "users": [str(user.id)] * 3},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Duplicate user ids", str(response.data["users"]))
+
+        users = UserFactory.create_batch(settings.GROUP_BOOKING_MAX_SIZE + 1)
+        response = self.client.post(
+            "/api/v1/booking/group/",
+            {"train": str(self.train.id), "users": [str(user.id) for user in users]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Booking.objects.filter(train=self.train).exists())
+
+
+class SegmentAvailabilityTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.stations = StationFactory.create_batch(4)
+        codes = [station.station_code for station in self.stations]
+        route = RouteFactory.create(
+            source_station=self.stations[0],
+            destination_station=self.stations[3],
+            intermediate_stations=codes[1:3],
+        )
+        self.train = TrainFactory.create(route=route)
+        self.codes = codes
+
+    def availability(self, boarding, alighting):
+        response = self.client.get(
+            f"/api/v1/train/{self.train.id}/availability/",
+            {"from": boarding, "to": alighting},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_berth_resold_for_later_segment(self):
+        """Test that a berth freed midway is resold for the rest of the trip"""
+        a, b, c, d = self.codes
+        first = BookingService.create_booking(UserFactory.create(), self.train, a, b)
+        second = BookingService.create_booking(UserFactory.create(), self.train, c, d)
+
+        self.assertEqual(first.berth_type, BerthType.LOWER.value)
+        self.assertEqual(first.segment_berth, second.segment_berth)
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.lower_berths_available, 20)
+
+        self.assertEqual(self.availability(a, b)["lower_berths_available"], 20)
+        self.assertEqual(self.availability(b, c)["lower_berths_available"], 21)
+        self.assertEqual(self.availability(a, d)["lower_berths_available"], 20)
+
+        # The berth only returns to the train once both journeys are cancelled
+        BookingService.cancel_booking(first)
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.lower_berths_available, 20)
+        BookingService.cancel_booking(second)
+        BookingService.process_promotions(self.train.id)
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.lower_berths_available, 21)
+        self.assertEqual(self.train.available_confirmed_berths, 63)
+
+    def test_invalid_journey(self):
+        """Test that stations must be on the route and in travel order"""
+        response = self.client.get(
+            f"/api/v1/train/{self.train.id}/availability/",
+            {"from": self.codes[2], "to": self.codes[1]},
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class CancellationPromotionTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.train = TrainFactory.create()
+        self.confirmed = [
+            BookingService.create_booking(UserFactory.create(), self.train)
+            for _ in range(63)
+        ]
+        self.rac = [
+            BookingService.create_booking(UserFactory.create(), self.train)
+            for _ in range(18)
+        ]
+        self.waiting = [
+            BookingService.create_booking(UserFactory.create(), self.train)
+            for _ in range(3)
+        ]
+
+    def test_confirmed_cancellation_promotes_in_booking_order(self):
+        """Test that the oldest RAC and waiting list passengers move up"""
+        cancelled = self.confirmed[5]
+        BookingService.cancel_booking(cancelled)
+        self.assertEqual(BookingService.process_promotions(self.train.id), 1)
+
+        promoted = Booking.objects.get(id=self.rac[0].id)
+        self.assertEqual(promoted.booking_status, BookingStatus.CONFIRMED.value)
+        self.assertEqual(promoted.berth_type, cancelled.berth_type)
+        self.assertEqual(
+            Booking.objects.get(id=self.waiting[0].id).booking_status,
+            BookingStatus.RAC.value,
+        )
+        self.assertEqual(
+            Booking.objects.get(id=self.waiting[1].id).booking_status,
+            BookingStatus.WAITING_LIST.value,
+        )
+
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.available_confirmed_berths, 0)
+        self.assertEqual(self.train.available_rac_spots, 0)
+        self.assertEqual(self.train.waiting_list_count, 2)
+        self.assertEqual(BookingService.recount(self.train)["waiting_list_count"], 2)
+
+    def test_rac_cancellation_promotes_waiting_list(self):
+        """Test that a freed RAC spot goes to the oldest waiting list passenger"""
+        BookingService.cancel_booking(self.rac[3])
+        call_command("process_promotions", stdout=StringIO())
+
+        self.assertEqual(
+            Booking.objects.get(id=self.waiting[0].id).booking_status,
+            BookingStatus.RAC.value,
+        )
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.available_rac_spots, 0)
+        self.assertEqual(self.train.waiting_list_count, 2)
+
+    def test_cancellation_query_count_is_fixed(self):
+        """Test that cancelling only frees the berth and promotion uses a fixed number of statements"""
+        # Savepoint pair, lock, delete, event insert, outbox insert, save
+        with self.assertNumQueries(7):
+            BookingService.cancel_booking(self.confirmed[0])
+        # Savepoint pair, lock, tasks, RAC fetch, coaches, RAC update,
+        # WL fetch and update, event insert, save, task delete
+        with self.assertNumQueries(12):
+            BookingService.process_promotions(self.train.id)
+
+    def test_freed_berth_waits_for_promotion(self):
+        """Test that a new booking can't take a freed berth before RAC passengers get it"""
+        BookingService.cancel_booking(self.confirmed[0])
+        newcomer = BookingService.create_booking(UserFactory.create(), self.train)
+        self.assertEqual(newcomer.booking_status, BookingStatus.WAITING_LIST.value)
+
+        self.assertEqual(BookingService.process_promotions(self.train.id), 1)
+        # Already applied tasks are gone, so running again changes nothing
+        self.assertEqual(BookingService.process_promotions(self.train.id), 0)
+        self.assertEqual(
+            Booking.objects.get(id=self.rac[0].id).booking_status,
+            BookingStatus.CONFIRMED.value,
+        )
+        self.train.refresh_from_db()
+        counters = BookingService.recount(self.train)
+        self.assertEqual(
+            counters, {field: getattr(self.train, field) for field in counters}
+        )
+
+
+class KeysetPaginationTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = UserFactory.create_batch(5)
+
+    def test_pages_follow_next_cursor(self):
+        """Test that following next links visits every row exactly once"""
+        seen = []
+        url = "/api/v1/user/?limit=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            seen.extend(user["id"] for user in response.data["results"])
+            url = response.data["next"]
+
+        self.assertEqual(sorted(seen), sorted(str(user.id) for user in self.users))
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/v1/user/", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+        # Well-formed, but not a (created_at, id) pair
+        for values in (["x", "y"], [1, 2], [["x"], {}]):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            response = self.client.get("/api/v1/user/", {"cursor": cursor})
+            self.assertEqual(response.status_code, 404)
+
+    def test_streamed_list(self):
+        """Test that the streaming mode returns the whole table as one array"""
+        StationFactory.create_batch(3)
+        response = self.client.get("/api/v1/station/", {"stream": "true"})
+        self.assertEqual(response.status_code, 200)
+        stations = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(len(stations), 3)
+
+
+class TrainAvailabilityCacheTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.train = TrainFactory.create()
+        self.url = f"/api/v1/train/{self.train.id}/"
+
+    def test_snapshot_served_from_cache(self):
+        """Test that a cached snapshot costs one read of the train's version"""
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data["available_confirmed_berths"], 63)
+
+    def test_booking_invalidates_snapshot(self):
+        """Test that a completed booking is visible on the next read"""
+        self.client.get(self.url)
+        # No on-commit callbacks run, as for a write committed by another process
+        booking = BookingService.create_booking(UserFactory.create(), self.train)
+        self.assertEqual(
+            self.client.get(self.url).data["available_confirmed_berths"], 62
+        )
+
+        booked = self.client.get("/api/v1/train/").data["results"][0]
+        BookingService.cancel_booking(booking)
+        cancelled = self.client.get("/api/v1/train/").data["results"][0]
+        self.assertNotEqual(cancelled["updated_at"], booked["updated_at"])
+        BookingService.process_promotions(self.train.id)
+        self.assertEqual(
+            self.client.get(self.url).data["available_confirmed_berths"], 63
+        )
+
+    def test_list_reads_ids_only(self):
+        self.client.get("/api/v1/train/")
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/v1/train/")
+        self.assertEqual(response.data["results"][0]["id"], str(self.train.id))
+
+
+class AsyncBookingViewTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = UserFactory.create()
+        self.train = TrainFactory.create()
+
+    def test_async_availability(self):
+        response = self.client.get(f"/api/v1/async/train/{self.train.id}/availability/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["available_confirmed_berths"], 63)
+
+    def test_async_booking_and_cancellation(self):
+        response = self.client.post(
+            "/api/v1/async/booking/",
+            {"user": str(self.user.id), "train": str(self.train.id)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        booking_id = response.json()["id"]
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.available_confirmed_berths, 62)
+
+        response = self.client.post(f"/api/v1/async/booking/{booking_id}/cancel/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Booking.objects.filter(id=booking_id).exists())
+        BookingService.process_promotions(self.train.id)
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.available_confirmed_berths, 63)
+
+    def test_async_booking_rejects_unknown_train(self):
+        response = self.client.post(
+            "/api/v1/async/booking/",
+            {"user": str(self.user.id), "train": "not-a-uuid"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_async_booking_rejects_non_object_body(self):
+        for body in ("[1, 2]", '"train"', "null", "{"):
+            response = self.client.post(
+                "/api/v1/async/booking/", body, content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 400)
+
+
+class BookingBatcherTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.train = TrainFactory.create(
+            available_confirmed_berths=1, available_rac_spots=1, waiting_list_count=9
+        )
+
+    def test_batch_resolves_each_request_in_arrival_order(self):
+        """Test that one commit books a batch and each caller gets its own result"""
+        batch = [BookingRequest(UserFactory.create(), self.train) for _ in range(4)]
+        with self.assertNumQueries(7):
+            BookingBatcher().process(batch)
+
+        self.assertEqual(
+            [request.future.result().booking_status for request in batch[:3]],
+            [
+                BookingStatus.CONFIRMED.value,
+                BookingStatus.RAC.value,
+                BookingStatus.WAITING_LIST.value,
+            ],
+        )
+        with self.assertRaises(NoTicketsAvailable):
+            batch[3].future.result()
+
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.available_confirmed_berths, 0)
+        self.assertEqual(self.train.waiting_list_count, 10)
+        self.assertEqual(Booking.objects.filter(train=self.train).count(), 3)
+
+
+class BookingBatcherThreadTest(APITransactionTestCase):
+    """The worker threads book on their own connections, so rows must be committed"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.train = TrainFactory.create(
+            available_confirmed_berths=2, available_rac_spots=2, waiting_list_count=8
+        )
+        self.users = UserFactory.create_batch(8, age=30)
+
+    def test_batches_close_at_max_batch_or_max_wait(self):
+        """Test that the worker closes a batch when full or max_wait after it opened"""
+        batcher = BookingBatcher(max_batch=3, max_wait=0.2)
+        sizes = []
+        process = batcher.process
+        batcher.process = lambda batch: sizes.append(len(batch)) or process(batch)
+
+        start = monotonic()
+        futures = [batcher.submit(user, self.train) for user in self.users[:7]]
+        for future in futures[:6]:
+            future.result(timeout=5)
+        with self.assertRaises(NoTicketsAvailable):
+            futures[6].result(timeout=5)
+        self.assertEqual(sizes, [3, 3, 1])
+        # The last batch waited out max_wait for company
+        self.assertGreaterEqual(monotonic() - start, 0.2)
+
+    def test_arrival_order_across_threads(self):
+        """Test that concurrent callers are allocated in the order they queued"""
+        batcher = BookingBatcher(max_batch=50, max_wait=0.05)
+        order, futures, lock = [], {}, threading.Lock()
+
+        def submit(user):
+            with lock:
+                order.append(user.id)
+                futures[user.id] = batcher.submit(user, self.train)
+
+        threads = [threading.Thread(target=submit, args=(user,)) for user in self.users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        outcomes = []
+        for user_id in order:
+            try:
+                outcomes.append(futures[user_id].result(timeout=5).booking_status)
+            except NoTicketsAvailable:
+                outcomes.append(None)
+        self.assertEqual(
+            outcomes,
+            [BookingStatus.CONFIRMED.value] * 2
+            + [BookingStatus.RAC.value] * 2
+            + [BookingStatus.WAITING_LIST.value] * 2
+            + [None] * 2,
+        )
+
+    @override_settings(BOOKING_MODE="batched")
+    def test_batched_mode_books_through_the_queue(self):
+        with mock.patch.object(
+            booking.batcher, "submit", wraps=booking.batcher.submit
+        ) as submit:
+            response = self.client.post(
+                "/api/v1/async/booking/",
+                {"user": str(self.users[0].id), "train": str(self.train.id)},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            response.json()["booking_status"], BookingStatus.CONFIRMED.value
+        )
+        submit.assert_called_once()
+
+
+class SeatMapTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.train = TrainFactory.create()
+
+    def test_seat_map_layout(self):
+        """Test that every berth of the train gets a place in a coach"""
+        response = self.client.post(f"/api/v1/train/{self.train.id}/seatmap/")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["coaches"], ["S1", "S2"])
+
+        response = self.client.get(f"/api/v1/train/{self.train.id}/seatmap/S1/")
+        self.assertEqual(len(response.data["berths"]), 72)
+        self.assertEqual(
+            [berth["berth_type"] for berth in response.data["berths"][:8]],
+            ["LOWER", "MIDDLE", "UPPER", "LOWER", "MIDDLE", "UPPER"]
+            + ["SIDE_LOWER", "SIDE_UPPER"],
+        )
+
+    def test_bookings_get_berth_numbers(self):
+        """Test that confirmed bookings take the first free berth of their type"""
+        earlier = BookingService.create_booking(UserFactory.create(), self.train)
+        self.client.post(f"/api/v1/train/{self.train.id}/seatmap/")
+        earlier.refresh_from_db()
+        self.assertEqual((earlier.coach, earlier.berth_number), ("S1", 1))
+
+        booking = BookingService.create_booking(UserFactory.create(), self.train)
+        self.assertEqual((booking.coach, booking.berth_number), ("S1", 4))
+
+        BookingService.cancel_booking(earlier)
+        berths = self.client.get(f"/api/v1/train/{self.train.id}/seatmap/S1/").data[
+            "berths"
+        ]
+        self.assertFalse(berths[0]["occupied"])
+        self.assertTrue(berths[3]["occupied"])
+
+        booking = BookingService.create_booking(UserFactory.create(), self.train)
+        self.assertEqual((booking.coach, booking.berth_number), ("S1", 1))
+
+
+class MetricsTest(BaseAPITestCase):
+    def test_metrics_endpoint(self):
+        """Test that requests and bookings show up in the Prometheus output"""
+        BookingService.create_booking(UserFactory.create(), TrainFactory.create())
+        self.client.get("/api/v1/station/")
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn(
+            'http_requests_total{method="GET",route="/api/v1/station/",status="200"}',
+            body,
+        )
+        self.assertIn(
+            'http_request_queries_bucket{method="GET",route="/api/v1/station/",le="+Inf"}',
+            body,
+        )
+        self.assertIn(
+            'booking_operation_duration_seconds_count{operation="create_booking"}', body
+        )
+        self.assertIn('train_lock_wait_seconds_count{operation="create_booking"}', body)
+
+    def test_metrics_add_up_worker_processes(self):
+        """Test that /metrics sums the series every worker dumped to METRICS_DIR"""
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            METRICS_DIR=directory
+        ):
+            route = [["method", "GET"], ["route", "/api/v1/station/"], ["status", 200]]
+            with open(os.path.join(directory, "1.json"), "w") as sibling:
+                json.dump({"http_requests_total": [[route, 41]]}, sibling)
+
+            self.client.get("/api/v1/station/")
+            ours = REQUESTS.snapshot()[
+                (("method", "GET"), ("route", "/api/v1/station/"), ("status", 200))
+            ]
+            body = self.client.get("/metrics").content.decode()
+            self.assertIn(
+                'http_requests_total{method="GET",route="/api/v1/station/",status="200"} '
+                f"{ours + 41}\n",
+                body,
+            )
+            self.assertTrue(
+                os.path.exists(os.path.join(directory, f"{os.getpid()}.json"))
+            )
+
+
+class OptimisticBookingTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.train = TrainFactory.create()
+        self.client.post(f"/api/v1/train/{self.train.id}/seatmap/")
+
+    def test_no_overbooking_from_stale_train(self):
+        """Test that guarded updates never book past capacity, however stale the caller's train is"""
+        stale = self.train
+        bookings = [
+            BookingService.create_booking_optimistic(UserFactory.create(), stale)
+            for _ in range(63 + 18 + 10)
+        ]
+        with self.assertRaises(NoTicketsAvailable):
+            BookingService.create_booking_optimistic(UserFactory.create(), stale)
+
+        statuses = [booking.booking_status for booking in bookings]
+        self.assertEqual(statuses.count(BookingStatus.CONFIRMED.value), 63)
+        self.assertEqual(statuses.count(BookingStatus.RAC.value), 18)
+        self.assertEqual(statuses.count(BookingStatus.WAITING_LIST.value), 10)
+
+        seats = {
+            (booking.coach, booking.berth_number)
+            for booking in bookings
+            if booking.booking_status == BookingStatus.CONFIRMED.value
+        }
+        self.assertEqual(len(seats), 63)
+        self.assertNotIn((None, None), seats)
+
+        train = Train.objects.get(id=stale.id)
+        counters = BookingService.recount(train)
+        self.assertEqual(counters, {field: getattr(train, field) for field in counters})
+        self.assertEqual(train.available_confirmed_berths, 0)
+
+    def test_falls_through_to_next_berth_type(self):
+        """Test that a claim on an exhausted berth type moves on to the next one"""
+        Train.objects.filter(id=self.train.id).update(lower_berths_available=0)
+        booking = BookingService.create_booking_optimistic(
+            UserFactory.create(age=70), self.train
+        )
+        self.assertEqual(booking.berth_type, BerthType.MIDDLE.value)
+        self.assertEqual((booking.coach, booking.berth_number), ("S1", 2))
+
+    @override_settings(BOOKING_MODE="optimistic")
+    def test_booking_endpoint_in_optimistic_mode(self):
+        """Test that the mode switch sends whole-route bookings down the optimistic path"""
+        with mock.patch.object(
+            BookingService,
+            "create_booking_optimistic",
+            wraps=BookingService.create_booking_optimistic,
+        ) as optimistic:
+            response = self.client.post(
+                "/api/v1/async/booking/",
+                {"user": str(UserFactory.create().id), "train": str(self.train.id)},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 201)
+            optimistic.assert_called_once()
+
+            # Partial journeys need the train lock
+            stations = self.train.route.stations()
+            response = self.client.post(
+                "/api/v1/async/booking/",
+                {
+                    "user": str(UserFactory.create().id),
+                    "train": str(self.train.id),
+                    "boarding_station": stations[0],
+                    "alighting_station": stations[1],
+                },
+                format="json",
+            )
+            self.assertEqual(response.status_code, 201)
+            optimistic.assert_called_once()
+
+
+class IdempotencyKeyTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.train = TrainFactory.create()
+        self.users = [str(user.id) for user in UserFactory.create_batch(2)]
+
+    def book(self, key, users=None):
+        return self.client.post(
+            "/api/v1/booking/group/",
+            {"train": str(self.train.id), "users": users or self.users},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_saved_response(self):
+        """Test that a retried booking gets the first response back without booking again"""
+        first = self.book("retry-1")
+        self.assertEqual(first.status_code, 201)
+
+        with self.assertNumQueries(1):
+            retry = self.book("retry-1")
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Booking.objects.filter(train=self.train).count(), 2)
+
+        booking = first.json()[0]["id"]
+        for _ in range(2):
+            response = self.client.post(
+                f"/api/v1/booking/{booking}/cancel/", HTTP_IDEMPOTENCY_KEY="cancel-1"
+            )
+            self.assertEqual(response.status_code, 204)
+
+    def test_duplicate_in_progress_and_reused_key(self):
+        """Test that duplicates of a running request and reused keys are turned away"""
+        self.book("busy")
+        # Leave the key looking like its first request is still running
+        IdempotencyKey.objects.filter(key="busy").update(status_code=None)
+        self.assertEqual(self.book("busy").status_code, 409)
+
+        other = [str(UserFactory.create().id)]
+        self.assertEqual(self.book("busy", other).status_code, 422)
+        self.assertEqual(Booking.objects.filter(train=self.train).count(), 2)
+
+    def test_abandoned_key_is_reclaimed_after_its_lease(self):
+        """Test that a key whose request died only blocks retries for the lease"""
+        record, _ = idempotency.claim(
+            "lease", RequestFactory().post("/api/v1/booking/")
+        )
+        self.assertLessEqual(
+            record.expires_at,
+            timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_LEASE),
+        )
+
+        self.book("killed")
+        # As left by a worker killed mid-request: claimed, never saved
+        IdempotencyKey.objects.filter(key="killed").update(
+            status_code=None,
+            expires_at=timezone.now() + timedelta(seconds=60),
+        )
+        self.assertEqual(self.book("killed").status_code, 409)
+
+        IdempotencyKey.objects.filter(key="killed").update(expires_at=timezone.now())
+        self.assertEqual(self.book("killed").status_code, 201)
+        self.assertGreater(
+            IdempotencyKey.objects.get(key="killed").expires_at,
+            timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_LEASE),
+        )
+
+
+class ImportNetworkCommandTest(BaseAPITestCase):
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w") as output:
+            output.write(content)
+        return path
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def load(self, kind, path):
+        out, err = StringIO(), StringIO()
+        call_command(
+            "import_network", kind, path, "--batch-size", "2", stdout=out, stderr=err
+        )
+        return out.getvalue(), err.getvalue()
+
+    def test_import_network(self):
+        """Test that stations, routes and trains stream in, skipping invalid rows"""
+        StationFactory.create(station_code="NDLS", station_name="Old name")
+        out, _ = self.load(
+            "stations",
+            self.write(
+                "stations.csv",
+                "station_code,station_name\nNDLS,New Delhi\nAGC,Agra\nBPL,Bhopal\n",
+            ),
+        )
+        self.assertIn("Imported 2 new and 1 updated stations", out)
+        self.assertEqual(Station.objects.get(pk="NDLS").station_name, "New Delhi")
+
+        route_id = "7c9e6679-7425-40de-944b-e07fc1f90ae7"
+        routes = [
+            {
+                "id": route_id,
+                "source_station": "NDLS",
+                "destination_station": "BPL",
+                "distance": 700,
+                "intermediate_stations": ["AGC"],
+            },
+            {"source_station": "NDLS", "destination_station": "XXX", "distance": 5},
+        ]
+        out, err = self.load(
+            "routes",
+            self.write("routes.jsonl", "\n".join(json.dumps(row) for row in routes)),
+        )
+        self.assertIn("Imported 1 new and 0 updated routes, skipped 1", out)
+        self.assertIn("line 2: unknown station XXX", err)
+        self.assertEqual(
+            Route.objects.get(id=route_id).stations(), ["NDLS", "AGC", "BPL"]
+        )
+
+        out, _ = self.load(
+            "trains",
+            self.write(
+                "trains.csv",
+                "train_name,train_number,route,total_confirmed_berths\n"
+                f"Shatabdi,12002,{route_id},30\n"
+                "Lost,1,7c9e6679-7425-40de-944b-e07fc1f90ae8,30\n",
+            ),
+        )
+        self.assertIn("rows/s", out)
+        train = Train.objects.get(train_number="12002")
+        self.assertEqual(train.available_confirmed_berths, 30)
+        self.assertEqual(train.lower_berths_available, 10)
+        self.assertEqual(Coach.objects.filter(train=train).count(), 1)
+        self.assertFalse(Train.objects.filter(train_number="1").exists())
+
+    def test_import_repeated_ids(self):
+        """Test that a chunk repeating an id keeps the last row instead of failing"""
+        a, b = StationFactory.create_batch(2)
+        route_id = "7c9e6679-7425-40de-944b-e07fc1f90ae7"
+        out, _ = self.load(
+            "routes",
+            self.write(
+                "routes.csv",
+                "id,source_station,destination_station,distance\n"
+                f"{route_id},{a.station_code},{b.station_code},100\n"
+                f"{route_id},{a.station_code},{b.station_code},200\n",
+            ),
+        )
+        self.assertIn("Imported 1 new and 0 updated routes", out)
+        self.assertEqual(Route.objects.get(id=route_id).distance, 200)
+        self.assertEqual(RouteStop.objects.filter(route_id=route_id).count(), 2)
+
+        train_id = "7c9e6679-7425-40de-944b-e07fc1f90ae8"
+        out, _ = self.load(
+            "trains",
+            self.write(
+                "trains.csv",
+                "id,train_name,train_number,route\n"
+                f"{train_id},Old,1,{route_id}\n"
+                f"{train_id},New,1,{route_id}\n",
+            ),
+        )
+        self.assertIn("Imported 1 new and 0 updated trains", out)
+        self.assertEqual(Train.objects.get(id=train_id).train_name, "New")
+
+
+class TrainSearchTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c = StationFactory.create_batch(3)
+        self.through = TrainFactory.create(
+            route=RouteFactory.create(
+                source_station=self.a,
+                destination_station=self.c,
+                intermediate_stations=[self.b.station_code],
+            )
+        )
+        self.back = TrainFactory.create(
+            route=RouteFactory.create(source_station=self.c, destination_station=self.a)
+        )
+
+    def search(self, boarding, alighting):
+        return self.client.get(
+            "/api/v1/train/search/",
+            {"from": boarding.station_code, "to": alighting.station_code},
+        )
+
+    def test_search_between_stations(self):
+        """Test that only trains calling at both stations in order are found, with availability"""
+        BookingService.create_booking(UserFactory.create(), self.through)
+        with self.assertNumQueries(1):
+            response = self.search(self.b, self.c)
+        self.assertEqual(response.status_code, 200)
+        [result] = response.data["results"]
+        self.assertEqual(result["train"], self.through.id)
+        self.assertEqual(result["available_confirmed_berths"], 62)
+
+        self.assertEqual(
+            [result["train"] for result in self.search(self.c, self.a).data["results"]],
+            [self.back.id],
+        )
+        self.assertEqual(self.search(self.b, self.a).data["results"], [])
+        self.assertEqual(self.client.get("/api/v1/train/search/").status_code, 400)
+
+    def test_index_follows_route_changes(self):
+        """Test that changing a route's stops updates the search index"""
+        route = self.back.route
+        route.intermediate_stations = [self.b.station_code]
+        route.save()
+        self.assertEqual(len(self.search(self.b, self.a).data["results"]), 1)
+        self.assertEqual(len(self.search(self.a, self.b).data["results"]), 1)
+
+    def test_numeric_station_codes(self):
+        """Test that numeric codes in intermediate_stations match the text codes searched for"""
+        route = self.back.route
+        route.intermediate_stations = [5]
+        route.save()
+        response = self.client.get(
+            "/api/v1/train/search/", {"from": "5", "to": self.a.station_code}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result["train"] for result in response.data["results"]], [self.back.id]
+        )
+
+        # An index entry the route no longer backs skips the train instead of failing
+        Route.objects.filter(id=route.id).update(intermediate_stations=[])
+        response = self.client.get(
+            "/api/v1/train/search/", {"from": "5", "to": self.a.station_code}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"], [])
+
+
+class JourneyPlannerTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        invalidate_network()
+        self.a, self.b, self.c, self.d = StationFactory.create_batch(4)
+        # Two short hops a -> b -> c, or one long ride a -> d -> c
+        RouteFactory.create(
+            source_station=self.a, destination_station=self.b, distance=100
+        )
+        RouteFactory.create(
+            source_station=self.b, destination_station=self.c, distance=100
+        )
+        self.direct = RouteFactory.create(
+            source_station=self.a,
+            destination_station=self.c,
+            intermediate_stations=[self.d.station_code],
+            distance=900,
+        )
+        self.train = TrainFactory.create(route=self.direct)
+
+    def plan(self, origin, destination):
+        return self.client.get(
+            "/api/v1/journey/",
+            {"from": origin.station_code, "to": destination.station_code},
+        )
+
+    def test_fewest_changes_then_shortest(self):
+        """Test that a through train beats a shorter journey with a change"""
+        response = self.plan(self.a, self.c)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["changes"], 0)
+        self.assertEqual(response.data["distance"], 900)
+        self.assertEqual(response.data["legs"][0]["trains"][0]["id"], self.train.id)
+
+        # b -> d needs b -> c, which does not reach d, so no connection exists
+        self.assertEqual(self.plan(self.b, self.d).status_code, 404)
+
+        response = self.plan(self.d, self.c)
+        self.assertEqual(response.data["distance"], 450)
+
+    def test_memoized_until_routes_change(self):
+        """Test that repeated plans skip the graph and a route change is picked up"""
+        self.plan(self.a, self.c)
+        # Only the network version and the trains on the journey are read
+        with self.assertNumQueries(2):
+            self.assertEqual(self.plan(self.a, self.c).status_code, 200)
+        self.assertEqual(self.plan(self.c, self.a).status_code, 404)
+
+        # Nothing runs on a new route until a train is put on it
+        back = RouteFactory.create(
+            source_station=self.c, destination_station=self.a, distance=50
+        )
+        self.assertEqual(self.plan(self.c, self.a).status_code, 404)
+        train = TrainFactory.create(route=back)
+        response = self.plan(self.c, self.a)
+        self.assertEqual(response.data["distance"], 50)
+        self.assertEqual(response.data["legs"][0]["trains"][0]["id"], train.id)
+
+        # Bookings save the train without touching the network
+        version = network_version()
+        BookingService.create_booking(UserFactory.create(), train)
+        self.assertEqual(network_version(), version)
+
+
+class FareTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.short = TrainFactory.create(route=RouteFactory.create(distance=200))
+        self.long = TrainFactory.create(route=RouteFactory.create(distance=2500))
+
+    def test_booking_is_priced_by_fare_engine(self):
+        """Test that bookings pay by distance, berth and age"""
+        adult = BookingService.create_booking(UserFactory.create(age=30), self.short)
+        senior = BookingService.create_booking(UserFactory.create(age=70), self.short)
+        child = BookingService.create_booking(UserFactory.create(age=3), self.short)
+        # 350 for up to 250 km, lower berths cost 10% more, seniors pay 60%
+        self.assertEqual(adult.total_amount, Decimal("385"))
+        self.assertEqual(senior.total_amount, Decimal("231"))
+        self.assertEqual(child.total_amount, Decimal("0"))
+
+    def test_batch_quote(self):
+        """Test that one request quotes every passenger on every train"""
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                "/api/v1/fares/quote/",
+                {
+                    "trains": [str(self.short.id), str(self.long.id)],
+                    "ages": [30, 8],
+                    "berth_type": "UPPER",
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        short, long = response.data["quotes"]
+        self.assertEqual(short["fares"], [Decimal("350"), Decimal("175")])
+        # 1750 for 2000 km plus 0.80 per km beyond
+        self.assertEqual(long["fares"], [Decimal("2150"), Decimal("1075")])
+        self.assertEqual(long["total"], Decimal("3225"))
+
+    def test_no_berth_quotes_are_for_young_children(self):
+        """Test that NO_BERTH can't be used to quote an adult a free fare"""
+        response = self.client.post(
+            "/api/v1/fares/quote/",
+            {"trains": [str(self.short.id)], "ages": [30], "berth_type": "NO_BERTH"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("berth_type", response.data)
+
+        response = self.client.post(
+            "/api/v1/fares/quote/",
+            {"trains": [str(self.short.id)], "ages": [3], "berth_type": "NO_BERTH"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["quotes"][0]["fares"], [Decimal("0")])
+        self.assertEqual(fare(200, 30, berth_type=BerthType.NO_BERTH), Decimal("350"))
+
+
+class UserBookingsViewTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = UserFactory.create()
+        self.bookings = [
+            BookingService.create_booking(self.user, TrainFactory.create())
+            for _ in range(3)
+        ]
+        BookingService.create_booking(UserFactory.create(), TrainFactory.create())
+        self.url = f"/api/v1/user/{self.user.id}/bookings/"
+
+    def test_history_newest_first(self):
+        """Test that a user's bookings come newest first with their train, in two queries a page"""
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {"limit": 2})
+        self.assertEqual(response.status_code, 200)
+        first = response.data["results"]
+        self.assertEqual(
+            [booking["id"] for booking in first],
+            [str(self.bookings[2].id), str(self.bookings[1].id)],
+        )
+        self.assertEqual(first[0]["train_name"], self.bookings[2].train.train_name)
+        self.assertEqual(
+            first[0]["route_source"],
+            self.bookings[2].train.route.source_station.station_name,
+        )
+
+        rest = self.client.get(response.data["next"]).data
+        self.assertEqual(
+            [booking["id"] for booking in rest["results"]], [str(self.bookings[0].id)]
+        )
+        self.assertIsNone(rest["next"])
+
+    def test_unknown_user(self):
+        response = self.client.get(
+            f"/api/v1/user/{self.bookings[0].train.id}/bookings/"
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ValuesSerializerTest(BaseAPITestCase):
+    def test_matches_model_serializers(self):
+        """Test that .values() reads render exactly like the ModelSerializers they replace"""
+        booking = BookingService.create_booking(
+            UserFactory.create(name="Zoë\u2028"), TrainFactory.create()
+        )
+        cases = [
+            (UserSerializer, User.objects.all()),
+            (StationSerializer, Station.objects.all()),
+            (RouteSerializer, Route.objects.all()),
+            (TrainSerializer, Train.objects.all()),
+            (BookingSerializer, Booking.objects.all()),
+            (UserBookingSerializer, Booking.objects.all()),
+        ]
+        for serializer_class, queryset in cases:
+            with self.subTest(serializer_class.__name__):
+                reader = values_serializer(serializer_class)
+                expected = serializer_class(queryset.order_by("pk"), many=True).data
+                actual = reader.many(reader.values(queryset.order_by("pk")))
+                self.assertEqual(actual, expected)
+                self.assertEqual(
+                    FastJSONRenderer().render(actual), JSONRenderer().render(expected)
+                )
+        self.assertEqual(
+            FastJSONRenderer().render({"at": booking.booking_date}),
+            JSONRenderer().render({"at": booking.booking_date}),
+        )
+
+
+class TrainRunTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.train = TrainFactory.create(total_confirmed_berths=3, total_rac_berths=1)
+        self.today = date.today()
+        self.dates = [self.today + timedelta(days=1), self.today + timedelta(days=2)]
+        response = self.client.post(
+            f"/api/v1/train/{self.train.id}/runs/",
+            {"dates": [day.isoformat() for day in self.dates]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.run = TrainRun.objects.get(train=self.train, journey_date=self.dates[0])
+
+    def book(self, count):
+        return [
+            BookingService.create_run_booking(
+                UserFactory.create(), self.train, self.dates[0]
+            )
+            for _ in range(count)
+        ]
+
+    def test_runs_keep_their_own_counters(self):
+        """Test that bookings for a date only draw on that date's run"""
+        bookings = self.book(2)
+        self.assertTrue(all(booking.run_id == self.run.id for booking in bookings))
+
+        response = self.client.get(
+            f"/api/v1/train/{self.train.id}/availability/?date={self.dates[0]}"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["available_confirmed_berths"], 1)
+        response = self.client.get(
+            f"/api/v1/train/{self.train.id}/availability/?date={self.dates[1]}"
+        )
+        self.assertEqual(response.data["available_confirmed_berths"], 3)
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.available_confirmed_berths, 63)
+
+        response = self.client.get(f"/api/v1/train/{self.train.id}/runs/")
+        self.assertEqual(len(response.data["results"]), 2)
+        response = self.client.post(
+            "/api/v1/async/booking/",
+            {
+                "user": str(UserFactory.create().id),
+                "train": str(self.train.id),
+                "journey_date": self.today.isoformat(),
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["detail"], "Train does not run on this date.")
+
+    def test_run_cancellation_promotes_within_run(self):
+        """Test that a place freed on a run goes to that run's RAC passenger"""
+        confirmed = self.book(3)
+        rac = self.book(2)
+        waiting = self.book(1)
+        BookingService.cancel_booking(confirmed[0])
+        self.assertEqual(
+            list(BookingService.pending_promotions()), [(self.train.id, self.run.id)]
+        )
+        self.assertEqual(
+            BookingService.process_promotions(self.train.id, run_id=self.run.id), 1
+        )
+
+        self.assertEqual(
+            Booking.objects.get(id=rac[0].id).booking_status,
+            BookingStatus.CONFIRMED.value,
+        )
+        self.assertEqual(
+            Booking.objects.get(id=waiting[0].id).booking_status,
+            BookingStatus.RAC.value,
+        )
+        self.run.refresh_from_db()
+        counters = BookingService.recount(self.run)
+        for field, value in counters.items():
+            self.assertEqual(getattr(self.run, field), value, field)
+
+    def test_archive_runs(self):
+        """Test that finished runs and their bookings move to the archive tables"""
+        self.book(2)
+        out = StringIO()
+        call_command("archive_runs", "--before", self.dates[1].isoformat(), stdout=out)
+        self.assertIn("Archived 1 runs and 2 bookings", out.getvalue())
+        self.assertFalse(TrainRun.objects.filter(id=self.run.id).exists())
+        self.assertFalse(Booking.objects.filter(run_id=self.run.id).exists())
+        archived = ArchivedTrainRun.objects.get(id=self.run.id)
+        self.assertEqual(archived.available_confirmed_berths, 1)
+        self.assertEqual(ArchivedBooking.objects.filter(run_id=self.run.id).count(), 2)
+        self.assertTrue(
+            TrainRun.objects.filter(
+                train=self.train, journey_date=self.dates[1]
+            ).exists()
+        )
+
+
+class BookingEventTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        capacity = {"total_confirmed_berths": 3, "total_rac_berths": 1}
+        self.train = TrainFactory.create(
+            **capacity,
+            **BookingService.expected_counters(TrainFactory.build(**capacity), {}),
+        )
+        self.bookings = [
+            BookingService.create_booking(UserFactory.create(), self.train)
+            for _ in range(7)
+        ]
+        BookingService.create_booking(UserFactory.create(age=3), self.train)
+
+    def test_log_replays_counters(self):
+        """Test that every change is logged in sequence and replaying it rebuilds the counters"""
+        BookingService.cancel_booking(self.bookings[0])
+        BookingService.cancel_booking(self.bookings[6])
+        BookingService.process_promotions(self.train.id)
+
+        events = list(BookingEvent.objects.filter(train=self.train).order_by("id"))
+        self.assertEqual(
+            [event.sequence for event in events], list(range(1, len(events) + 1))
+        )
+        self.assertEqual(
+            [event.event_type for event in events[-3:]],
+            [
+                BookingEventType.PLACE_RELEASED.value,
+                BookingEventType.PROMOTED.value,
+                BookingEventType.PROMOTED.value,
+            ],
+        )
+        promoted = [
+            event.booking_id
+            for event in events
+            if event.event_type == BookingEventType.PROMOTED.value
+        ]
+        self.assertEqual(promoted, [self.bookings[3].id, self.bookings[5].id])
+
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.event_sequence, events[-1].sequence)
+        counters = replay_counters(self.train)
+        for field, value in counters.items():
+            self.assertEqual(getattr(self.train, field), value, field)
+
+    def test_projection_catches_up_from_checkpoint(self):
+        """Test that read models only apply events newer than their checkpoint"""
+        self.assertEqual(project(), 8)
+        self.assertEqual(project(), 0)
+        BookingService.cancel_booking(self.bookings[1])
+        self.assertEqual(project(), 1)
+
+        stats = BookingStats.objects.get(train=self.train, run_id=None)
+        self.assertEqual(stats.bookings, 8)
+        self.assertEqual(stats.cancellations, 1)
+        self.assertEqual(
+            stats.revenue,
+            sum(booking.total_amount for booking in self.bookings)
+            - self.bookings[1].total_amount,
+        )
+
+        Train.objects.filter(id=self.train.id).update(available_rac_spots=2)
+        out = StringIO()
+        call_command("project_events", "--check-counters", "--fix", stdout=out)
+        self.assertIn("Fixed 1 inventories out of step", out.getvalue())
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.available_rac_spots, 0)
+
+    def test_sequence_is_read_only(self):
+        """Test that clients can't set a train's event sequence"""
+        response = self.client.post(
+            "/api/v1/train/",
+            {
+                "train_name": "Sequence",
+                "train_number": "S1",
+                "route": self.train.route_id,
+                "event_sequence": 99,
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["event_sequence"], 0)
+        self.assertEqual(Train.objects.get(id=response.data["id"]).event_sequence, 0)
+
+
+class ReconcileCountersTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.trains = TrainFactory.create_batch(3)
+        for train in self.trains:
+            BookingService.create_booking(UserFactory.create(), train)
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command("reconcile_counters", *args, stdout=out)
+        return out.getvalue()
+
+    def test_reports_and_fixes_drift_since_last_run(self):
+        """Test that bookings made around the counters are found and fixed, and clean trains skipped"""
+        booking = BookingService.create_booking(UserFactory.create(), self.trains[1])
+        BookingService.cancel_booking(booking)
+        self.assertIn("Checked 3 inventories, 0 drifted", self.reconcile())
+
+        response = self.client.post(
+            "/api/v1/booking/",
+            {
+                "user": UserFactory.create().id,
+                "train": self.trains[0].id,
+                "booking_status": BookingStatus.CONFIRMED.value,
+                "berth_type": BerthType.LOWER.value,
+                "total_amount": "100.00",
+            },
+        )
+        self.assertEqual(response.status_code, 201)
+        out = self.reconcile("--fix")
+        self.assertIn("Checked 1 inventories, 1 drifted, 1 fixed", out)
+        self.assertIn("lower_berths_available 20 -> 19", out)
+        self.trains[0].refresh_from_db()
+        self.assertEqual(self.trains[0].available_confirmed_berths, 61)
+
+        self.reconcile()
+        self.assertIn("Checked 0 inventories", self.reconcile())
+
+    def test_fleet_check_uses_fixed_queries(self):
+        """Test that checking every train costs the same few aggregate queries"""
+        TrainFactory.create_batch(5)
+        # Last run, trains, their bookings, tasks and holds aggregates, runs
+        # (none here), then the run record
+        with self.assertNumQueries(7):
+            self.assertIn("Checked 8 inventories", self.reconcile("--all"))
+
+
+class SeatHoldTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.train = TrainFactory.create()
+        self.client.post(f"/api/v1/train/{self.train.id}/seatmap/")
+        self.user = UserFactory.create()
+
+    def hold(self, **data):
+        return self.client.post(
+            "/api/v1/hold/",
+            {"user": self.user.id, "train": self.train.id, **data},
+            format="json",
+        )
+
+    def test_hold_converts_into_booking_on_the_same_seat(self):
+        """Test that a hold takes its place off sale and becomes the booking"""
+        response = self.hold()
+        self.assertEqual(response.status_code, 201)
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.available_confirmed_berths, 62)
+
+        response = self.client.post(f"/api/v1/hold/{response.data['id']}/confirm/")
+        self.assertEqual(response.status_code, 201)
+        booking = Booking.objects.get(id=response.data["id"])
+        self.assertEqual(booking.booking_status, BookingStatus.CONFIRMED.value)
+        self.assertEqual(booking.berth_type, BerthType.LOWER.value)
+        self.assertEqual((booking.coach, booking.berth_number), ("S1", 1))
+        self.assertFalse(SeatHold.objects.exists())
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.available_confirmed_berths, 62)
+        self.assertEqual(replay_counters(self.train)["lower_berths_available"], 20)
+
+    def test_expired_holds_go_back_on_sale(self):
+        """Test that the scheduler releases due holds in one pass per train and skips live ones"""
+        scheduler = HoldExpiryScheduler()
+        for ttl in (1, 1, 1, 600):
+            self.assertEqual(self.hold(ttl=ttl).status_code, 201)
+
+        later = timezone.now() + timedelta(seconds=2)
+        self.assertEqual(scheduler.run_due(later), 3)
+        self.assertEqual(scheduler.run_due(later), 0)
+        self.assertEqual(SeatHold.objects.count(), 1)
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.available_confirmed_berths, 62)
+        self.assertEqual(self.train.lower_berths_available, 20)
+        self.assertEqual(
+            self.train.available_confirmed_berths,
+            BookingService.recount(self.train)["available_confirmed_berths"],
+        )
+
+        hold = SeatHold.objects.get()
+        SeatHold.objects.filter(id=hold.id).update(expires_at=timezone.now())
+        response = self.client.post(f"/api/v1/hold/{hold.id}/confirm/")
+        self.assertEqual(response.status_code, 410)
+
+
+class HoldExpirySchedulerThreadTest(APITransactionTestCase):
+    """The scheduler thread expires holds on its own connection, so rows must be committed"""
+
+    def test_running_scheduler_expires_holds_placed_after_start(self):
+        """Test that a started scheduler finds new holds through the expiry index"""
+        train = TrainFactory.create()
+        self.client.post(f"/api/v1/train/{train.id}/seatmap/")
+        scheduler = HoldExpiryScheduler(poll_interval=0.05)
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+
+        hold = BookingService.hold_seat(UserFactory.create(), train)
+        SeatHold.objects.filter(id=hold.id).update(expires_at=timezone.now())
+        deadline = monotonic() + 5
+        while SeatHold.objects.exists() and monotonic() < deadline:
+            sleep(0.05)
+        self.assertFalse(SeatHold.objects.exists())
+        train.refresh_from_db()
+        self.assertEqual(train.available_confirmed_berths, 63)
+
+
+@override_settings(DATABASE_REPLICAS={"replica1": 3, "replica2": 1})
+class ReadReplicaRoutingTest(BaseAPITestCase):
+    def read_alias(self, request):
+        """Database the router sends reads of request to outside a transaction"""
+        aliases = []
+
+        def view(request):
+            aliases.append(ReplicaRouter().db_for_read(Train))
+            return HttpResponse()
+
+        with mock.patch.object(connections["default"], "in_atomic_block", False):
+            replica_middleware(view)(request)
+        return aliases[0]
+
+    def test_replicas_are_picked_by_weight(self):
+        """Test that replicas are chosen in proportion to their weight"""
+        picks = [choose_replica() for _ in range(4000)]
+        self.assertAlmostEqual(picks.count("replica1") / len(picks), 0.75, delta=0.05)
+        self.assertEqual(set(picks), {"replica1", "replica2"})
+
+        with override_settings(DATABASE_REPLICAS={}):
+            self.assertIsNone(choose_replica())
+
+    def test_reads_go_to_replicas_and_writes_to_primary(self):
+        """Test that only reads outside transactions reach a replica"""
+        factory = RequestFactory()
+        self.assertIn(
+            self.read_alias(factory.get("/api/v1/train/")), ("replica1", "replica2")
+        )
+        self.assertEqual(self.read_alias(factory.post("/api/v1/booking/")), "default")
+        self.assertEqual(ReplicaRouter().db_for_write(Train), "default")
+        # Outside a request, e.g. in workers and management commands
+        self.assertEqual(ReplicaRouter().db_for_read(Train), "default")
+
+    def test_writers_read_their_writes_from_primary(self):
+        """Test that a client sticks to the primary for a while after a write"""
+        response = self.client.post(
+            "/api/v1/user/", {"name": "Asha", "age": 30, "gender": "Female"}
+        )
+        self.assertEqual(response.status_code, 201)
+        cookie = response.cookies[PRIMARY_UNTIL_COOKIE]
+        self.assertEqual(cookie["max-age"], 5)
+
+        request = RequestFactory().get("/api/v1/train/")
+        request.COOKIES[PRIMARY_UNTIL_COOKIE] = cookie.value
+        self.assertEqual(self.read_alias(request), "default")
+        request.COOKIES[PRIMARY_UNTIL_COOKIE] = str(time() - 1)
+        self.assertNotEqual(self.read_alias(request), "default")
+
+    def test_shared_caches_fill_from_primary(self):
+        """Test that snapshots and the route graph never come from a replica"""
+        train = TrainFactory.create()
+        with mock.patch.object(
+            connections["default"], "in_atomic_block", False
+        ), reading_from("replica1"):
+            # replica1 isn't configured, so any read routed to it would fail
+            self.assertIn(train.id, load_train_snapshots([train.id]))
+            self.assertIsNotNone(network_version())
+            self.assertIn(train.route_id, JourneyPlanner.load().routes)
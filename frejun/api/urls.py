@@ -1,16 +1,71 @@
 from django.urls import path
 from api.views import (
     UserView,
+    UserBookingsView,
     StationView,
     RouteView,
     TrainView,
+    TrainSearchView,
+    TrainDetailView,
+    TrainRunView,
+    TrainAvailabilityView,
+    SeatMapView,
+    CoachView,
+    JourneyView,
+    FareQuoteView,
     BookingView,
+    GroupBookingView,
+    SeatHoldView,
+    SeatHoldDetailView,
+    SeatHoldConfirmView,
+    BookingCancelView,
 )
+from api import async_views
 
 urlpatterns = [
     path("user/", UserView.as_view(), name="user"),
+    path("user/<uuid:pk>/bookings/", UserBookingsView.as_view(), name="user-bookings"),
     path("station/", StationView.as_view(), name="station"),
     path("route/", RouteView.as_view(), name="route"),
     path("train/", TrainView.as_view(), name="train"),
+    path("train/search/", TrainSearchView.as_view(), name="train-search"),
+    path("train/<uuid:pk>/", TrainDetailView.as_view(), name="train-detail"),
+    path("train/<uuid:pk>/runs/", TrainRunView.as_view(), name="train-runs"),
+    path(
+        "train/<uuid:pk>/availability/",
+        TrainAvailabilityView.as_view(),
+        name="train-availability",
+    ),
+    path("train/<uuid:pk>/seatmap/", SeatMapView.as_view(), name="seat-map"),
+    path(
+        "train/<uuid:pk>/seatmap/<str:coach_number>/",
+        CoachView.as_view(),
+        name="coach",
+    ),
+    path("journey/", JourneyView.as_view(), name="journey"),
+    path("fares/quote/", FareQuoteView.as_view(), name="fare-quote"),
     path("booking/", BookingView.as_view(), name="booking"),
-]
\ No newline at end of file
+    path("booking/group/", GroupBookingView.as_view(), name="group-booking"),
+    path("hold/", SeatHoldView.as_view(), name="seat-hold"),
+    path("hold/<uuid:pk>/", SeatHoldDetailView.as_view(), name="seat-hold-detail"),
+    path(
+        "hold/<uuid:pk>/confirm/",
+        SeatHoldConfirmView.as_view(),
+        name="seat-hold-confirm",
+    ),
+    path(
+        "booking/<uuid:pk>/cancel/", BookingCancelView.as_view(), name="cancel-booking"
+    ),
+    # Native async endpoints for ASGI workers
+    path(
+        "async/train/<uuid:pk>/availability/",
+        async_views.train_availability,
+        name="async-train-availability",
+    ),
+    path("async/booking/", async_views.create_booking, name="async-booking"),
+    path(
+        "async/booking/<uuid:pk>/cancel/",
+        async_views.cancel_booking,
+        name="async-cancel-booking",
+    ),
+]
@@ -1,21 +1,49 @@
-from rest_framework import status
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from rest_framework import serializers, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from api.models import User, Station, Route, Train, Booking
+from api.models import (
+    User,
+    Station,
+    Route,
+    Train,
+    TrainRun,
+    Booking,
+    SeatHold,
+    SegmentMap,
+    Coach,
+)
+from api.cache import get_snapshots
+from api.idempotency import idempotent
+from api.enum import BookingStatus, BerthType
+from api.fares import quote
+from api.pagination import list_response, next_link, paginate
+from api.planner import planner
+from api.seatmap import SeatMap, berths
+from api.search import trains_between
+from api.segments import InvalidJourney
+from api.services import BookingService, NoTicketsAvailable, COUNTER_FIELDS
 from api.serializer import (
     UserSerializer,
     StationSerializer,
     RouteSerializer,
     TrainSerializer,
+    TrainRunSerializer,
+    OpenRunsSerializer,
     BookingSerializer,
+    GroupBookingSerializer,
+    SeatHoldSerializer,
+    UserBookingSerializer,
+    FareQuoteSerializer,
+    values_serializer,
 )
 
 
 class UserView(APIView):
     def get(self, request):
-        users = User.objects.all()
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        return list_response(request, User.objects.all(), UserSerializer)
 
     def post(self, request):
         serializer = UserSerializer(data=request.data)
@@ -25,11 +53,28 @@ class UserView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class UserBookingsView(APIView):
+    def get(self, request, pk):
+        """A user's bookings, newest first, with their train and route"""
+        if not User.objects.filter(pk=pk).exists():
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        # Train, route and station columns are joined into the same query
+        return list_response(
+            request,
+            Booking.objects.filter(user_id=pk),
+            UserBookingSerializer,
+            ordering=("-booking_date", "-id"),
+        )
+
+
 class StationView(APIView):
     def get(self, request):
-        stations = Station.objects.all()
-        serializer = StationSerializer(stations, many=True)
-        return Response(serializer.data)
+        return list_response(
+            request,
+            Station.objects.all(),
+            StationSerializer,
+            ordering=("station_code",),
+        )
 
     def post(self, request):
         serializer = StationSerializer(data=request.data)
@@ -41,9 +86,7 @@ class StationView(APIView):
 
 class RouteView(APIView):
     def get(self, request):
-        routes = Route.objects.all()
-        serializer = RouteSerializer(routes, many=True)
-        return Response(serializer.data)
+        return list_response(request, Route.objects.all(), RouteSerializer)
 
     def post(self, request):
         serializer = RouteSerializer(data=request.data)
@@ -53,11 +96,32 @@ class RouteView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def load_train_snapshots(train_ids):
+    # Snapshots outlive the request and may be shared with other workers, so
+    # they're read from the primary rather than a replica that may lag behind
+    reader = values_serializer(TrainSerializer)
+    trains = Train.objects.using(DEFAULT_DB_ALIAS).filter(id__in=train_ids)
+    return {row["id"]: reader.to_representation(row) for row in reader.values(trains)}
+
+
 class TrainView(APIView):
     def get(self, request):
-        trains = Train.objects.all()
-        serializer = TrainSerializer(trains, many=True)
-        return Response(serializer.data)
+        if request.query_params.get("stream") in ("1", "true"):
+            return list_response(request, Train.objects.all(), TrainSerializer)
+
+        # Only ids and row versions come from the database, snapshots from the cache
+        rows, cursor = paginate(
+            request, Train.objects.values("created_at", "id", "updated_at")
+        )
+        return Response(
+            {
+                "next": next_link(request, cursor),
+                "results": get_snapshots(
+                    {row["id"]: row["updated_at"] for row in rows},
+                    load_train_snapshots,
+                ),
+            }
+        )
 
     def post(self, request):
         serializer = TrainSerializer(data=request.data)
@@ -67,15 +131,298 @@ class TrainView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class TrainSearchView(APIView):
+    def get(self, request):
+        """Trains running between the from and to stations with their availability"""
+        boarding = request.query_params.get("from")
+        alighting = request.query_params.get("to")
+        if not boarding or not alighting:
+            return Response(
+                {"detail": "from and to station codes are required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        trains, cursor = paginate(request, trains_between(boarding, alighting))
+        results = []
+        for train in trains:
+            try:
+                bitmaps = train.segment_map.bitmaps
+            except SegmentMap.DoesNotExist:
+                bitmaps = {}
+            try:
+                availability = BookingService.availability(
+                    train, bitmaps, boarding, alighting
+                )
+            except InvalidJourney:
+                # Routes changed by queryset updates skip the signal that reindexes them
+                continue
+            data = {"train_name": train.train_name, "train_number": train.train_number}
+            data.update(availability)
+            results.append(data)
+        return Response({"next": next_link(request, cursor), "results": results})
+
+
+class TrainDetailView(APIView):
+    def get(self, request, pk):
+        versions = dict(Train.objects.filter(pk=pk).values_list("id", "updated_at"))
+        snapshots = get_snapshots(versions, load_train_snapshots)
+        if not snapshots:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(snapshots[0])
+
+
+class TrainRunView(APIView):
+    def get(self, request, pk):
+        """Dates a train is on sale for, from today on, with their availability"""
+        return list_response(
+            request,
+            TrainRun.objects.filter(
+                train_id=pk, journey_date__gte=timezone.localdate()
+            ),
+            TrainRunSerializer,
+            ordering=("journey_date", "id"),
+        )
+
+    def post(self, request, pk):
+        """Put a train on sale for more journey dates"""
+        train = get_object_or_404(Train, pk=pk)
+        serializer = OpenRunsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        BookingService.open_runs(train, serializer.validated_data["dates"])
+        return Response(
+            {"train": train.id, "dates": serializer.data["dates"]},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class TrainAvailabilityView(APIView):
+    def get(self, request, pk):
+        """Berths free between the from and to stations, defaulting to the whole route.
+
+        With ?date= the counters of the train's run on that date are returned.
+        """
+        if "date" in request.query_params:
+            return self.run_availability(pk, request.query_params["date"])
+        train = get_object_or_404(Train.objects.select_related("route"), pk=pk)
+        bitmaps = (
+            SegmentMap.objects.filter(train=train)
+            .values_list("bitmaps", flat=True)
+            .first()
+        )
+        try:
+            data = BookingService.availability(
+                train,
+                bitmaps or {},
+                request.query_params.get("from"),
+                request.query_params.get("to"),
+            )
+        except InvalidJourney as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
+
+    def run_availability(self, pk, journey_date):
+        try:
+            journey_date = serializers.DateField().to_internal_value(journey_date)
+        except serializers.ValidationError as e:
+            return Response({"date": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+        data = (
+            TrainRun.objects.filter(train_id=pk, journey_date=journey_date)
+            .values("train_id", "journey_date", *COUNTER_FIELDS)
+            .first()
+        )
+        if data is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        data["train"] = data.pop("train_id")
+        return Response(data)
+
+
+class SeatMapView(APIView):
+    def get(self, request, pk):
+        """Coach numbers of a train's seat map"""
+        coaches = Coach.objects.filter(train_id=pk).values_list(
+            "coach_number", flat=True
+        )
+        return Response({"train": pk, "coaches": list(coaches)})
+
+    def post(self, request, pk):
+        """Build a seat map for a train created without one"""
+        train = get_object_or_404(Train, pk=pk)
+        if Coach.objects.filter(train=train).exists():
+            return Response(
+                {"detail": "Train already has a seat map."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        with transaction.atomic():
+            Train.objects.select_for_update().get(id=train.id)
+            coaches = SeatMap.build(train)
+        return Response(
+            {"train": train.id, "coaches": [coach.coach_number for coach in coaches]},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class CoachView(APIView):
+    def get(self, request, pk, coach_number):
+        """Every berth of one coach with its occupancy, in a single fetch"""
+        coach = get_object_or_404(Coach, train_id=pk, coach_number=coach_number)
+        return Response(
+            {"train": pk, "coach": coach.coach_number, "berths": berths(coach)}
+        )
+
+
+class JourneyView(APIView):
+    def get(self, request):
+        """Connection between two stations with the fewest changes, then shortest distance"""
+        origin = request.query_params.get("from")
+        destination = request.query_params.get("to")
+        if not origin or not destination or origin == destination:
+            return Response(
+                {"detail": "Two different from and to station codes are required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        journey = planner().plan(origin, destination)
+        if journey is None:
+            return Response(
+                {"detail": "No connection found."}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        trains = {}
+        for train in Train.objects.filter(
+            route_id__in=[route_id for route_id, *_ in journey]
+        ).values("id", "train_name", "train_number", "route_id"):
+            trains.setdefault(train.pop("route_id"), []).append(train)
+        legs = [
+            {
+                "route": route_id,
+                "from": boarding,
+                "to": alighting,
+                "distance": round(distance, 1),
+                "trains": trains.get(route_id, []),
+            }
+            for route_id, boarding, alighting, distance in journey
+        ]
+        return Response(
+            {
+                "from": origin,
+                "to": destination,
+                "changes": len(legs) - 1,
+                "distance": round(sum(leg["distance"] for leg in legs), 1),
+                "legs": legs,
+            }
+        )
+
+
+class FareQuoteView(APIView):
+    def post(self, request):
+        """Fares for every passenger age on every train, in one pass over the fare tables"""
+        serializer = FareQuoteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        berth_type = data.get("berth_type")
+
+        trains = data["trains"]
+        fares = quote(
+            [distance for _, distance in trains],
+            data["ages"],
+            BookingStatus(data["booking_status"]),
+            BerthType(berth_type) if berth_type else None,
+        )
+        return Response(
+            {
+                "booking_status": data["booking_status"],
+                "berth_type": berth_type,
+                "quotes": [
+                    {
+                        "train": train_id,
+                        "distance": distance,
+                        "fares": train_fares,
+                        "total": sum(train_fares),
+                    }
+                    for (train_id, distance), train_fares in zip(trains, fares)
+                ],
+            }
+        )
+
+
 class BookingView(APIView):
     def get(self, request):
-        bookings = Booking.objects.all()
-        serializer = BookingSerializer(bookings, many=True)
-        return Response(serializer.data)
+        return list_response(request, Booking.objects.all(), BookingSerializer)
 
+    @idempotent
     def post(self, request):
         serializer = BookingSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class GroupBookingView(APIView):
+    @idempotent
+    def post(self, request):
+        serializer = GroupBookingSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            bookings = BookingService.create_group_booking(
+                serializer.validated_data["users"], serializer.validated_data["train"]
+            )
+        except NoTicketsAvailable as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            BookingSerializer(bookings, many=True).data, status=status.HTTP_201_CREATED
+        )
+
+
+class SeatHoldView(APIView):
+    @idempotent
+    def post(self, request):
+        """Hold the place a user would be booked into while they pay"""
+        serializer = SeatHoldSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            hold = BookingService.hold_seat(
+                serializer.validated_data["user"],
+                serializer.validated_data["train"],
+                serializer.validated_data.get("ttl"),
+            )
+        except NoTicketsAvailable as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(SeatHoldSerializer(hold).data, status=status.HTTP_201_CREATED)
+
+
+class SeatHoldDetailView(APIView):
+    def delete(self, request, pk):
+        """Give up a hold before it expires"""
+        hold = get_object_or_404(SeatHold, pk=pk)
+        try:
+            BookingService.release_hold(hold)
+        except SeatHold.DoesNotExist:
+            pass
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class SeatHoldConfirmView(APIView):
+    @idempotent
+    def post(self, request, pk):
+        """Turn a hold into a booking, once payment has gone through"""
+        hold = get_object_or_404(SeatHold, pk=pk)
+        try:
+            booking = BookingService.convert_hold(hold)
+        except SeatHold.DoesNotExist:
+            return Response(
+                {"detail": "Hold has expired."}, status=status.HTTP_410_GONE
+            )
+        return Response(BookingSerializer(booking).data, status=status.HTTP_201_CREATED)
+
+
+class BookingCancelView(APIView):
+    @idempotent
+    def post(self, request, pk):
+        booking = get_object_or_404(Booking, pk=pk)
+        BookingService.cancel_booking(booking)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,9 +1,18 @@
 #!/bin/bash
 
+# Worker services pass a management command instead, e.g. process_promotions --loop
+if [ "$#" -gt 0 ]; then
+    exec uv run python frejun/manage.py "$@"
+fi
+
 # Apply database migrations
 echo "Applying database migrations..."
 python frejun/manage.py migrate
 
+# Workers add up each other's metrics through METRICS_DIR (api/metrics.py)
+export METRICS_DIR="${METRICS_DIR:-/tmp/frejun-metrics}"
+rm -rf "$METRICS_DIR" && mkdir -p "$METRICS_DIR"
+
 # Start Gunicorn
 echo "Starting Gunicorn..."
 exec uv run gunicorn frejun.wsgi:application --bind 0.0.0.0:8000 --workers 3 --timeout 120 
\ No newline at end of file
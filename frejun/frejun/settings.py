@@ -23,6 +23,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.metrics_middleware",
+    "api.middleware.replica_middleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -64,6 +66,58 @@ DATABASES = {
 }
 
 
+# Read replicas
+# GET, HEAD and OPTIONS requests read from a replica picked by its weight in
+# DATABASE_REPLICAS (api/routers.py), except for READ_YOUR_WRITES_WINDOW
+# seconds after the client last wrote. Writes and transactions use "default".
+# SQLITE_REPLICAS ("path:weight,...") adds SQLite files as local stand-ins.
+
+DATABASE_ROUTERS = ["api.routers.ReplicaRouter"]
+DATABASE_REPLICAS = {}
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", "5"))
+
+for index, replica in enumerate(
+    filter(None, os.getenv("SQLITE_REPLICAS", "").split(",")), start=1
+):
+    path, _, weight = replica.strip().rpartition(":")
+    if not weight.isdigit():
+        path, weight = replica.strip(), "1"
+    DATABASES[f"replica{index}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": path,
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS[f"replica{index}"] = int(weight)
+
+
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Train availability snapshots (api/cache.py) default to a per-process LRU
+# bounded by AVAILABILITY_CACHE_MAX_ENTRIES. They are keyed by the train row's
+# updated_at, so a per-process cache is never stale, only colder; point
+# AVAILABILITY_CACHE_BACKEND and AVAILABILITY_CACHE_LOCATION at a shared cache
+# such as Redis to share hits between workers.
+
+AVAILABILITY_CACHE_BACKEND = os.getenv(
+    "AVAILABILITY_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "availability": {
+        "BACKEND": AVAILABILITY_CACHE_BACKEND,
+        "LOCATION": os.getenv("AVAILABILITY_CACHE_LOCATION", "availability"),
+    },
+}
+
+if AVAILABILITY_CACHE_BACKEND.endswith("LocMemCache"):
+    CACHES["availability"]["OPTIONS"] = {
+        "MAX_ENTRIES": int(os.getenv("AVAILABILITY_CACHE_MAX_ENTRIES", "10000")),
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -104,3 +158,70 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Booking throughput
+# BOOKING_MODE picks how the booking endpoints allocate (api/booking.py):
+# "locking" under the train's row lock, "optimistic" with guarded UPDATEs, or
+# "batched" through a per-train queue with group commit (api/batching.py).
+# Partial journeys always use "locking". A batch closes at
+# BOOKING_BATCH_MAX_SIZE requests or BOOKING_BATCH_MAX_WAIT seconds after its
+# first request, whichever comes first.
+
+BOOKING_MODE = os.getenv("BOOKING_MODE", "locking")
+BOOKING_BATCH_MAX_SIZE = int(os.getenv("BOOKING_BATCH_MAX_SIZE", "50"))
+BOOKING_BATCH_MAX_WAIT = float(os.getenv("BOOKING_BATCH_MAX_WAIT", "0.005"))
+
+# POST /booking/group/ books at most GROUP_BOOKING_MAX_SIZE passengers at once.
+
+GROUP_BOOKING_MAX_SIZE = int(os.getenv("GROUP_BOOKING_MAX_SIZE", "6"))
+
+# Cancellations leave promotions to a worker draining the outbox
+# (api/promotions.py): PROMOTION_BATCH_SIZE tasks per train per transaction,
+# polling every PROMOTION_POLL_INTERVAL seconds.
+
+PROMOTION_BATCH_SIZE = int(os.getenv("PROMOTION_BATCH_SIZE", "100"))
+PROMOTION_POLL_INTERVAL = float(os.getenv("PROMOTION_POLL_INTERVAL", "0.5"))
+
+# Seat holds keep a place for SEAT_HOLD_TTL seconds unless a request asks for
+# less (at most SEAT_HOLD_MAX_TTL); api/holds.py releases them once expired,
+# looking for due holds every SEAT_HOLD_POLL_INTERVAL seconds.
+
+SEAT_HOLD_TTL = int(os.getenv("SEAT_HOLD_TTL", "600"))
+SEAT_HOLD_MAX_TTL = int(os.getenv("SEAT_HOLD_MAX_TTL", "1800"))
+SEAT_HOLD_POLL_INTERVAL = float(os.getenv("SEAT_HOLD_POLL_INTERVAL", "1"))
+
+
+# Metrics
+# With several worker processes, set METRICS_DIR to a directory they share
+# (cleared at startup): each dumps its metrics there at most every
+# METRICS_FLUSH_INTERVAL seconds and /metrics sums them (api/metrics.py).
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+
+
+# Rendering
+# Compact JSON through orjson when installed (api/renderers.py)
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+
+# Pagination
+# Default page size for keyset-paginated list endpoints (api/pagination.py)
+
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "100"))
+
+
+# Idempotency
+# Seconds a response saved under an Idempotency-Key is replayed, and seconds a
+# key stays claimed by a request that never finished: keep the lease above the
+# longest a request may run, e.g. gunicorn's --timeout (api/idempotency.py).
+
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+IDEMPOTENCY_KEY_LEASE = int(os.getenv("IDEMPOTENCY_KEY_LEASE", "120"))